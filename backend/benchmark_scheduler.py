@@ -0,0 +1,92 @@
+"""Turn latency under contention: first-come slots against the fair turn scheduler.
+
+A research tenant runs a few long collaborations that queue turns back to
+back while an interactive tenant's chats send one short turn at a time with
+think time in between. Turns hold a simulated LLM slot for a time that grows
+with their tokens, so no API keys are needed.
+
+- fifo: an asyncio.Semaphore, which grants slots in arrival order
+- fair: FairTurnScheduler with equal weights
+
+    python benchmark_scheduler.py --capacity 4 --research 6 --chats 20
+"""
+import time
+import random
+import asyncio
+import argparse
+from contextlib import asynccontextmanager
+from typing import List, Optional, Dict, Any
+
+import numpy as np
+
+from scheduler import FairTurnScheduler
+
+class FifoSlots:
+    def __init__(self, capacity: int):
+        self.semaphore = asyncio.Semaphore(capacity)
+
+    @asynccontextmanager
+    async def turn(self, conversation_id: str, tenant_id: Optional[str] = None, estimate: int = 500):
+        async with self.semaphore:
+            yield None
+
+async def simulate(slots, args) -> Dict[str, Any]:
+    waits: Dict[str, List[float]] = {"research": [], "interactive": []}
+    served: Dict[str, int] = {"research": 0, "interactive": 0}
+    rng = random.Random(args.seed)
+    deadline = time.monotonic() + args.duration
+
+    async def take_turn(tenant: str, conversation_id: str, tokens: int):
+        queued_at = time.monotonic()
+        async with slots.turn(conversation_id, tenant, tokens):
+            waits[tenant].append(time.monotonic() - queued_at)
+            await asyncio.sleep(tokens * args.seconds_per_token)
+        served[tenant] += tokens
+
+    async def research(index: int):
+        # Several agents of one collaboration queue their turns at once
+        while time.monotonic() < deadline:
+            await asyncio.gather(*(take_turn("research", f"research-{index}", rng.randint(1500, 3000)) for _ in range(4)))
+
+    async def chat(index: int):
+        while time.monotonic() < deadline:
+            await take_turn("interactive", f"chat-{index}", rng.randint(200, 400))
+            await asyncio.sleep(rng.uniform(0, 2 * args.think_time))
+
+    started = time.monotonic()
+    await asyncio.gather(*(research(index) for index in range(args.research)), *(chat(index) for index in range(args.chats)))
+    elapsed = time.monotonic() - started
+
+    # Jain's index over token throughput per tenant: 1.0 is an even split
+    throughput = np.array([served[tenant] / elapsed for tenant in waits])
+    result = {"jain": float(throughput.sum() ** 2 / (len(throughput) * (throughput ** 2).sum())), "tenants": {}}
+    for tenant, samples in waits.items():
+        samples = np.asarray(samples) * 1000
+        result["tenants"][tenant] = {
+            "turns": len(samples),
+            "p50_ms": float(np.percentile(samples, 50)) if len(samples) else 0.0,
+            "p95_ms": float(np.percentile(samples, 95)) if len(samples) else 0.0,
+            "tokens_per_second": served[tenant] / elapsed
+        }
+    return result
+
+async def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Compare turn wait times with and without fair scheduling")
+    parser.add_argument("--capacity", type=int, default=4, help="Concurrent LLM calls")
+    parser.add_argument("--research", type=int, default=6, help="Long collaborations of the research tenant")
+    parser.add_argument("--chats", type=int, default=20, help="Chats of the interactive tenant")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to keep generating load")
+    parser.add_argument("--think-time", type=float, default=0.2, help="Mean pause between a chat's turns")
+    parser.add_argument("--seconds-per-token", type=float, default=0.00005)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    print(f"{'scheduler':<9} {'tenant':<12} {'turns':>6} {'p50 wait ms':>12} {'p95 wait ms':>12} {'tokens/s':>10} {'jain':>6}")
+    for name, slots in (("fifo", FifoSlots(args.capacity)), ("fair", FairTurnScheduler(args.capacity))):
+        result = await simulate(slots, args)
+        for tenant, row in result["tenants"].items():
+            print(f"{name:<9} {tenant:<12} {row['turns']:>6} {row['p50_ms']:>12.1f} {row['p95_ms']:>12.1f} "
+                  f"{row['tokens_per_second']:>10,.0f} {result['jain']:>6.3f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""Comparative throughput of the storage backends on the two workloads the app generates.
+
+- streaming: many conversations at once, each message inserted as started,
+  checkpointed a few times while it streams, then finalized
+- polling: many clients paging through recent messages and re-reading the
+  conversation document, as /poll does
+
+    python benchmark_storage.py --backends memory,sqlite,mongo --conversations 50
+"""
+from dotenv import load_dotenv
+import os
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Any
+
+from storage import create_storage
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+async def streaming_workload(store, conversations: int, messages: int, checkpoints: int) -> Dict[str, Any]:
+    started = datetime.utcnow()
+    conversation_ids = [str(uuid.uuid4()) for _ in range(conversations)]
+    for conversation_id in conversation_ids:
+        await store.create_conversation({"id": conversation_id, "topic": "benchmark", "created_at": started, "status": "active"})
+
+    async def stream(conversation_id: str):
+        for index in range(messages):
+            message_id = str(uuid.uuid4())
+            await store.insert_message({
+                "id": message_id, "conversation_id": conversation_id, "content": "", "agent_type": "gpt_oss",
+                "is_user": False, "timestamp": started + timedelta(milliseconds=index), "streaming_status": "started"
+            })
+            for chunk in range(checkpoints):
+                await store.checkpoint_messages([(message_id, {"content": "token " * (chunk + 1), "streaming_status": "streaming"})])
+            await store.update_message(message_id, {"content": "token " * 50, "streaming_status": "complete", "token_count": 50})
+        await store.apply_conversation_metrics({conversation_id: {"messages": messages, "samples": 0, "response_time_sum": 0.0, "tokens": 50 * messages}})
+
+    begin = time.perf_counter()
+    await asyncio.gather(*(stream(conversation_id) for conversation_id in conversation_ids))
+    elapsed = time.perf_counter() - begin
+    operations = conversations * (messages * (checkpoints + 2) + 1)
+    return {"operations": operations, "seconds": elapsed, "ops_per_second": operations / elapsed, "conversation_ids": conversation_ids}
+
+async def polling_workload(store, conversation_ids: List[str], pollers: int, polls: int, page_size: int) -> Dict[str, Any]:
+    async def poll(worker: int):
+        conversation_id = conversation_ids[worker % len(conversation_ids)]
+        for _ in range(polls):
+            await store.get_conversation(conversation_id)
+            await store.recent_messages(conversation_id, page_size)
+
+    begin = time.perf_counter()
+    await asyncio.gather(*(poll(worker) for worker in range(pollers)))
+    elapsed = time.perf_counter() - begin
+    operations = pollers * polls * 2
+    return {"operations": operations, "seconds": elapsed, "ops_per_second": operations / elapsed}
+
+async def benchmark_backend(name: str, args, workdir: str) -> Optional[Dict[str, Any]]:
+    client = None
+    database = None
+    if name == "mongo":
+        if not os.environ.get("MONGO_URL"):
+            print("mongo: skipped (MONGO_URL not set)")
+            return None
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+        database = client[f"storage_benchmark_{uuid.uuid4().hex[:8]}"]
+    store = create_storage(name, database, os.path.join(workdir, "benchmark.db"))
+    await store.start()
+    try:
+        streaming = await streaming_workload(store, args.conversations, args.messages, args.checkpoints)
+        polling = await polling_workload(store, streaming.pop("conversation_ids"), args.pollers, args.polls, args.page_size)
+        return {"backend": name, "streaming": streaming, "polling": polling}
+    finally:
+        await store.close()
+        if client is not None:
+            await client.drop_database(database.name)
+            client.close()
+
+async def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Compare storage backend throughput")
+    parser.add_argument("--backends", default="memory,sqlite,mongo")
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=20, help="Messages streamed per conversation")
+    parser.add_argument("--checkpoints", type=int, default=5, help="Checkpoint writes per streamed message")
+    parser.add_argument("--pollers", type=int, default=50)
+    parser.add_argument("--polls", type=int, default=100, help="Polls per client")
+    parser.add_argument("--page-size", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [await benchmark_backend(name.strip(), args, workdir) for name in args.backends.split(",")]
+
+    print(f"{'backend':<8} {'streaming ops/s':>16} {'polling ops/s':>14}")
+    for result in filter(None, results):
+        print(f"{result['backend']:<8} {result['streaming']['ops_per_second']:>16,.0f} {result['polling']['ops_per_second']:>14,.0f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""Retrieval latency of the semantic memory at conversation sizes up to 100k messages.
+
+Builds a synthetic conversation, then times top-k queries against the
+in-memory tail and against the same rows memory-mapped back from disk.
+
+    python benchmark_vector_memory.py --messages 100000 --dim 256
+"""
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from vector_memory import HashingEmbedder, ConversationMemory
+
+VOCABULARY = [f"term{index}" for index in range(5000)]
+
+def synthetic_turn(rng: random.Random) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(15, 60)))
+
+def time_queries(memory: ConversationMemory, queries: np.ndarray, k: int) -> dict:
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        memory.search(query, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "max_ms": float(np.max(latencies))
+    }
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark semantic memory retrieval")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(7)
+    embedder = HashingEmbedder(args.dim)
+    texts = [synthetic_turn(rng) for _ in range(args.messages)]
+
+    started = time.perf_counter()
+    vectors = embedder.embed_many(texts)
+    embed_seconds = time.perf_counter() - started
+    queries = embedder.embed_many([synthetic_turn(rng) for _ in range(args.queries)])
+
+    with tempfile.TemporaryDirectory() as directory:
+        memory = ConversationMemory(args.dim)
+        for index, vector in enumerate(vectors):
+            memory.add(f"m{index}", texts[index][:80], vector)
+        in_memory = time_queries(memory, queries, args.k)
+
+        # Persist in bulk with the same append-only layout, then reload memory-mapped
+        path = Path(directory)
+        started = time.perf_counter()
+        vectors.astype(np.float32).tofile(path / "vectors.f32")
+        (path / "ids.txt").write_text("".join(f"m{index}\n" for index in range(args.messages)))
+        (path / "lines.jsonl").write_text("".join('"x"\n' for _ in range(args.messages)))
+        persist_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        mapped = ConversationMemory(args.dim, path)
+        load_seconds = time.perf_counter() - started
+        memory_mapped = time_queries(mapped, queries, args.k)
+
+    print(f"{args.messages} messages, dim {args.dim}, matrix {vectors.nbytes / 2**20:.1f} MiB")
+    print(f"embedding: {args.messages / embed_seconds:,.0f} messages/sec")
+    print(f"persist: {persist_seconds * 1000:.0f} ms, memory-mapped load: {load_seconds * 1000:.0f} ms")
+    for label, stats in (("in-memory", in_memory), ("memory-mapped", memory_mapped)):
+        print(f"top-{args.k} {label:<14} p50 {stats['p50_ms']:.2f} ms  p95 {stats['p95_ms']:.2f} ms  max {stats['max_ms']:.2f} ms")
+
+if __name__ == "__main__":
+    main()
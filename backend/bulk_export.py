@@ -0,0 +1,213 @@
+"""Bulk analytical export of conversations and messages to partitioned Parquet/Arrow files.
+
+Runs as its own process (CLI or spawned by the API) so the scan and the
+columnar encoding never share an event loop with request handling. Reads
+prefer secondaries when the deployment has them.
+
+    python bulk_export.py --output exports/2024-06 --format parquet
+"""
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference
+from bson import ObjectId
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime
+from typing import List, Optional, Dict, Any
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+DEFAULT_EXPORT_DIR = os.environ.get('BULK_EXPORT_DIR', str(ROOT_DIR / 'exports'))
+MANIFEST_NAME = "manifest.json"
+
+MESSAGE_COLUMNS = ["id", "conversation_id", "timestamp", "agent_type", "is_user", "content", "image_url",
+                   "streaming_status", "response_time", "token_count"]
+CONVERSATION_COLUMNS = ["id", "topic", "agents", "collaboration_mode", "status", "created_at", "completed_at",
+                        "current_round", "max_rounds"]
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("bulk_export")
+
+class BulkExporter:
+    """Scans a collection in _id order and writes one file per (date, partition) per batch.
+
+    Progress lives in manifest.json next to the data; a rerun against the same
+    output directory resumes after the last committed batch. Part files are
+    named by batch number; before the first batch of a run is written, every
+    file of that number is deleted, since rows added in the meantime can move
+    the rerun of an interrupted batch into other partitions.
+    """
+    def __init__(self, database, output_dir: str, file_format: str = "parquet", batch_size: int = 5000):
+        self.db = database
+        self.output_dir = Path(output_dir)
+        self.file_format = file_format
+        self.batch_size = batch_size
+        self.manifest_path = self.output_dir / MANIFEST_NAME
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        if self.manifest_path.exists():
+            manifest = json.loads(self.manifest_path.read_text())
+            if manifest.get("format") != self.file_format:
+                raise ValueError(f"{self.output_dir} holds a {manifest.get('format')} export; use another directory")
+            return manifest
+        return {
+            "format": self.file_format,
+            "state": "pending",
+            "started_at": datetime.utcnow().isoformat(),
+            "tables": {}
+        }
+
+    def _save_manifest(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        temp_path = self.manifest_path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(self.manifest, indent=2, default=str))
+        os.replace(temp_path, self.manifest_path)
+
+    def _write_partition(self, frame: pd.DataFrame, relative_dir: str, batch_number: int) -> Dict[str, Any]:
+        directory = self.output_dir / relative_dir
+        directory.mkdir(parents=True, exist_ok=True)
+        extension = "parquet" if self.file_format == "parquet" else "arrow"
+        path = directory / f"part-{batch_number:06d}.{extension}"
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self.file_format == "parquet":
+            pq.write_table(table, path, compression="zstd")
+        else:
+            feather.write_feather(table, path, compression="zstd")
+        return {"path": str(path.relative_to(self.output_dir)), "rows": len(frame)}
+
+    def _discard_batch(self, name: str, batch_number: int):
+        """Delete the part files an interrupted attempt at this batch left in any partition"""
+        for path in (self.output_dir / name).glob(f"**/part-{batch_number:06d}.*"):
+            path.unlink()
+
+    async def export_table(self, name: str, collection: str, columns: List[str], timestamp_column: str,
+                           partition_column: Optional[str] = None, prepare=None):
+        state = self.manifest["tables"].setdefault(name, {
+            "state": "pending", "rows": 0, "batches": 0, "last_id": None, "files": [], "elapsed_seconds": 0.0
+        })
+        if state["state"] == "completed":
+            logger.info(f"{name}: already exported ({state['rows']} rows), skipping")
+            return
+
+        state["state"] = "running"
+        projection = {column: 1 for column in columns}
+        started = time.time() - state["elapsed_seconds"]
+        # Batches past the last committed one were never recorded; only the next one can have left files
+        self._discard_batch(name, state["batches"])
+
+        while True:
+            query = {"_id": {"$gt": ObjectId(state["last_id"])}} if state["last_id"] else {}
+            batch = await self.db[collection].find(query, projection).sort("_id", 1).limit(self.batch_size).to_list(self.batch_size)
+            if not batch:
+                break
+
+            frame = pd.DataFrame(batch).reindex(columns=["_id", *columns])
+            last_id = str(frame["_id"].iloc[-1])
+            frame = frame.drop(columns=["_id"])
+            if prepare:
+                frame = prepare(frame)
+            # Legacy rows hold ISO strings, newer ones native datetimes
+            frame[timestamp_column] = pd.to_datetime(frame[timestamp_column], utc=True, errors="coerce", format="mixed").dt.tz_localize(None)
+            frame["date"] = frame[timestamp_column].dt.strftime("%Y-%m-%d").fillna("unknown")
+
+            group_columns = ["date", partition_column] if partition_column else ["date"]
+            for keys, partition in frame.groupby(group_columns, dropna=False):
+                keys = keys if isinstance(keys, tuple) else (keys,)
+                relative_dir = "/".join([name] + [f"{column}={value}" for column, value in zip(group_columns, keys)])
+                state["files"].append(self._write_partition(partition.drop(columns=group_columns), relative_dir, state["batches"]))
+
+            state["rows"] += len(frame)
+            state["batches"] += 1
+            state["last_id"] = last_id
+            state["elapsed_seconds"] = time.time() - started
+            state["rows_per_second"] = round(state["rows"] / max(state["elapsed_seconds"], 1e-9), 1)
+            self._save_manifest()
+            logger.info(f"{name}: {state['rows']} rows exported ({state['rows_per_second']} rows/sec)")
+
+        state["state"] = "completed"
+        self._save_manifest()
+
+    @staticmethod
+    def _prepare_messages(frame: pd.DataFrame) -> pd.DataFrame:
+        # Partition key: the agent, or user/system for non-agent messages
+        is_user = frame["is_user"].fillna(False).astype(bool)
+        frame["agent_type"] = frame["agent_type"].where(frame["agent_type"].notna(), "system")
+        frame.loc[is_user, "agent_type"] = "user"
+        frame["is_user"] = is_user
+        frame["response_time"] = pd.to_numeric(frame["response_time"], errors="coerce")
+        frame["token_count"] = pd.to_numeric(frame["token_count"], errors="coerce").astype("Int64")
+        return frame
+
+    @staticmethod
+    def _prepare_conversations(frame: pd.DataFrame) -> pd.DataFrame:
+        frame["agents"] = frame["agents"].apply(lambda agents: ",".join(agents) if isinstance(agents, list) else agents)
+        frame["completed_at"] = pd.to_datetime(frame["completed_at"], utc=True, errors="coerce", format="mixed").dt.tz_localize(None)
+        return frame
+
+    async def run(self) -> Dict[str, Any]:
+        self.manifest["state"] = "running"
+        self._save_manifest()
+        try:
+            await self.export_table("conversations", "conversations", CONVERSATION_COLUMNS, "created_at",
+                                    prepare=self._prepare_conversations)
+            await self.export_table("messages", "messages", MESSAGE_COLUMNS, "timestamp",
+                                    partition_column="agent_type", prepare=self._prepare_messages)
+        except Exception as e:
+            self.manifest["state"] = "error"
+            self.manifest["error"] = str(e)
+            self._save_manifest()
+            raise
+
+        total_rows = sum(table["rows"] for table in self.manifest["tables"].values())
+        total_seconds = sum(table["elapsed_seconds"] for table in self.manifest["tables"].values())
+        self.manifest.update({
+            "state": "completed",
+            "completed_at": datetime.utcnow().isoformat(),
+            "total_rows": total_rows,
+            "rows_per_second": round(total_rows / max(total_seconds, 1e-9), 1)
+        })
+        self._save_manifest()
+        logger.info(f"Bulk export finished: {total_rows} rows at {self.manifest['rows_per_second']} rows/sec into {self.output_dir}")
+        return self.manifest
+
+def read_manifest(output_dir: str) -> Optional[Dict[str, Any]]:
+    path = Path(output_dir) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+async def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Export conversations and messages to partitioned columnar files")
+    parser.add_argument("--output", default=DEFAULT_EXPORT_DIR, help="Output directory; rerunning against it resumes the export")
+    parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], read_preference=ReadPreference.SECONDARY_PREFERRED)
+    try:
+        exporter = BulkExporter(client[os.environ['DB_NAME']], args.output, args.format, args.batch_size)
+        await exporter.run()
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except Exception as e:
+        logger.error(f"Bulk export failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,66 @@
+"""Consensus scoring over agents' latest positions with embedding similarity.
+
+Positions are embedded with the same hashing embedder as semantic memory, so
+one round costs a single (n, dim) @ (dim, n) product. Raw cosine between
+lexical embeddings mostly measures topical overlap, so it is rescaled between
+a floor (unrelated turns) and a ceiling (near-restatements) before being
+compared with the collaboration's threshold. Scores inside the ambiguity
+margin below the threshold are left for a judge model to decide.
+"""
+from typing import Dict, Optional, Any
+import numpy as np
+
+from vector_memory import HashingEmbedder
+
+REACHED = "reached"
+NOT_REACHED = "not_reached"
+AMBIGUOUS = "ambiguous"
+
+class ConsensusEngine:
+    """Agreement score of one round of positions and the decision it implies"""
+    def __init__(self, embedder: HashingEmbedder, similarity_floor: float = 0.1, similarity_ceiling: float = 0.6,
+                 ambiguity_margin: float = 0.3):
+        self.embedder = embedder
+        self.similarity_floor = similarity_floor
+        self.similarity_ceiling = similarity_ceiling
+        self.ambiguity_margin = ambiguity_margin
+
+    def calibrate(self, similarity: np.ndarray) -> np.ndarray:
+        span = max(self.similarity_ceiling - self.similarity_floor, 1e-6)
+        return np.clip((similarity - self.similarity_floor) / span, 0.0, 1.0)
+
+    def score(self, positions: Dict[str, str], previous: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+        """Agreement of the given {agent: text} positions; None with fewer than two agents.
+
+        agreement is the mean calibrated pairwise similarity and weakest_pair
+        the lowest one; stability compares each agent with its own previous
+        position when one is given. representative is the agent closest to
+        all the others, whose position stands for the group.
+        """
+        agents = [agent for agent, text in positions.items() if text and text.strip()]
+        if len(agents) < 2:
+            return None
+        vectors = self.embedder.embed_many([positions[agent] for agent in agents])
+        similarity = vectors @ vectors.T
+        upper = np.triu_indices(len(agents), k=1)
+        pairwise = self.calibrate(similarity[upper])
+        result = {
+            "agents": agents,
+            "raw_similarity": float(similarity[upper].mean()),
+            "agreement": float(pairwise.mean()),
+            "weakest_pair": float(pairwise.min()),
+            "representative": agents[int(np.argmax(similarity.sum(axis=1)))],
+            "stability": None
+        }
+        shared = [index for index, agent in enumerate(agents) if previous and (previous.get(agent) or "").strip()]
+        if shared:
+            before = self.embedder.embed_many([previous[agents[index]] for index in shared])
+            result["stability"] = float(np.einsum("ij,ij->i", before, vectors[shared]).mean())
+        return result
+
+    def decide(self, agreement: float, threshold: float) -> str:
+        if agreement >= threshold:
+            return REACHED
+        if agreement < threshold - self.ambiguity_margin:
+            return NOT_REACHED
+        return AMBIGUOUS
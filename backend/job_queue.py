@@ -0,0 +1,385 @@
+"""Durable queue of long-running collaboration jobs with leases, heartbeats and checkpoints.
+
+A job moves queued -> running -> completed | failed, and can be paused
+(back to queued on resume) or cancelled on request. Claiming a job takes a
+lease for one worker; the worker renews it with heartbeats and records a
+checkpoint after every finished round. When a worker dies its lease expires
+and the next claim picks the job up again, checkpoint included, so the run
+resumes after the last completed round, unless that was its last allowed
+attempt: fail_exhausted() then marks it failed instead. Every write by a worker is guarded
+by its worker id, so a worker that lost its lease cannot overwrite the job.
+Pause and cancel requests for a running job are left in its control field,
+which the holding worker reads back with every heartbeat.
+
+- MongoJobQueue: durable, shared by every process using the same database
+- MemoryJobQueue: in-process only, for the non-Mongo backends and tests
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+import copy
+import uuid
+
+from pymongo import ReturnDocument
+
+JOB_STATUSES = ("queued", "running", "paused", "completed", "failed", "cancelled")
+JOB_ACTIONS = ("pause", "resume", "cancel")
+EXHAUSTED_LEASE_ERROR = "Lease expired on the last allowed attempt"
+
+def new_job(kind: str, conversation_id: str, payload: dict, max_attempts: int = 3) -> dict:
+    now = datetime.utcnow()
+    return {
+        "id": str(uuid.uuid4()),
+        "kind": kind,
+        "conversation_id": conversation_id,
+        "payload": payload,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "enqueued_at": now,
+        "available_at": now,
+        "worker_id": None,
+        "lease_expires_at": None,
+        "heartbeat_at": None,
+        "started_at": None,
+        "finished_at": None,
+        "checkpoint": None,
+        "checkpointed_at": None,
+        "control": None,
+        "viewer_seen_at": now,
+        "error": None
+    }
+
+class JobQueue(ABC):
+    """Queue interface shared by the Mongo and in-memory implementations"""
+    name = "base"
+
+    @abstractmethod
+    async def enqueue(self, job: dict) -> dict:
+        ...
+
+    @abstractmethod
+    async def claim(self, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        """Lease the oldest runnable job: a queued one, else one whose lease expired with attempts left"""
+
+    @abstractmethod
+    async def fail_exhausted(self) -> List[dict]:
+        """Fail the jobs whose lease expired on their last allowed attempt and return them"""
+
+    @abstractmethod
+    async def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        """Extend the lease and return the job's control and viewer_seen_at; None when the worker no longer holds it"""
+
+    @abstractmethod
+    async def checkpoint(self, job_id: str, worker_id: str, checkpoint: dict) -> bool:
+        ...
+
+    @abstractmethod
+    async def finish(self, job_id: str, worker_id: str, error: Optional[str] = None, retry_delay: float = 0.0) -> Optional[str]:
+        """Complete the job, or on error requeue it until max_attempts; returns the new status"""
+
+    @abstractmethod
+    async def release(self, job_id: str, worker_id: str) -> bool:
+        """Hand a job back to the queue (graceful shutdown) without counting the attempt"""
+
+    @abstractmethod
+    async def stop(self, job_id: str, worker_id: str, status: str) -> bool:
+        """Settle a running job as paused (resumable, attempt not counted) or cancelled"""
+
+    @abstractmethod
+    async def request_control(self, job_id: str, action: str) -> Optional[str]:
+        """Apply pause/resume/cancel: directly to a job no worker holds, as a control flag to a running one.
+
+        Returns the job's resulting status, or None when the action does not
+        apply to it (e.g. resuming a completed job).
+        """
+
+    @abstractmethod
+    async def touch_viewer(self, conversation_id: str):
+        """Record that someone is watching the conversation of an unfinished job"""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def latest_for_conversation(self, conversation_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, Any]:
+        """Jobs per status, queue depth and the lag of the oldest runnable job in seconds"""
+
+def _finish_fields(job: dict, error: Optional[str], retry_delay: float, now: datetime) -> dict:
+    if error is None:
+        return {"status": "completed", "finished_at": now, "worker_id": None, "lease_expires_at": None, "error": None}
+    if job["attempts"] < job["max_attempts"]:
+        return {"status": "queued", "available_at": now + timedelta(seconds=retry_delay), "worker_id": None,
+                "lease_expires_at": None, "error": error}
+    return {"status": "failed", "finished_at": now, "worker_id": None, "lease_expires_at": None, "error": error}
+
+def _exhausted_fields(now: datetime) -> dict:
+    return {"status": "failed", "finished_at": now, "worker_id": None, "lease_expires_at": None, "error": EXHAUSTED_LEASE_ERROR}
+
+def _stop_fields(job: dict, status: str, now: datetime) -> dict:
+    fields = {"status": status, "worker_id": None, "lease_expires_at": None, "control": None}
+    if status == "paused":
+        fields["attempts"] = max(job["attempts"] - 1, 0)
+    else:
+        fields["finished_at"] = now
+    return fields
+
+def _control_update(status: str, action: str, now: datetime) -> Optional[dict]:
+    """Fields that apply an action to a job in the given status, or None when it does not apply"""
+    if status == "running":
+        return {"control": None if action == "resume" else action}
+    if action == "cancel" and status in ("queued", "paused"):
+        return {"status": "cancelled", "finished_at": now, "control": None}
+    if action == "pause" and status == "queued":
+        return {"status": "paused", "control": None}
+    if action == "resume" and status == "paused":
+        # Restart the idle clock so a resumed job is not paused again straight away
+        return {"status": "queued", "available_at": now, "viewer_seen_at": now, "control": None}
+    if action == "pause" and status == "paused" or action == "resume" and status == "queued":
+        return {}
+    return None
+
+def _release_fields(job: dict) -> dict:
+    # available_at is kept, so a released job goes back to its original place in line
+    return {"status": "queued", "worker_id": None, "lease_expires_at": None, "attempts": max(job["attempts"] - 1, 0)}
+
+class MongoJobQueue(JobQueue):
+    name = "mongo"
+
+    def __init__(self, collection):
+        self.jobs = collection
+
+    async def enqueue(self, job: dict) -> dict:
+        await self.jobs.insert_one(dict(job))
+        return job
+
+    async def claim(self, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        now = datetime.utcnow()
+        lease = {"$set": {"status": "running", "worker_id": worker_id, "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                          "heartbeat_at": now, "started_at": now}, "$inc": {"attempts": 1}}
+        # Two single-range claims instead of one $or so each is served by its own index
+        for query, sort in (
+            ({"status": "queued", "available_at": {"$lte": now}}, [("available_at", 1)]),
+            ({"status": "running", "lease_expires_at": {"$lt": now}, "$expr": {"$lt": ["$attempts", "$max_attempts"]}},
+             [("lease_expires_at", 1)])
+        ):
+            job = await self.jobs.find_one_and_update(query, lease, sort=sort, projection={"_id": 0},
+                                                      return_document=ReturnDocument.AFTER)
+            if job:
+                return job
+        return None
+
+    async def fail_exhausted(self) -> List[dict]:
+        now = datetime.utcnow()
+        failed = []
+        # One job per update so each is returned exactly once, even with several workers sweeping
+        while True:
+            fields = _exhausted_fields(now)
+            job = await self.jobs.find_one_and_update(
+                {"status": "running", "lease_expires_at": {"$lt": now}, "$expr": {"$gte": ["$attempts", "$max_attempts"]}},
+                {"$set": fields}, projection={"_id": 0}
+            )
+            if not job:
+                return failed
+            failed.append({**job, **fields})
+
+    async def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self.jobs.find_one_and_update(
+            {"id": job_id, "worker_id": worker_id, "status": "running"},
+            {"$set": {"lease_expires_at": now + timedelta(seconds=lease_seconds), "heartbeat_at": now}},
+            projection={"_id": 0, "control": 1, "viewer_seen_at": 1}
+        )
+
+    async def checkpoint(self, job_id: str, worker_id: str, checkpoint: dict) -> bool:
+        result = await self.jobs.update_one(
+            {"id": job_id, "worker_id": worker_id, "status": "running"},
+            {"$set": {"checkpoint": checkpoint, "checkpointed_at": datetime.utcnow()}}
+        )
+        return result.matched_count == 1
+
+    async def finish(self, job_id: str, worker_id: str, error: Optional[str] = None, retry_delay: float = 0.0) -> Optional[str]:
+        job = await self.jobs.find_one({"id": job_id, "worker_id": worker_id, "status": "running"}, {"_id": 0})
+        if not job:
+            return None
+        fields = _finish_fields(job, error, retry_delay, datetime.utcnow())
+        result = await self.jobs.update_one({"id": job_id, "worker_id": worker_id, "status": "running"}, {"$set": fields})
+        return fields["status"] if result.matched_count else None
+
+    async def release(self, job_id: str, worker_id: str) -> bool:
+        job = await self.jobs.find_one({"id": job_id, "worker_id": worker_id, "status": "running"}, {"_id": 0})
+        if not job:
+            return False
+        result = await self.jobs.update_one({"id": job_id, "worker_id": worker_id, "status": "running"},
+                                            {"$set": _release_fields(job)})
+        return result.matched_count == 1
+
+    async def stop(self, job_id: str, worker_id: str, status: str) -> bool:
+        job = await self.jobs.find_one({"id": job_id, "worker_id": worker_id, "status": "running"}, {"_id": 0})
+        if not job:
+            return False
+        result = await self.jobs.update_one({"id": job_id, "worker_id": worker_id, "status": "running"},
+                                            {"$set": _stop_fields(job, status, datetime.utcnow())})
+        return result.matched_count == 1
+
+    async def request_control(self, job_id: str, action: str) -> Optional[str]:
+        # Retried when the job changes status between the read and the conditional write
+        for _ in range(3):
+            job = await self.jobs.find_one({"id": job_id}, {"_id": 0, "status": 1})
+            if not job:
+                return None
+            fields = _control_update(job["status"], action, datetime.utcnow())
+            if fields is None:
+                return None
+            if not fields:
+                return job["status"]
+            result = await self.jobs.update_one({"id": job_id, "status": job["status"]}, {"$set": fields})
+            if result.matched_count:
+                return fields.get("status", job["status"])
+        return None
+
+    async def touch_viewer(self, conversation_id: str):
+        await self.jobs.update_many(
+            {"conversation_id": conversation_id, "status": {"$in": ["queued", "running"]}},
+            {"$set": {"viewer_seen_at": datetime.utcnow()}}
+        )
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.jobs.find_one({"id": job_id}, {"_id": 0})
+
+    async def latest_for_conversation(self, conversation_id: str) -> Optional[dict]:
+        jobs = await self.jobs.find({"conversation_id": conversation_id}, {"_id": 0}).sort("enqueued_at", -1).limit(1).to_list(1)
+        return jobs[0] if jobs else None
+
+    async def stats(self) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        counts = {status: 0 for status in JOB_STATUSES}
+        async for row in self.jobs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        oldest = await self.jobs.find({"status": "queued", "available_at": {"$lte": now}}, {"available_at": 1}) \
+            .sort("available_at", 1).limit(1).to_list(1)
+        expired = await self.jobs.count_documents({"status": "running", "lease_expires_at": {"$lt": now}})
+        return {
+            "jobs": counts,
+            "depth": counts["queued"],
+            "expired_leases": expired,
+            "lag_seconds": (now - oldest[0]["available_at"]).total_seconds() if oldest else 0.0
+        }
+
+class MemoryJobQueue(JobQueue):
+    name = "memory"
+
+    def __init__(self):
+        self.jobs: Dict[str, dict] = {}
+
+    def _held(self, job_id: str, worker_id: str) -> Optional[dict]:
+        job = self.jobs.get(job_id)
+        if job and job["worker_id"] == worker_id and job["status"] == "running":
+            return job
+        return None
+
+    async def enqueue(self, job: dict) -> dict:
+        self.jobs[job["id"]] = copy.deepcopy(job)
+        return job
+
+    async def claim(self, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        now = datetime.utcnow()
+        queued = [job for job in self.jobs.values() if job["status"] == "queued" and job["available_at"] <= now]
+        expired = [job for job in self.jobs.values()
+                   if job["status"] == "running" and job["lease_expires_at"] < now and job["attempts"] < job["max_attempts"]]
+        candidates = sorted(queued, key=lambda job: job["available_at"]) or sorted(expired, key=lambda job: job["lease_expires_at"])
+        if not candidates:
+            return None
+        job = candidates[0]
+        job.update({"status": "running", "worker_id": worker_id, "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                    "heartbeat_at": now, "started_at": now, "attempts": job["attempts"] + 1})
+        return copy.deepcopy(job)
+
+    async def fail_exhausted(self) -> List[dict]:
+        now = datetime.utcnow()
+        failed = []
+        for job in self.jobs.values():
+            if job["status"] == "running" and job["lease_expires_at"] < now and job["attempts"] >= job["max_attempts"]:
+                job.update(_exhausted_fields(now))
+                failed.append(copy.deepcopy(job))
+        return failed
+
+    async def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        job = self._held(job_id, worker_id)
+        if not job:
+            return None
+        now = datetime.utcnow()
+        job.update({"lease_expires_at": now + timedelta(seconds=lease_seconds), "heartbeat_at": now})
+        return {"control": job["control"], "viewer_seen_at": job["viewer_seen_at"]}
+
+    async def checkpoint(self, job_id: str, worker_id: str, checkpoint: dict) -> bool:
+        job = self._held(job_id, worker_id)
+        if job:
+            job.update({"checkpoint": copy.deepcopy(checkpoint), "checkpointed_at": datetime.utcnow()})
+        return job is not None
+
+    async def finish(self, job_id: str, worker_id: str, error: Optional[str] = None, retry_delay: float = 0.0) -> Optional[str]:
+        job = self._held(job_id, worker_id)
+        if not job:
+            return None
+        job.update(_finish_fields(job, error, retry_delay, datetime.utcnow()))
+        return job["status"]
+
+    async def release(self, job_id: str, worker_id: str) -> bool:
+        job = self._held(job_id, worker_id)
+        if job:
+            job.update(_release_fields(job))
+        return job is not None
+
+    async def stop(self, job_id: str, worker_id: str, status: str) -> bool:
+        job = self._held(job_id, worker_id)
+        if job:
+            job.update(_stop_fields(job, status, datetime.utcnow()))
+        return job is not None
+
+    async def request_control(self, job_id: str, action: str) -> Optional[str]:
+        job = self.jobs.get(job_id)
+        if not job:
+            return None
+        fields = _control_update(job["status"], action, datetime.utcnow())
+        if fields is None:
+            return None
+        job.update(fields)
+        return job["status"]
+
+    async def touch_viewer(self, conversation_id: str):
+        now = datetime.utcnow()
+        for job in self.jobs.values():
+            if job["conversation_id"] == conversation_id and job["status"] in ("queued", "running"):
+                job["viewer_seen_at"] = now
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = self.jobs.get(job_id)
+        return copy.deepcopy(job) if job else None
+
+    async def latest_for_conversation(self, conversation_id: str) -> Optional[dict]:
+        jobs = [job for job in self.jobs.values() if job["conversation_id"] == conversation_id]
+        return copy.deepcopy(max(jobs, key=lambda job: job["enqueued_at"])) if jobs else None
+
+    async def stats(self) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        counts = {status: 0 for status in JOB_STATUSES}
+        for job in self.jobs.values():
+            counts[job["status"]] += 1
+        runnable = [job["available_at"] for job in self.jobs.values() if job["status"] == "queued" and job["available_at"] <= now]
+        return {
+            "jobs": counts,
+            "depth": counts["queued"],
+            "expired_leases": sum(1 for job in self.jobs.values() if job["status"] == "running" and job["lease_expires_at"] < now),
+            "lag_seconds": (now - min(runnable)).total_seconds() if runnable else 0.0
+        }
+
+def create_job_queue(backend: str, database=None) -> JobQueue:
+    if backend == "mongo":
+        return MongoJobQueue(database["collaboration_jobs"])
+    return MemoryJobQueue()
@@ -0,0 +1,264 @@
+"""Weighted fair scheduling of agent turns across tenants and conversations.
+
+Every LLM-backed agent turn asks for a slot before calling out. With all
+slots busy, requests queue and each freed slot goes to the tenant with the
+least weighted service so far (tokens served / weight). Within that tenant it
+goes to the conversation with the least service, oldest request first. A
+flow that was idle restarts at the current minimum of the active flows
+instead of cashing in credit, as in virtual-time fair queueing. Service is
+charged with an estimate when a turn starts and corrected with the real token
+count when it ends.
+
+Tenants may carry quotas: a token bucket refilled at tokens_per_minute and a
+cap on concurrent turns. A tenant over quota is skipped until it is eligible
+again, so it never blocks the others.
+
+Tenants are identified by the caller, never by the request body: each
+configured tenant lists the API keys that act for it, and any other caller
+runs under the default tenant. State of idle tenants is kept for the
+report up to max_idle_tenants, oldest evicted first; an evicted tenant
+that comes back simply rejoins at the level of the busy ones.
+"""
+from collections import deque, OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Any, List
+import asyncio
+import itertools
+import time
+
+import numpy as np
+
+DEFAULT_TENANT = "default"
+
+class TenantPolicy:
+    __slots__ = ("weight", "tokens_per_minute", "max_concurrent")
+
+    def __init__(self, weight: float = 1.0, tokens_per_minute: float = 0, max_concurrent: int = 0):
+        self.weight = max(float(weight), 1e-6)
+        self.tokens_per_minute = float(tokens_per_minute)  # 0 means unlimited
+        self.max_concurrent = int(max_concurrent)  # 0 means unlimited
+
+class TurnTicket:
+    """A queued or running turn; set `tokens` to the real usage before the turn ends"""
+    __slots__ = ("tenant_id", "conversation_id", "estimate", "tokens", "sequence", "enqueued_at", "started_at", "granted")
+
+    def __init__(self, tenant_id: str, conversation_id: str, estimate: int, sequence: int):
+        self.tenant_id = tenant_id
+        self.conversation_id = conversation_id
+        self.estimate = estimate
+        self.tokens: Optional[int] = None
+        self.sequence = sequence
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.granted = asyncio.get_running_loop().create_future()
+
+class TenantState:
+    def __init__(self, policy: TenantPolicy, now: float):
+        self.policy = policy
+        self.service = 0.0
+        self.running = 0
+        self.bucket = policy.tokens_per_minute
+        self.refilled_at = now
+        self.conversation_service: Dict[str, float] = {}
+        self.pending: Dict[str, deque] = {}
+        self.waits: deque = deque(maxlen=1000)
+        self.stats = {"turns": 0, "tokens": 0, "queued_turns": 0, "quota_delays": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+    def refill(self, now: float):
+        if self.policy.tokens_per_minute:
+            rate = self.policy.tokens_per_minute / 60
+            self.bucket = min(self.policy.tokens_per_minute, self.bucket + (now - self.refilled_at) * rate)
+        self.refilled_at = now
+
+    def quota_ready_in(self, cost: int, now: float) -> float:
+        """Seconds until the tenant may start a turn of this cost (0 when it may now)"""
+        if self.policy.max_concurrent and self.running >= self.policy.max_concurrent:
+            return float("inf")  # a finishing turn frees the slot, not the clock
+        if not self.policy.tokens_per_minute:
+            return 0.0
+        self.refill(now)
+        # Turns larger than the whole bucket only wait for a full bucket
+        needed = min(cost, self.policy.tokens_per_minute) - self.bucket
+        return 0.0 if needed <= 0 else needed / (self.policy.tokens_per_minute / 60)
+
+class FairTurnScheduler:
+    def __init__(self, capacity: int, policies: Optional[Dict[str, TenantPolicy]] = None,
+                 default_policy: Optional[TenantPolicy] = None, max_idle_tenants: int = 1000):
+        self.capacity = capacity
+        self.policies = dict(policies or {})
+        self.default_policy = default_policy or TenantPolicy()
+        self.max_idle_tenants = max_idle_tenants
+        self.tenants: Dict[str, TenantState] = {}
+        self.idle: "OrderedDict[str, None]" = OrderedDict()
+        self.running = 0
+        self.sequence = itertools.count()
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {"turns": 0, "queued_turns": 0, "cancelled_waits": 0}
+
+    def tenant(self, tenant_id: str) -> TenantState:
+        state = self.tenants.get(tenant_id)
+        if state is None:
+            state = self.tenants[tenant_id] = TenantState(self.policies.get(tenant_id, self.default_policy), time.monotonic())
+        return state
+
+    def queued(self) -> int:
+        return sum(len(queue) for state in self.tenants.values() for queue in state.pending.values())
+
+    @staticmethod
+    def _floor(services: List[float]) -> float:
+        return min(services) if services else 0.0
+
+    def _enqueue(self, ticket: TurnTicket):
+        state = self.tenant(ticket.tenant_id)
+        self.idle.pop(ticket.tenant_id, None)
+        if not state.pending and not state.running:
+            # An idle tenant rejoins at the level of the busy ones rather than with banked credit
+            busy = [other.service for other in self.tenants.values() if other is not state and (other.pending or other.running)]
+            state.service = max(state.service, self._floor(busy))
+        if ticket.conversation_id not in state.pending:
+            active = [state.conversation_service[cid] for cid in state.pending]
+            state.conversation_service[ticket.conversation_id] = max(
+                state.conversation_service.get(ticket.conversation_id, 0.0), self._floor(active)
+            )
+            state.pending[ticket.conversation_id] = deque()
+        state.pending[ticket.conversation_id].append(ticket)
+
+    def _start(self, ticket: TurnTicket, state: TenantState, now: float):
+        queue = state.pending[ticket.conversation_id]
+        queue.popleft()
+        if not queue:
+            del state.pending[ticket.conversation_id]
+        state.running += 1
+        self.running += 1
+        state.service += ticket.estimate / state.policy.weight
+        state.conversation_service[ticket.conversation_id] = state.conversation_service.get(ticket.conversation_id, 0.0) + ticket.estimate
+        if state.policy.tokens_per_minute:
+            state.bucket -= ticket.estimate
+        ticket.started_at = now
+        wait = now - ticket.enqueued_at
+        state.waits.append(wait)
+        state.stats["wait_seconds_total"] += wait
+        state.stats["wait_seconds_max"] = max(state.stats["wait_seconds_max"], wait)
+        ticket.granted.set_result(None)
+
+    def _dispatch(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        now = time.monotonic()
+        while self.running < self.capacity:
+            best, earliest = None, float("inf")
+            for state in self.tenants.values():
+                if not state.pending:
+                    continue
+                conversation_id = min(state.pending, key=lambda cid: (state.conversation_service[cid], state.pending[cid][0].sequence))
+                head = state.pending[conversation_id][0]
+                ready_in = state.quota_ready_in(head.estimate, now)
+                if ready_in > 0:
+                    earliest = min(earliest, ready_in)
+                    continue
+                if best is None or (state.service, head.sequence) < (best[0].service, best[1].sequence):
+                    best = (state, head)
+            if best is None:
+                if earliest != float("inf"):
+                    # Only token buckets hold work back; come back when the first one has refilled enough
+                    self.timer = asyncio.get_running_loop().call_later(earliest, self._dispatch)
+                return
+            self._start(best[1], best[0], now)
+
+    @asynccontextmanager
+    async def turn(self, conversation_id: str, tenant_id: Optional[str] = None, estimate: int = 500):
+        """Hold one scheduling slot for the duration of an agent turn"""
+        tenant_id = tenant_id or DEFAULT_TENANT
+        ticket = TurnTicket(tenant_id, conversation_id, max(int(estimate), 1), next(self.sequence))
+        state = self.tenant(tenant_id)
+        self._enqueue(ticket)
+        self._dispatch()
+        if not ticket.granted.done():
+            self.stats["queued_turns"] += 1
+            state.stats["queued_turns"] += 1
+            if state.quota_ready_in(ticket.estimate, time.monotonic()) > 0:
+                state.stats["quota_delays"] += 1
+        try:
+            await ticket.granted
+        except asyncio.CancelledError:
+            if ticket.started_at is None:
+                self._withdraw(ticket, state)
+                self.stats["cancelled_waits"] += 1
+                raise
+            self._finish(ticket, state)
+            raise
+        try:
+            yield ticket
+        finally:
+            self._finish(ticket, state)
+
+    def _withdraw(self, ticket: TurnTicket, state: TenantState):
+        queue = state.pending.get(ticket.conversation_id)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del state.pending[ticket.conversation_id]
+        self._settle(ticket.tenant_id, state)
+        self._dispatch()
+
+    def _settle(self, tenant_id: str, state: TenantState):
+        """Park a tenant with nothing queued or running among the idle ones, evicting the longest idle"""
+        if state.pending or state.running:
+            return
+        # Finished conversations would otherwise pile up in the service table
+        state.conversation_service = {}
+        self.idle[tenant_id] = None
+        self.idle.move_to_end(tenant_id)
+        while len(self.idle) > self.max_idle_tenants:
+            evicted, _ = self.idle.popitem(last=False)
+            del self.tenants[evicted]
+
+    def _finish(self, ticket: TurnTicket, state: TenantState):
+        state.running -= 1
+        self.running -= 1
+        if ticket.tokens is not None:
+            # Replace the estimate charged at start with what the turn really used
+            correction = ticket.tokens - ticket.estimate
+            state.service += correction / state.policy.weight
+            state.conversation_service[ticket.conversation_id] = state.conversation_service.get(ticket.conversation_id, 0.0) + correction
+            if state.policy.tokens_per_minute:
+                state.bucket -= correction
+        used = ticket.tokens if ticket.tokens is not None else ticket.estimate
+        state.stats["turns"] += 1
+        state.stats["tokens"] += used
+        self.stats["turns"] += 1
+        self._settle(ticket.tenant_id, state)
+        self._dispatch()
+
+    def tenant_report(self) -> Dict[str, Dict[str, Any]]:
+        report = {}
+        for tenant_id, state in self.tenants.items():
+            waits = np.asarray(state.waits, dtype=np.float64)
+            report[tenant_id] = {
+                "weight": state.policy.weight,
+                "tokens_per_minute": state.policy.tokens_per_minute or None,
+                "max_concurrent": state.policy.max_concurrent or None,
+                "running": state.running,
+                "queued": sum(len(queue) for queue in state.pending.values()),
+                "wait_p50_seconds": float(np.percentile(waits, 50)) if len(waits) else None,
+                "wait_p95_seconds": float(np.percentile(waits, 95)) if len(waits) else None,
+                "wait_avg_seconds": state.stats["wait_seconds_total"] / max(state.stats["turns"] + state.running, 1),
+                **{k: v for k, v in state.stats.items() if k != "wait_seconds_total"}
+            }
+        return report
+
+def parse_tenant_policies(config: Dict[str, Dict[str, Any]]) -> Dict[str, TenantPolicy]:
+    return {tenant_id: TenantPolicy(**{key: value for key, value in options.items() if key != "api_keys"})
+            for tenant_id, options in config.items()}
+
+def parse_tenant_keys(config: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+    """API key -> tenant id, from the api_keys listed under each configured tenant"""
+    keys = {}
+    for tenant_id, options in config.items():
+        for key in options.get("api_keys") or []:
+            if tenant_id == "*":
+                raise ValueError("The default policy '*' cannot own API keys")
+            if keys.setdefault(key, tenant_id) != tenant_id:
+                raise ValueError(f"API key listed under both {keys[key]} and {tenant_id}")
+    return keys
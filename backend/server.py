@@ -1,29 +1,56 @@
-from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Query
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Query, Header, Depends
+from fastapi import Response
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, CursorType
+from pymongo.errors import OperationFailure, CollectionInvalid
 import os
+import sys
 import logging
 import json
 import asyncio
+import contextlib
 import random
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Awaitable
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import httpx
 from enum import Enum
 import time
 import hashlib
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
 import tempfile
 import io
+import base64
+import numpy as np
+import csv
+import zlib
+import re
+import html
+import socket
+
+from storage import create_storage, CachedStorage, parse_timestamp, to_storage_document, to_api_document
+from vector_memory import VectorMemoryStore, HashingEmbedder, write_rows
+from consensus import ConsensusEngine, REACHED, NOT_REACHED, AMBIGUOUS
+from novelty import NoveltyTracker, stagnant_rounds
+from job_queue import create_job_queue, new_job
+from scheduler import FairTurnScheduler, parse_tenant_policies, parse_tenant_keys
+from workflow import Workflow, WorkflowError, fan_out_workflow, run_workflow, latency_report, COMPLETED as STEP_COMPLETED
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
 # MongoDB connection with connection pooling
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(
@@ -35,6 +62,25 @@ client = AsyncIOMotorClient(
 )
 db = client[os.environ['DB_NAME']]
 
+# Repository used by the conversation, message, summary and rollup paths; the
+# Mongo-only features (index checks, migrations, LLM event log, search, bulk
+# export) still talk to db directly and are disabled on the other backends
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+storage = create_storage(STORAGE_BACKEND, db, os.environ.get('SQLITE_PATH', str(ROOT_DIR / 'multiagent.db')))
+MONGO_FEATURES = STORAGE_BACKEND == "mongo"
+
+# Hot-conversation cache in front of the backend (size 0 disables it)
+CONVERSATION_CACHE_SIZE = int(os.environ.get('CONVERSATION_CACHE_SIZE', '1000'))
+CONVERSATION_CACHE_TTL_SECONDS = float(os.environ.get('CONVERSATION_CACHE_TTL_SECONDS', '30'))
+CONVERSATION_CACHE_WINDOW = int(os.environ.get('CONVERSATION_CACHE_WINDOW', '200'))
+CONVERSATION_CACHE_WATCH = os.environ.get('CONVERSATION_CACHE_WATCH', 'true').lower() == 'true'
+if CONVERSATION_CACHE_SIZE > 0:
+    storage = CachedStorage(storage, CONVERSATION_CACHE_SIZE, CONVERSATION_CACHE_TTL_SECONDS, CONVERSATION_CACHE_WINDOW)
+
+def require_mongo_features(feature: str):
+    if not MONGO_FEATURES:
+        raise HTTPException(status_code=501, detail=f"{feature} requires the mongo storage backend")
+
 # Create the main app without a prefix
 app = FastAPI(title="Enhanced Multi-Agent Chat Platform", version="2.0.0")
 
@@ -197,6 +243,7 @@ class ConnectionManager:
             "active_connections": 0,
             "messages_sent": 0
         }
+        self.relay = None
 
     async def connect(self, websocket: WebSocket, conversation_id: str):
         await websocket.accept()
@@ -212,6 +259,13 @@ class ConnectionManager:
         logger.info(f"WebSocket disconnected for conversation {conversation_id}. Active: {self.connection_stats['active_connections']}")
 
     async def send_to_conversation(self, message: str, conversation_id: str):
+        if self.relay is not None:
+            # Worker processes hold no sockets; API processes deliver what they publish
+            self.relay.publish(conversation_id, message)
+        await self.deliver(message, conversation_id)
+
+    async def deliver(self, message: str, conversation_id: str):
+        """Send to the sockets connected to this process only"""
         if conversation_id in self.active_connections:
             for connection in self.active_connections[conversation_id].copy():
                 try:
@@ -233,6 +287,245 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+# In-process change notification for long-polling clients
+MAX_PARKED_POLLS = int(os.environ.get('MAX_PARKED_POLLS', '500'))
+
+class ConversationChangeNotifier:
+    """Per-conversation version counter and wake-up signal for parked poll requests"""
+    def __init__(self, max_parked: int):
+        self.max_parked = max_parked
+        self.versions: Dict[str, int] = defaultdict(int)
+        self.events: Dict[str, asyncio.Event] = {}
+        self.waiters: Dict[str, int] = defaultdict(int)
+        self.parked = 0
+        self.stats = {
+            "notifications": 0,
+            "wakeups": 0,
+            "timeouts": 0,
+            "rejected": 0
+        }
+
+    def version(self, conversation_id: str) -> int:
+        return self.versions.get(conversation_id, 0)
+
+    def notify(self, conversation_id: str):
+        """Signal that a message in the conversation was inserted or updated"""
+        self.versions[conversation_id] += 1
+        self.stats["notifications"] += 1
+        event = self.events.pop(conversation_id, None)
+        if event:
+            event.set()
+
+    def can_park(self) -> bool:
+        return self.parked < self.max_parked
+
+    async def wait_for_change(self, conversation_id: str, since_version: int, timeout: float) -> bool:
+        """Wait until the conversation version moves past since_version. Returns False on timeout."""
+        if self.version(conversation_id) != since_version:
+            return True
+
+        event = self.events.get(conversation_id)
+        if event is None:
+            event = self.events[conversation_id] = asyncio.Event()
+
+        self.parked += 1
+        self.waiters[conversation_id] += 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            self.stats["wakeups"] += 1
+            return True
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            return False
+        finally:
+            self.parked -= 1
+            self.waiters[conversation_id] -= 1
+            if self.waiters[conversation_id] <= 0:
+                del self.waiters[conversation_id]
+                if self.events.get(conversation_id) is event:
+                    del self.events[conversation_id]
+
+change_notifier = ConversationChangeNotifier(MAX_PARKED_POLLS)
+
+class ExternalChangeWatcher:
+    """Tails the MongoDB change stream so writes made by other processes invalidate
+    the conversation cache and wake this process's parked pollers.
+
+    Change streams need a replica set; on a standalone server the watcher stops
+    and the cache TTL bounds how stale a conversation can get.
+    """
+    def __init__(self, database, cache: CachedStorage, notifier: ConversationChangeNotifier, retry_seconds: float = 5.0):
+        self.db = database
+        self.cache = cache
+        self.notifier = notifier
+        self.retry_seconds = retry_seconds
+        self.resume_token = None
+        self.task: Optional[asyncio.Task] = None
+        self.state = "idle"
+        self.stats = {"events": 0, "external": 0}
+
+    def handle(self, change: dict):
+        document = change.get("fullDocument") or {}
+        collection = change["ns"]["coll"]
+        conversation_id = document.get("conversation_id") if collection == "messages" else document.get("id")
+        if document.get("id") is None:
+            return
+        self.stats["events"] += 1
+        if self.cache.external_change(collection, document["id"], conversation_id):
+            self.stats["external"] += 1
+            if conversation_id:
+                self.notifier.notify(conversation_id)
+
+    async def run(self):
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": ["conversations", "messages"]},
+            "operationType": {"$in": ["insert", "update", "replace"]}
+        }}]
+        while True:
+            try:
+                async with self.db.watch(pipeline, full_document="updateLookup", resume_after=self.resume_token) as stream:
+                    self.state = "watching"
+                    async for change in stream:
+                        self.resume_token = stream.resume_token
+                        self.handle(change)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                self.state = f"unavailable: {e}"
+                logger.warning(f"Change streams unavailable ({e}); conversation cache relies on its TTL")
+                return
+            except Exception as e:
+                self.state = f"retrying: {e}"
+                logger.error(f"Change stream interrupted: {e}")
+                await asyncio.sleep(self.retry_seconds)
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def shutdown(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+cache_watcher = ExternalChangeWatcher(db, storage, change_notifier) if isinstance(storage, CachedStorage) else None
+
+# WebSocket events from dedicated worker processes, relayed to the API processes
+EVENT_RELAY_COLLECTION = "conversation_events"
+EVENT_RELAY_CAPPED_BYTES = int(os.environ.get('EVENT_RELAY_CAPPED_BYTES', str(64 * 1024 * 1024)))
+EVENT_RELAY_FLUSH_MS = int(os.environ.get('EVENT_RELAY_FLUSH_MS', '20'))
+
+class ConversationEventRelay:
+    """Carries WebSocket events from worker processes to API processes through a capped collection.
+
+    Workers append events in small ordered batches; every API process tails the
+    collection with an awaitable cursor, delivers each event to its own sockets
+    and wakes its parked pollers. Unlike change streams this also works on a
+    standalone server. Events published while an API process is reconnecting
+    can be missed; clients catch up through /poll.
+
+    Each publishing process stamps its events with its own source id and an
+    increasing sequence number. ObjectIds from different processes are not
+    ordered, so a reconnecting tailer re-reads the collection in natural
+    (insertion) order and skips every event at or below the last sequence it
+    delivered from that source.
+    """
+    def __init__(self, database, capped_bytes: int, flush_ms: int, batch_size: int = 500, retry_seconds: float = 0.5):
+        self.db = database
+        self.capped_bytes = capped_bytes
+        self.interval = flush_ms / 1000
+        self.batch_size = batch_size
+        self.retry_seconds = retry_seconds
+        self.buffer: List[dict] = []
+        self.flusher: Optional[asyncio.Task] = None
+        self.tailer: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        self.source = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.sequence = 0
+        self.state = "idle"
+        self.stats = {"published": 0, "written": 0, "write_errors": 0, "delivered": 0}
+
+    async def ensure_collection(self):
+        if not await self.db.list_collection_names(filter={"name": EVENT_RELAY_COLLECTION}):
+            try:
+                await self.db.create_collection(EVENT_RELAY_COLLECTION, capped=True, size=self.capped_bytes)
+            except CollectionInvalid:
+                pass  # another process created it first
+
+    def publish(self, conversation_id: str, message: str):
+        self.sequence += 1
+        self.buffer.append({"conversation_id": conversation_id, "payload": message, "ts": datetime.utcnow(),
+                            "source": self.source, "seq": self.sequence})
+        self.stats["published"] += 1
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self._run())
+
+    async def flush(self):
+        async with self.lock:
+            while self.buffer:
+                batch, self.buffer = self.buffer[:self.batch_size], self.buffer[self.batch_size:]
+                try:
+                    # Ordered, so a conversation's events reach subscribers in the order they were published
+                    await self.db[EVENT_RELAY_COLLECTION].insert_many(batch, ordered=True)
+                    self.stats["written"] += len(batch)
+                except Exception as e:
+                    self.stats["write_errors"] += 1
+                    logger.error(f"Failed to relay {len(batch)} conversation events: {e}")
+
+    async def _run(self):
+        while self.buffer:
+            await asyncio.sleep(self.interval)
+            await asyncio.shield(self.flush())
+
+    async def deliver(self, event: dict):
+        conversation_id = event["conversation_id"]
+        self.stats["delivered"] += 1
+        change_notifier.notify(conversation_id)
+        if isinstance(storage, CachedStorage) and not (cache_watcher and cache_watcher.state == "watching"):
+            # Without a change stream the relay is the only sign that a worker wrote to this conversation
+            storage.invalidate(conversation_id)
+        await manager.deliver(event["payload"], conversation_id)
+
+    async def tail(self):
+        collection = self.db[EVENT_RELAY_COLLECTION]
+        # Events already in the collection were meant for the sockets of earlier processes
+        delivered = {row["_id"]: row["seq"] or 0
+                     async for row in collection.aggregate([{"$group": {"_id": "$source", "seq": {"$max": "$seq"}}}])}
+        while True:
+            try:
+                cursor = collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                self.state = "tailing"
+                async for event in cursor:
+                    source, seq = event.get("source"), event.get("seq") or 0
+                    if seq <= delivered.get(source, 0):
+                        continue
+                    delivered[source] = seq
+                    await self.deliver(event)
+                # A tailable cursor on an empty collection dies at once; poll until the first event arrives
+                await asyncio.sleep(self.retry_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.state = f"retrying: {e}"
+                logger.error(f"Conversation event relay interrupted: {e}")
+                await asyncio.sleep(self.retry_seconds)
+
+    def start_tailing(self):
+        if self.tailer is None or self.tailer.done():
+            self.tailer = asyncio.create_task(self.tail())
+
+    async def shutdown(self):
+        if self.tailer and not self.tailer.done():
+            self.tailer.cancel()
+        if self.flusher and not self.flusher.done():
+            self.flusher.cancel()
+        await self.flush()
+
+event_relay = ConversationEventRelay(db, EVENT_RELAY_CAPPED_BYTES, EVENT_RELAY_FLUSH_MS)
+
 # Enhanced Models
 class AgentType(str, Enum):
     STRATEGIST = "strategist"
@@ -266,6 +559,9 @@ class ConversationSummary(BaseModel):
     agent_contributions: Dict[str, str]
     consensus_reached: bool
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    watermark: Optional[str] = None
+    message_count: int = 0
+    cached: bool = False
 
 class AgentPerformanceMetrics(BaseModel):
     agent_type: str
@@ -282,6 +578,17 @@ class CollaborationMode(str, Enum):
     CONSENSUS_REQUIRED = "consensus_required"
     DEBATE = "debate"
     RESEARCH = "research"
+    WORKFLOW = "workflow"
+
+class WorkflowStepRequest(BaseModel):
+    id: str = Field(..., pattern="^[A-Za-z0-9_-]{1,64}$")
+    agent: AgentType
+    prompt: Optional[str] = Field(None, max_length=4000)
+    depends_on: List[str] = []
+    timeout_seconds: float = Field(180.0, gt=0, le=1800)
+
+class WorkflowRequest(BaseModel):
+    steps: List[WorkflowStepRequest] = Field(..., min_length=1, max_length=50)
 
 class ConversationStartRequest(BaseModel):
     topic: str
@@ -291,6 +598,7 @@ class ConversationStartRequest(BaseModel):
     max_rounds: int = 10
     consensus_threshold: float = 0.8
     streaming_enabled: bool = True
+    workflow: Optional[WorkflowRequest] = None  # workflow mode; defaults to a fan-out over the agents
 
 class ConsensusStatus(BaseModel):
     reached: bool
@@ -311,6 +619,1193 @@ class ConversationExportRequest(BaseModel):
     conversation_id: str
     format: str = "json"  # json, markdown, pdf
 
+class BulkExportRequest(BaseModel):
+    format: str = Field("parquet", pattern="^(parquet|arrow)$")
+    batch_size: int = Field(5000, ge=100, le=100000)
+    job_id: Optional[str] = Field(None, pattern="^[A-Za-z0-9_-]{1,64}$")  # reuse to resume an interrupted export
+
+# Message persistence - every message write goes through here so pollers get notified
+async def save_message(message_dict: dict):
+    """Insert a message document and wake parked pollers of its conversation"""
+    await storage.insert_message(to_storage_document(message_dict))
+    change_notifier.notify(message_dict["conversation_id"])
+    # Streaming messages are counted when they complete
+    if message_dict.get("streaming_status") != StreamingStatus.STARTED:
+        record_message_completion(message_dict)
+
+async def update_message(conversation_id: str, message_id: str, fields: dict):
+    """Update a message document and wake parked pollers of its conversation"""
+    await storage.update_message(message_id, fields)
+    change_notifier.notify(conversation_id)
+
+# Write-behind checkpoints for messages that are still streaming
+STREAM_CHECKPOINT_INTERVAL_MS = int(os.environ.get('STREAM_CHECKPOINT_INTERVAL_MS', '500'))
+STREAM_CHECKPOINT_MAX_BATCH = int(os.environ.get('STREAM_CHECKPOINT_MAX_BATCH', '500'))
+
+class MessageCheckpointBuffer:
+    """Coalesces partial content of streaming messages into throttled batched checkpoints.
+
+    Each message is written at most once per interval no matter how many chunks
+    arrive; checkpoints for all conversations share one storage batch per flush.
+    """
+    def __init__(self, interval_ms: int, max_batch: int):
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self.pending: Dict[str, tuple] = {}
+        self.flusher: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        self.stats = {
+            "checkpoints_requested": 0,
+            "checkpoints_written": 0,
+            "flushes": 0,
+            "errors": 0
+        }
+
+    def checkpoint(self, conversation_id: str, message_id: str, fields: dict):
+        """Buffer the latest partial state of a streaming message"""
+        self.pending[message_id] = (conversation_id, fields)
+        self.stats["checkpoints_requested"] += 1
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self._run())
+
+    async def complete(self, conversation_id: str, message_id: str, fields: dict):
+        """Drop any buffered checkpoint and write the final state immediately"""
+        self.pending.pop(message_id, None)
+        await update_message(conversation_id, message_id, fields)
+
+    async def flush(self):
+        async with self.lock:
+            while self.pending:
+                batch = []
+                while self.pending and len(batch) < self.max_batch:
+                    message_id = next(iter(self.pending))
+                    batch.append((message_id, *self.pending.pop(message_id)))
+
+                # Checkpoints only apply while streaming so a late flush never overwrites the final write
+                try:
+                    await storage.checkpoint_messages([(message_id, fields) for message_id, _, fields in batch])
+                    self.stats["checkpoints_written"] += len(batch)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    logger.error(f"Streaming checkpoint flush failed for {len(batch)} messages: {e}")
+                self.stats["flushes"] += 1
+
+                for conversation_id in {conversation_id for _, conversation_id, _ in batch}:
+                    change_notifier.notify(conversation_id)
+
+    async def _run(self):
+        while self.pending:
+            await asyncio.sleep(self.interval)
+            # Shielded: cancelling the flusher at shutdown must not drop a batch already taken off the buffer
+            await asyncio.shield(self.flush())
+
+    async def shutdown(self):
+        if self.flusher and not self.flusher.done():
+            self.flusher.cancel()
+        await self.flush()
+
+message_checkpoints = MessageCheckpointBuffer(STREAM_CHECKPOINT_INTERVAL_MS, STREAM_CHECKPOINT_MAX_BATCH)
+
+# Incrementally maintained conversation performance_metrics
+CONVERSATION_METRICS_FLUSH_MS = int(os.environ.get('CONVERSATION_METRICS_FLUSH_MS', '1000'))
+
+class ConversationMetricsAccumulator:
+    """Folds completed messages into conversations.performance_metrics.
+
+    Deltas are accumulated per conversation and applied with one atomic
+    update each, so the counters and the running mean move together; all
+    touched conversations share one storage batch per flush.
+    """
+    def __init__(self, flush_ms: int):
+        self.interval = flush_ms / 1000
+        self.pending: Dict[str, Dict[str, float]] = {}
+        self.flusher: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        self.stats = {
+            "messages_recorded": 0,
+            "updates_written": 0,
+            "errors": 0
+        }
+
+    def record(self, conversation_id: str, response_time: Optional[float] = None, token_count: Optional[int] = None):
+        delta = self.pending.setdefault(conversation_id, {
+            "messages": 0, "samples": 0, "response_time_sum": 0.0, "tokens": 0
+        })
+        delta["messages"] += 1
+        if response_time is not None:
+            delta["samples"] += 1
+            delta["response_time_sum"] += response_time
+        delta["tokens"] += token_count or 0
+        self.stats["messages_recorded"] += 1
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self._run())
+
+    async def flush(self):
+        async with self.lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            try:
+                await storage.apply_conversation_metrics(batch)
+                self.stats["updates_written"] += len(batch)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Conversation metrics flush failed for {len(batch)} conversations: {e}")
+
+    async def _run(self):
+        while self.pending:
+            await asyncio.sleep(self.interval)
+            await asyncio.shield(self.flush())
+
+    async def shutdown(self):
+        if self.flusher and not self.flusher.done():
+            self.flusher.cancel()
+        await self.flush()
+
+conversation_metrics = ConversationMetricsAccumulator(CONVERSATION_METRICS_FLUSH_MS)
+
+async def reconcile_conversation_metrics(conversation_id: str) -> Dict[str, Any]:
+    """Recompute performance_metrics for a conversation from its finished messages"""
+    await conversation_metrics.flush()
+    stats = await storage.message_stats(conversation_id)
+    metrics = {
+        "total_messages": stats["total_messages"],
+        "avg_response_time": stats["response_time_sum"] / stats["response_time_samples"] if stats["response_time_samples"] else 0.0,
+        "total_tokens": stats["total_tokens"],
+        "response_time_samples": stats["response_time_samples"]
+    }
+    await storage.update_conversation(conversation_id, {"performance_metrics": metrics})
+    return metrics
+
+# Keyset pagination over (timestamp, id) for conversation messages
+MESSAGE_PAGE_SIZE_DEFAULT = 1000
+MESSAGE_PAGE_SIZE_MAX = 1000
+MESSAGE_SORT = [("timestamp", 1), ("id", 1)]
+
+def encode_message_cursor(message: dict) -> str:
+    """Encode a message position as an opaque URL-safe cursor"""
+    timestamp = message.get("timestamp")
+    # Legacy string timestamps are tagged so the cursor queries the same BSON type
+    if isinstance(timestamp, datetime):
+        position = ["d", timestamp.isoformat(), message.get("id", "")]
+    else:
+        position = ["s", timestamp or "", message.get("id", "")]
+    raw = json.dumps(position, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_message_cursor(cursor: str):
+    """Decode a cursor into its (timestamp, id) position. Raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        kind, timestamp, message_id = json.loads(raw)
+        if kind not in ("d", "s") or not isinstance(timestamp, str) or not isinstance(message_id, str):
+            raise ValueError
+        if kind == "d":
+            timestamp = parse_timestamp(timestamp)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return timestamp, message_id
+
+async def fetch_message_page(conversation_id: str, after: Optional[str] = None, before: Optional[str] = None,
+                             limit: int = MESSAGE_PAGE_SIZE_DEFAULT, fields: Optional[List[str]] = None):
+    """Fetch one page of messages in chronological order.
+
+    With `before` the page is the `limit` messages immediately preceding the cursor,
+    otherwise the `limit` messages following `after` (or the start). Returns
+    (messages, has_more) where has_more refers to the direction of travel.
+    Projected pages always include `id` and `timestamp`.
+    """
+    limit = max(1, min(limit, MESSAGE_PAGE_SIZE_MAX))
+    if fields is not None:
+        # The next page's cursor is built from these, whatever the caller asked for
+        fields = list(dict.fromkeys([*fields, "id", "timestamp"]))
+    messages = await storage.message_page(
+        conversation_id,
+        after=decode_message_cursor(after) if after else None,
+        before=decode_message_cursor(before) if before else None,
+        limit=limit + 1,
+        fields=fields
+    )
+    has_more = len(messages) > limit
+    if has_more:
+        messages = messages[1:] if before else messages[:limit]
+    return messages, has_more
+
+async def iter_conversation_messages(conversation_id: str, page_size: int = 500, fields: Optional[List[str]] = None,
+                                     after: Optional[str] = None):
+    """Stream every message of a conversation (following `after`) in chronological order, one page at a time"""
+    while True:
+        page, has_more = await fetch_message_page(conversation_id, after=after, limit=page_size, fields=fields)
+        for message in page:
+            yield message
+        if not has_more or not page:
+            return
+        after = encode_message_cursor(page[-1])
+
+async def fetch_recent_messages(conversation_id: str, count: int) -> List[dict]:
+    """Fetch the last `count` messages of a conversation in chronological order"""
+    return await storage.recent_messages(conversation_id, count)
+
+def page_cursors(messages: List[dict]) -> Dict[str, Optional[str]]:
+    return {
+        "next_cursor": encode_message_cursor(messages[-1]) if messages else None,
+        "prev_cursor": encode_message_cursor(messages[0]) if messages else None
+    }
+
+# MongoDB index bootstrap and query-plan verification
+REQUIRED_INDEXES = {
+    "conversations": [
+        {"name": "conversation_id_unique", "keys": [("id", 1)], "unique": True},
+        {"name": "conversation_status_created", "keys": [("status", 1), ("created_at", -1)]},
+        {"name": "conversation_topic_text", "keys": [("topic", "text")]}
+    ],
+    "messages": [
+        {"name": "message_id_unique", "keys": [("id", 1)], "unique": True},
+        {"name": "conversation_timeline", "keys": [("conversation_id", 1), ("timestamp", 1), ("id", 1)]},
+        # One text index per collection; the agent_type prefix lets a search scan only one agent's entries
+        {"name": "message_agent_content_text", "keys": [("agent_type", 1), ("content", "text")], "replaces": "message_content_text"}
+    ],
+    "summaries": [
+        {"name": "summary_conversation_timeline", "keys": [("conversation_id", 1), ("timestamp", -1)]}
+    ],
+    "agent_rollups": [
+        {"name": "agent_rollup_bucket_unique", "keys": [("granularity", 1), ("agent_type", 1), ("bucket", 1), ("model", 1)], "unique": True}
+    ],
+    "collaboration_jobs": [
+        {"name": "job_id_unique", "keys": [("id", 1)], "unique": True},
+        {"name": "job_queued", "keys": [("status", 1), ("available_at", 1)]},
+        {"name": "job_leases", "keys": [("status", 1), ("lease_expires_at", 1)]},
+        {"name": "job_conversation", "keys": [("conversation_id", 1), ("enqueued_at", -1)]}
+    ]
+}
+
+# Queries on the request path that must never fall back to a collection scan
+HOT_QUERIES = [
+    {"name": "conversation_by_id", "collection": "conversations", "filter": {"id": "__probe__"}},
+    {"name": "message_by_id", "collection": "messages", "filter": {"id": "__probe__"}},
+    {"name": "conversation_messages", "collection": "messages",
+     "filter": {"conversation_id": "__probe__"}, "sort": MESSAGE_SORT},
+    {"name": "conversation_messages_after_cursor", "collection": "messages",
+     "filter": {"conversation_id": "__probe__", "$or": [
+         {"timestamp": {"$gt": datetime(1970, 1, 1)}}, {"timestamp": datetime(1970, 1, 1), "id": {"$gt": ""}}
+     ]}, "sort": MESSAGE_SORT},
+    {"name": "conversation_messages_tail", "collection": "messages",
+     "filter": {"conversation_id": "__probe__"}, "sort": [(field, -1) for field, _ in MESSAGE_SORT]},
+    {"name": "job_claim_queued", "collection": "collaboration_jobs",
+     "filter": {"status": "queued", "available_at": {"$lte": datetime(1970, 1, 1)}}, "sort": [("available_at", 1)]},
+    {"name": "job_claim_expired", "collection": "collaboration_jobs",
+     "filter": {"status": "running", "lease_expires_at": {"$lt": datetime(1970, 1, 1)}}, "sort": [("lease_expires_at", 1)]},
+    {"name": "message_text_search", "collection": "messages", "filter": {"agent_type": "strategist", "$text": {"$search": "probe"}}},
+    {"name": "conversation_text_search", "collection": "conversations", "filter": {"$text": {"$search": "probe"}}}
+]
+
+INDEX_VERIFY_STRICT = os.environ.get('INDEX_VERIFY_STRICT', 'false').lower() == 'true'
+
+class IndexManager:
+    """Creates the declared indexes idempotently and checks hot query plans against them"""
+    def __init__(self, database, required_indexes: Dict[str, List[dict]], hot_queries: List[dict], strict: bool = False):
+        self.db = database
+        self.required_indexes = {name: list(specs) for name, specs in required_indexes.items()}
+        self.hot_queries = hot_queries
+        self.strict = strict
+        self.status = {
+            "state": "pending",
+            "created": [],
+            "failed": {},
+            "plans": {},
+            "collection_scans": []
+        }
+
+    def register_ttl_index(self, collection: str, field: str, expire_after_seconds: int):
+        """Declare a TTL index for an ephemeral collection; created on the next bootstrap"""
+        self.required_indexes.setdefault(collection, []).append({
+            "name": f"{collection}_{field}_ttl",
+            "keys": [(field, 1)],
+            "expireAfterSeconds": expire_after_seconds
+        })
+
+    async def ensure_indexes(self):
+        for collection, specs in self.required_indexes.items():
+            for spec in specs:
+                options = {k: v for k, v in spec.items() if k not in ("keys", "replaces")}
+                try:
+                    if spec.get("replaces") and spec["replaces"] in await self.db[collection].index_information():
+                        # A changed definition under a new name, e.g. the only text index a collection may have
+                        await self.db[collection].drop_index(spec["replaces"])
+                        logger.info(f"Dropped index {spec['replaces']} on {collection}, replaced by {spec['name']}")
+                    await self.db[collection].create_index(spec["keys"], background=True, **options)
+                    self.status["created"].append(f"{collection}.{spec['name']}")
+                except Exception as e:
+                    # An index with the same name but different options, or duplicate data under a unique index
+                    self.status["failed"][f"{collection}.{spec['name']}"] = str(e)
+                    logger.error(f"Failed to create index {spec['name']} on {collection}: {e}")
+
+    @staticmethod
+    def _plan_stages(plan: dict) -> List[str]:
+        stages = []
+        pending = [plan]
+        while pending:
+            node = pending.pop()
+            if not isinstance(node, dict):
+                continue
+            if "stage" in node:
+                stages.append(node["stage"])
+            for key in ("inputStage", "queryPlan"):
+                if key in node:
+                    pending.append(node[key])
+            pending.extend(node.get("inputStages", []))
+        return stages
+
+    async def verify_query_plans(self) -> List[str]:
+        """Explain every hot query and return the names of those using a COLLSCAN"""
+        collection_scans = []
+        for query in self.hot_queries:
+            cursor = self.db[query["collection"]].find(query["filter"])
+            if query.get("sort"):
+                cursor = cursor.sort(query["sort"])
+            try:
+                explanation = await cursor.explain()
+            except Exception as e:
+                logger.error(f"Could not explain hot query {query['name']}: {e}")
+                self.status["plans"][query["name"]] = f"unverified: {e}"
+                continue
+            winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+            stages = self._plan_stages(winning_plan)
+            self.status["plans"][query["name"]] = stages
+            if "COLLSCAN" in stages:
+                collection_scans.append(query["name"])
+                logger.error(f"Hot query {query['name']} on {query['collection']} uses a COLLSCAN: {stages}")
+        self.status["collection_scans"] = collection_scans
+        return collection_scans
+
+    async def bootstrap(self):
+        self.status["state"] = "running"
+        await self.ensure_indexes()
+        collection_scans = await self.verify_query_plans()
+        if collection_scans:
+            self.status["state"] = "degraded"
+            if self.strict:
+                raise RuntimeError(f"Hot queries without index support: {', '.join(collection_scans)}")
+        else:
+            self.status["state"] = "ready"
+        logger.info(f"Index bootstrap finished: {self.status['state']} ({len(self.status['created'])} indexes ensured)")
+
+index_manager = IndexManager(db, REQUIRED_INDEXES, HOT_QUERIES, strict=INDEX_VERIFY_STRICT)
+
+# Resumable migration of legacy ISO-string timestamps to BSON dates
+TIMESTAMP_MIGRATIONS = [("messages", "timestamp"), ("summaries", "timestamp")]
+
+class TimestampMigration:
+    """Converts string timestamps in batches with bulk_write, checkpointing progress in db.migrations"""
+    def __init__(self, database, targets: List[tuple], batch_size: int = 1000):
+        self.db = database
+        self.targets = targets
+        self.batch_size = batch_size
+        self.task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _checkpoint_id(collection: str, field: str) -> str:
+        return f"timestamp_migration:{collection}.{field}"
+
+    async def progress(self) -> Dict[str, Any]:
+        report = {"running": bool(self.task and not self.task.done()), "collections": {}}
+        for collection, field in self.targets:
+            checkpoint = await self.db.migrations.find_one({"_id": self._checkpoint_id(collection, field)}) or {}
+            checkpoint.pop("_id", None)
+            checkpoint.pop("last_id", None)
+            checkpoint["remaining"] = await self.db[collection].count_documents({field: {"$type": "string"}})
+            report["collections"][f"{collection}.{field}"] = to_api_document(checkpoint)
+        return report
+
+    async def migrate_collection(self, collection: str, field: str):
+        checkpoint_id = self._checkpoint_id(collection, field)
+        checkpoint = await self.db.migrations.find_one({"_id": checkpoint_id})
+        if not checkpoint or checkpoint.get("state") == "completed":
+            # Fresh pass; an interrupted one resumes after its last checkpointed _id
+            checkpoint = {"_id": checkpoint_id, "converted": 0, "failed": 0, "last_id": None, "created_at": datetime.utcnow()}
+        checkpoint["state"] = "running"
+
+        while True:
+            query = {field: {"$type": "string"}}
+            if checkpoint["last_id"] is not None:
+                # Unparseable values stay strings; resuming past them avoids re-reading them forever
+                query["_id"] = {"$gt": checkpoint["last_id"]}
+            batch = await self.db[collection].find(query, {field: 1}).sort("_id", 1).limit(self.batch_size).to_list(self.batch_size)
+            if not batch:
+                break
+
+            operations = []
+            for document in batch:
+                try:
+                    converted = parse_timestamp(document[field])
+                except ValueError:
+                    checkpoint["failed"] += 1
+                    logger.warning(f"Unparseable {collection}.{field} on {document['_id']}: {document[field]!r}")
+                    continue
+                # Match on the old value so a concurrent rewrite of the document is never clobbered
+                operations.append(UpdateOne(
+                    {"_id": document["_id"], field: document[field]},
+                    {"$set": {field: converted}}
+                ))
+
+            if operations:
+                result = await self.db[collection].bulk_write(operations, ordered=False)
+                checkpoint["converted"] += result.modified_count
+
+            checkpoint["last_id"] = batch[-1]["_id"]
+            checkpoint["last_updated"] = datetime.utcnow()
+            await self.db.migrations.replace_one({"_id": checkpoint_id}, checkpoint, upsert=True)
+            logger.info(f"Timestamp migration {collection}.{field}: {checkpoint['converted']} converted, {checkpoint['failed']} failed")
+
+        checkpoint["state"] = "completed"
+        checkpoint["last_id"] = None
+        checkpoint["completed_at"] = datetime.utcnow()
+        await self.db.migrations.replace_one({"_id": checkpoint_id}, checkpoint, upsert=True)
+
+    async def run(self):
+        for collection, field in self.targets:
+            try:
+                await self.migrate_collection(collection, field)
+            except Exception as e:
+                logger.error(f"Timestamp migration of {collection}.{field} stopped: {e}")
+                await self.db.migrations.update_one(
+                    {"_id": self._checkpoint_id(collection, field)},
+                    {"$set": {"state": "error", "error": str(e)}},
+                    upsert=True
+                )
+                return
+
+    def start(self) -> bool:
+        if self.task and not self.task.done():
+            return False
+        self.task = asyncio.create_task(self.run())
+        return True
+
+timestamp_migration = TimestampMigration(db, TIMESTAMP_MIGRATIONS)
+
+# Materialized per-agent analytics rollups (minute / hour / day buckets)
+ROLLUP_GRANULARITIES = {
+    "minute": {"truncate": lambda ts: ts.replace(second=0, microsecond=0), "retention": timedelta(days=2)},
+    "hour": {"truncate": lambda ts: ts.replace(minute=0, second=0, microsecond=0), "retention": timedelta(days=90)},
+    "day": {"truncate": lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0), "retention": None}
+}
+# Upper bounds in seconds of the latency histogram buckets; the last bucket is open-ended
+LATENCY_HISTOGRAM_BOUNDS = [0.5, 1, 2, 5, 10, 30, 60]
+ROLLUP_FLUSH_MS = int(os.environ.get('ROLLUP_FLUSH_MS', '2000'))
+
+def latency_bucket_label(response_time: float) -> str:
+    for bound in LATENCY_HISTOGRAM_BOUNDS:
+        if response_time <= bound:
+            return f"le_{bound}".replace(".", "_")
+    return "gt_" + str(LATENCY_HISTOGRAM_BOUNDS[-1])
+
+def latency_bucket_labels() -> List[tuple]:
+    labels = [(f"le_{bound}".replace(".", "_"), bound) for bound in LATENCY_HISTOGRAM_BOUNDS]
+    labels.append(("gt_" + str(LATENCY_HISTOGRAM_BOUNDS[-1]), float("inf")))
+    return labels
+
+def histogram_percentile(histogram: Dict[str, int], percentile: float) -> Optional[float]:
+    """Upper bound of the histogram bucket containing the given percentile"""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    threshold = total * percentile
+    seen = 0
+    for label, bound in latency_bucket_labels():
+        seen += histogram.get(label, 0)
+        if seen >= threshold:
+            return bound if bound != float("inf") else None
+    return None
+
+class AgentRollupAccumulator:
+    """Buffers completed-message facts into per-agent/model time buckets and upserts them with $inc"""
+    def __init__(self, store, flush_ms: int):
+        self.storage = store
+        self.interval = flush_ms / 1000
+        self.pending: Dict[tuple, Dict[str, Any]] = {}
+        self.flusher: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        self.rebuild_task: Optional[asyncio.Task] = None
+        self.rebuild_progress: Dict[str, Any] = {"state": "idle", "messages_processed": 0}
+        self.stats = {
+            "messages_recorded": 0,
+            "buckets_written": 0,
+            "errors": 0
+        }
+
+    def record(self, agent_type: str, model: str, completed_at: datetime, response_time: Optional[float] = None,
+               token_count: Optional[int] = None, error: bool = False, autoflush: bool = True):
+        for granularity, config in ROLLUP_GRANULARITIES.items():
+            key = (granularity, config["truncate"](completed_at), agent_type, model)
+            delta = self.pending.get(key)
+            if delta is None:
+                delta = self.pending[key] = {"inc": defaultdict(int), "last_active": completed_at}
+            inc = delta["inc"]
+            inc["message_count"] += 1
+            inc["tokens"] += token_count or 0
+            if error:
+                inc["errors"] += 1
+            if response_time is not None:
+                inc["latency_sum"] += response_time
+                inc["latency_count"] += 1
+                inc[f"latency_histogram.{latency_bucket_label(response_time)}"] += 1
+            delta["last_active"] = max(delta["last_active"], completed_at)
+        self.stats["messages_recorded"] += 1
+        if autoflush and (self.flusher is None or self.flusher.done()):
+            self.flusher = asyncio.create_task(self._run())
+
+    async def flush(self):
+        async with self.lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            deltas = []
+            for (granularity, bucket, agent_type, model), delta in batch.items():
+                retention = ROLLUP_GRANULARITIES[granularity]["retention"]
+                deltas.append({
+                    "granularity": granularity, "bucket": bucket, "agent_type": agent_type, "model": model,
+                    "inc": dict(delta["inc"]),
+                    "last_active": delta["last_active"],
+                    "expires_at": bucket + retention if retention else None
+                })
+            try:
+                await self.storage.apply_rollups(deltas)
+                self.stats["buckets_written"] += len(deltas)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Agent rollup flush failed for {len(deltas)} buckets: {e}")
+
+    async def _run(self):
+        while self.pending:
+            await asyncio.sleep(self.interval)
+            await asyncio.shield(self.flush())
+
+    async def shutdown(self):
+        if self.rebuild_task and not self.rebuild_task.done():
+            self.rebuild_task.cancel()
+        if self.flusher and not self.flusher.done():
+            self.flusher.cancel()
+        await self.flush()
+
+    def start_rebuild(self) -> bool:
+        """Run rebuild() in the background; False when one is already running"""
+        if self.rebuild_task and not self.rebuild_task.done():
+            return False
+        self.rebuild_progress = {"state": "running", "messages_processed": 0, "started_at": datetime.utcnow()}
+        self.rebuild_task = asyncio.create_task(self._run_rebuild())
+        return True
+
+    async def _run_rebuild(self):
+        try:
+            await self.rebuild()
+            self.rebuild_progress["state"] = "completed"
+        except Exception as e:
+            logger.error(f"Error rebuilding agent rollups: {e}")
+            self.rebuild_progress.update(state="error", error=str(e))
+        self.rebuild_progress["finished_at"] = datetime.utcnow()
+
+    async def rebuild(self, batch_size: int = 5000) -> int:
+        """Recompute every bucket from the stored messages"""
+        await self.flush()
+        await self.storage.clear_rollups()
+        processed = self.rebuild_progress["messages_processed"] = 0
+        async for message in self.storage.iter_agent_messages(batch_size):
+            if message.get("streaming_status") in (StreamingStatus.STARTED.value, StreamingStatus.STREAMING.value):
+                continue
+            agent_type = message["agent_type"]
+            self.record(
+                agent_type,
+                AGENT_MODELS.get(agent_type, {}).get("model", "unknown"),
+                parse_timestamp(message["timestamp"]),
+                message.get("response_time"),
+                message.get("token_count"),
+                is_error_message(message),
+                autoflush=False
+            )
+            processed += 1
+            if processed % batch_size == 0:
+                self.rebuild_progress["messages_processed"] = processed
+                await self.flush()
+        await self.flush()
+        self.rebuild_progress["messages_processed"] = processed
+        return processed
+
+agent_rollups = AgentRollupAccumulator(storage, ROLLUP_FLUSH_MS)
+index_manager.register_ttl_index("agent_rollups", "expires_at", 0)
+
+def is_error_message(message: dict) -> bool:
+    content = message.get("content") or ""
+    return message.get("streaming_status") == StreamingStatus.ERROR.value or content.startswith(("Error:", "Error generating response:"))
+
+# Rolling per-conversation prompt context, fed by finished messages
+CONTEXT_WINDOW_SIZE = int(os.environ.get('CONTEXT_WINDOW_SIZE', '16'))  # most turns ever kept verbatim
+CONTEXT_WINDOW_MAX_CONVERSATIONS = int(os.environ.get('CONTEXT_WINDOW_MAX_CONVERSATIONS', '1000'))
+# Prompt context budget in estimated tokens, per model; the reasoning model gets less since it thinks at length
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', '800'))
+CONTEXT_TOKEN_BUDGETS = {
+    "deepseek-ai/DeepSeek-R1-Distill-Llama-70B": 600,
+    **json.loads(os.environ.get('CONTEXT_TOKEN_BUDGETS', '{}'))
+}
+CONTEXT_TURN_MAX_TOKENS = int(os.environ.get('CONTEXT_TURN_MAX_TOKENS', '250'))  # longer turns are clipped
+CONTEXT_FOLD_TOKENS = int(os.environ.get('CONTEXT_FOLD_TOKENS', '300'))  # folded turns that trigger a summary refresh
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.environ.get('CONTEXT_SUMMARY_MAX_TOKENS', '200'))
+CONTEXT_SEEN_FINGERPRINTS = 256
+
+def context_budget(model: str) -> int:
+    return CONTEXT_TOKEN_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET)
+
+def speaker_label(message: dict) -> str:
+    agent_type = message.get("agent_type")
+    if agent_type:
+        return getattr(agent_type, "value", agent_type).title()
+    return "User" if message.get("is_user") else "System"
+
+def clip_text(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens at a word boundary"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4].rsplit(" ", 1)[0] + " …"
+
+# Semantic memory of every finished turn, recalled into prompts by similarity
+VECTOR_MEMORY_ENABLED = os.environ.get('VECTOR_MEMORY_ENABLED', 'true').lower() == 'true'
+VECTOR_MEMORY_DIR = os.environ.get('VECTOR_MEMORY_DIR', str(ROOT_DIR / 'vector_memory'))
+VECTOR_MEMORY_DIM = int(os.environ.get('VECTOR_MEMORY_DIM', '256'))
+VECTOR_MEMORY_TOP_K = int(os.environ.get('VECTOR_MEMORY_TOP_K', '3'))
+VECTOR_MEMORY_MIN_SCORE = float(os.environ.get('VECTOR_MEMORY_MIN_SCORE', '0.2'))
+VECTOR_MEMORY_BUDGET_SHARE = float(os.environ.get('VECTOR_MEMORY_BUDGET_SHARE', '0.25'))
+VECTOR_MEMORY_FLUSH_MS = int(os.environ.get('VECTOR_MEMORY_FLUSH_MS', '1000'))
+VECTOR_MEMORY_BACKFILL_MAX = int(os.environ.get('VECTOR_MEMORY_BACKFILL_MAX', '2000'))
+
+vector_memory = VectorMemoryStore(VECTOR_MEMORY_DIR, VECTOR_MEMORY_DIM) if VECTOR_MEMORY_ENABLED else None
+
+class VectorMemoryWriter:
+    """Write-behind for vector memory files: rows added since the last flush are
+    appended in one batch per conversation, on an executor thread instead of the loop.
+    """
+    def __init__(self, flush_ms: int):
+        self.interval = flush_ms / 1000
+        self.dirty = False
+        self.flusher: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        self.stats = {"flushes": 0, "rows_written": 0, "errors": 0}
+
+    def schedule(self):
+        self.dirty = True
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self._run())
+
+    async def flush(self):
+        async with self.lock:
+            self.dirty = False
+            batches = vector_memory.take_pending() if vector_memory is not None else []
+            if not batches:
+                return
+            loop = asyncio.get_running_loop()
+            for batch in batches:
+                try:
+                    await loop.run_in_executor(None, write_rows, batch)
+                    self.stats["rows_written"] += len(batch[2])
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    logger.error(f"Vector memory flush failed for {batch[0]}: {e}")
+            self.stats["flushes"] += 1
+
+    async def _run(self):
+        while self.dirty:
+            await asyncio.sleep(self.interval)
+            await asyncio.shield(self.flush())
+
+    async def shutdown(self):
+        if self.flusher and not self.flusher.done():
+            self.flusher.cancel()
+        await self.flush()
+
+vector_memory_writer = VectorMemoryWriter(VECTOR_MEMORY_FLUSH_MS)
+
+def memory_line(message: dict) -> Optional[str]:
+    """Line stored in semantic memory for a finished turn, None when the turn is not worth recalling"""
+    content = (message.get("content") or "").strip()
+    if not content or is_error_message(message):
+        return None
+    return f"{speaker_label(message)}: {clip_text(content, CONTEXT_TURN_MAX_TOKENS)}"
+
+def remember_message(message: dict):
+    line = memory_line(message) if vector_memory is not None else None
+    if line is None:
+        return
+    vector_memory.add(message["conversation_id"], message["id"], line, message["content"].strip())
+    vector_memory_writer.schedule()
+
+async def backfill_vector_memory(conversation_id: str):
+    """Embed the newest turns of a conversation from before semantic memory existed.
+
+    Capped at VECTOR_MEMORY_BACKFILL_MAX messages; the embedding runs on an
+    executor thread so a long history does not stall the event loop.
+    """
+    messages = [
+        message for message in await fetch_recent_messages(conversation_id, VECTOR_MEMORY_BACKFILL_MAX)
+        if message.get("streaming_status") not in (StreamingStatus.STARTED.value, StreamingStatus.STREAMING.value)
+    ]
+    rows = [(message, line) for message in messages if (line := memory_line(message)) is not None]
+    if not rows:
+        return
+    texts = [message["content"].strip() for message, _ in rows]
+    vectors = await asyncio.get_running_loop().run_in_executor(None, vector_memory.embedder.embed_many, texts)
+    for (message, line), text, vector in zip(rows, texts, vectors):
+        vector_memory.add(conversation_id, message["id"], line, text, vector)
+    vector_memory_writer.schedule()
+
+def content_fingerprint(text: str) -> str:
+    normalized = " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+class ConversationContextWindow:
+    """Prompt context of one conversation: recent turns verbatim plus a running summary of older ones.
+
+    Finished messages are ingested as pre-rendered speaker lines. Turns beyond
+    CONTEXT_WINDOW_SIZE or the token cap are folded out of the verbatim part and
+    later compressed into the running summary in the background; repeated
+    content is dropped on the way in. Rendering never reads the database.
+    """
+    def __init__(self, conversation_id: str, size: int, max_tokens: int):
+        self.conversation_id = conversation_id
+        self.size = size
+        self.max_tokens = max_tokens
+        self.entries = deque()  # (message_id, line, tokens)
+        self.ids = set()
+        self.tokens = 0
+        self.seen: "OrderedDict[str, None]" = OrderedDict()
+        self.summary = ""
+        self.folded: List[str] = []
+        self.folded_tokens = 0
+        self.refresher: Optional[asyncio.Task] = None
+        self.cursor: Optional[dict] = None  # newest message read from storage, where catch_up continues
+        self.users = 0
+        self.loaded = False
+        self.lock = asyncio.Lock()
+
+    def ingest(self, message: dict) -> bool:
+        """Add a finished message; returns False when it was a duplicate"""
+        content = (message.get("content") or "").strip()
+        if not content or message.get("id") in self.ids:
+            return False
+        fingerprint = content_fingerprint(content)
+        if fingerprint in self.seen:
+            return False
+        self.seen[fingerprint] = None
+        if len(self.seen) > CONTEXT_SEEN_FINGERPRINTS:
+            self.seen.popitem(last=False)
+        line = f"{speaker_label(message)}: {clip_text(content, CONTEXT_TURN_MAX_TOKENS)}"
+        tokens = estimate_tokens(line)
+        self.entries.append((message.get("id"), line, tokens))
+        self.ids.add(message.get("id"))
+        self.tokens += tokens
+        self._fold()
+        return True
+
+    def _fold(self):
+        while len(self.entries) > self.size or (self.tokens > self.max_tokens and len(self.entries) > 1):
+            message_id, line, tokens = self.entries.popleft()
+            self.ids.discard(message_id)
+            self.tokens -= tokens
+            self.folded.append(line)
+            self.folded_tokens += tokens
+        # If summarizing keeps failing, forget the oldest folded turns rather than growing forever
+        while self.folded_tokens > 4 * CONTEXT_FOLD_TOKENS and len(self.folded) > 1:
+            self.folded_tokens -= estimate_tokens(self.folded.pop(0))
+
+    def seed(self, messages: List[dict], summary: str = ""):
+        """Fill in history loaded from storage; lines ingested while it loaded stay the newest"""
+        ingested = list(self.entries)
+        self.entries.clear()
+        self.ids.clear()
+        self.tokens = 0
+        for message in messages:
+            finished = message.get("streaming_status") not in (StreamingStatus.STARTED.value, StreamingStatus.STREAMING.value)
+            if finished and not is_error_message(message):
+                self.ingest(message)
+        if messages:
+            self.cursor = messages[-1]
+        for message_id, line, tokens in ingested:
+            if message_id not in self.ids:
+                self.entries.append((message_id, line, tokens))
+                self.ids.add(message_id)
+                self.tokens += tokens
+        self._fold()
+        if summary and not self.summary:
+            self.summary = clip_text(summary, CONTEXT_SUMMARY_MAX_TOKENS)
+        self.loaded = True
+
+    def render(self, budget: int, recalled: Optional[List[str]] = None) -> str:
+        """Context for one prompt: the running summary, recalled earlier turns, then as many recent turns as fit"""
+        parts = []
+        remaining = budget
+        if self.summary:
+            summary_block = f"\n\nEarlier discussion (summary):\n{self.summary}\n"
+            parts.append(summary_block)
+            remaining -= estimate_tokens(summary_block)
+        if recalled:
+            recalled_block = "\n\nRelevant earlier points:\n" + "\n".join(recalled) + "\n"
+            parts.append(recalled_block)
+            remaining -= estimate_tokens(recalled_block)
+        recent_header = "\n\nRecent conversation:\n"
+        remaining -= estimate_tokens(recent_header)
+        lines = []
+        for _, line, tokens in reversed(self.entries):
+            # One more token per line pays for the newline joining it
+            if tokens + 1 > remaining:
+                if not lines and remaining > 2:
+                    # Always show the latest turn, clipped to whatever the budget has left
+                    lines.append(clip_text(line, remaining - 2))
+                break
+            lines.append(line)
+            remaining -= tokens + 1
+        if lines:
+            parts.append(recent_header + "\n".join(reversed(lines)) + "\n")
+        return "".join(parts)
+
+class ContextWindowRegistry:
+    """Context windows of the conversations currently generating, with background summary refresh"""
+    def __init__(self, size: int, max_conversations: int):
+        self.size = size
+        self.max_conversations = max_conversations
+        self.windows: "OrderedDict[str, ConversationContextWindow]" = OrderedDict()
+        self.backfills: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            "contexts_built": 0,
+            "context_tokens": 0,
+            "duplicates_dropped": 0,
+            "caught_up": 0,
+            "summary_refreshes": 0,
+            "summary_errors": 0
+        }
+
+    async def _load(self, conversation_id: str, window: ConversationContextWindow):
+        if vector_memory is not None and not len(vector_memory.memory(conversation_id)) and conversation_id not in self.backfills:
+            # Conversations from before semantic memory existed are embedded once, on first use, in the background
+            task = self.backfills[conversation_id] = asyncio.create_task(backfill_vector_memory(conversation_id))
+            task.add_done_callback(lambda done: self._backfill_done(conversation_id, done))
+        messages = await fetch_recent_messages(conversation_id, self.size)
+        summary = ""
+        stored = await get_latest_summary(conversation_id)
+        if stored and stored.get("watermark") and messages:
+            # A stored summary only helps when it ends before the verbatim turns start
+            try:
+                watermark = decode_message_cursor(stored["watermark"])
+                if watermark < (messages[0]["timestamp"], messages[0]["id"]):
+                    summary = stored.get("summary") or ""
+            except (ValueError, TypeError):
+                pass
+        window.seed(messages, summary)
+
+    async def catch_up(self, window: ConversationContextWindow):
+        """Fold in finished messages other processes stored since the window last read storage.
+
+        A dedicated worker never sees the user messages the API processes save,
+        so they are picked up here before each turn, into the window and into
+        semantic memory. Turns this process already ingested come back too and
+        are dropped as duplicates.
+        """
+        if isinstance(storage, CachedStorage) and not (cache_watcher and cache_watcher.state == "watching"):
+            # Without a change stream the cache cannot see what other processes wrote
+            storage.invalidate(window.conversation_id)
+        after = encode_message_cursor(window.cursor) if window.cursor else None
+        async for message in iter_conversation_messages(window.conversation_id, after=after):
+            window.cursor = message
+            if message.get("streaming_status") in (StreamingStatus.STARTED.value, StreamingStatus.STREAMING.value):
+                continue
+            if not is_error_message(message) and window.ingest(message):
+                self.stats["caught_up"] += 1
+            remember_message(message)
+
+    def _backfill_done(self, conversation_id: str, task: asyncio.Task):
+        self.backfills.pop(conversation_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Vector memory backfill failed for {conversation_id}: {task.exception()}")
+
+    async def acquire(self, conversation_id: str) -> ConversationContextWindow:
+        window = self.windows.get(conversation_id)
+        if window is None:
+            # Registered before loading so messages finishing meanwhile are not lost
+            window = self.windows[conversation_id] = ConversationContextWindow(conversation_id, self.size, CONTEXT_TOKEN_BUDGET)
+            idle = [cid for cid, candidate in self.windows.items() if not candidate.users and cid != conversation_id]
+            for cid in idle[:max(0, len(self.windows) - self.max_conversations)]:
+                del self.windows[cid]
+        self.windows.move_to_end(conversation_id)
+        window.users += 1
+        if not window.loaded:
+            async with window.lock:
+                if not window.loaded:
+                    await self._load(conversation_id, window)
+        return window
+
+    def release(self, conversation_id: str):
+        window = self.windows.get(conversation_id)
+        if window is not None:
+            window.users -= 1
+            if window.users <= 0 and not (window.refresher and not window.refresher.done()):
+                del self.windows[conversation_id]
+
+    def recall(self, window: ConversationContextWindow, budget: int) -> List[str]:
+        """Earlier turns most similar to the latest ones, excluding what is already verbatim"""
+        if vector_memory is None or not window.entries:
+            return []
+        query = " ".join(line for _, line, _ in list(window.entries)[-2:])
+        recalled, remaining = [], int(budget * VECTOR_MEMORY_BUDGET_SHARE)
+        for _, line, _ in vector_memory.recall(window.conversation_id, query, VECTOR_MEMORY_TOP_K, window.ids, VECTOR_MEMORY_MIN_SCORE):
+            tokens = estimate_tokens(line)
+            if tokens > remaining:
+                break
+            recalled.append(line)
+            remaining -= tokens
+        return recalled
+
+    def render(self, window: ConversationContextWindow, model: str) -> str:
+        budget = context_budget(model)
+        context = window.render(budget, self.recall(window, budget))
+        self.stats["contexts_built"] += 1
+        self.stats["context_tokens"] += estimate_tokens(context)
+        return context
+
+    def ingest(self, message: dict):
+        window = self.windows.get(message["conversation_id"])
+        if window is None or is_error_message(message):
+            return
+        if not window.ingest(message) and (message.get("content") or "").strip():
+            self.stats["duplicates_dropped"] += 1
+        if window.folded_tokens >= CONTEXT_FOLD_TOKENS and (window.refresher is None or window.refresher.done()):
+            window.refresher = asyncio.create_task(self._refresh_summary(message["conversation_id"], window))
+
+    async def _refresh_summary(self, conversation_id: str, window: ConversationContextWindow):
+        folded = list(window.folded)
+        prompt = f"""
+    Update the running summary of a multi-agent discussion with the new turns below.
+    Keep decisions, open questions and each agent's current position; drop repetition.
+    Reply with the updated summary only, at most {CONTEXT_SUMMARY_MAX_TOKENS * 3 // 4} words.
+
+    Current summary:
+    {window.summary or "(none yet)"}
+
+    New turns:
+    {chr(10).join(folded)}
+    """
+        try:
+            response = await call_together_ai_enhanced(prompt, SUMMARY_MODEL, max_tokens=CONTEXT_SUMMARY_MAX_TOKENS, conversation_id=conversation_id)
+            if not response or response.startswith("Error") or response == "No response generated":
+                raise RuntimeError(response)
+            window.summary = clip_text(response.strip(), CONTEXT_SUMMARY_MAX_TOKENS)
+            # Turns folded while the call ran stay queued for the next refresh
+            consumed = 0
+            while consumed < len(folded) and window.folded and window.folded[0] == folded[consumed]:
+                window.folded.pop(0)
+                consumed += 1
+            window.folded_tokens = sum(estimate_tokens(line) for line in window.folded)
+            self.stats["summary_refreshes"] += 1
+        except Exception as e:
+            self.stats["summary_errors"] += 1
+            logger.error(f"Context summary refresh failed for {conversation_id}: {e}")
+        finally:
+            if window.users <= 0 and self.windows.get(conversation_id) is window:
+                del self.windows[conversation_id]
+
+context_windows = ContextWindowRegistry(CONTEXT_WINDOW_SIZE, CONTEXT_WINDOW_MAX_CONVERSATIONS)
+
+def record_message_completion(message: dict):
+    """Fold a finished message into the prompt context, semantic memory, the conversation counters and the agent rollups"""
+    context_windows.ingest(message)
+    remember_message(message)
+    conversation_metrics.record(message["conversation_id"], message.get("response_time"), message.get("token_count"))
+    agent_type = message.get("agent_type")
+    if agent_type and not message.get("is_user"):
+        agent_type = getattr(agent_type, "value", agent_type)
+        agent_rollups.record(
+            agent_type,
+            AGENT_MODELS.get(agent_type, {}).get("model", "unknown"),
+            datetime.utcnow(),
+            message.get("response_time"),
+            message.get("token_count"),
+            is_error_message(message)
+        )
+
+# Per-attempt LLM call event log (time-series collection, capped fallback)
+LLM_EVENT_BUFFER_SIZE = int(os.environ.get('LLM_EVENT_BUFFER_SIZE', '10000'))
+LLM_EVENT_BATCH_SIZE = int(os.environ.get('LLM_EVENT_BATCH_SIZE', '500'))
+LLM_EVENT_FLUSH_MS = int(os.environ.get('LLM_EVENT_FLUSH_MS', '1000'))
+LLM_EVENT_RETENTION_SECONDS = int(os.environ.get('LLM_EVENT_RETENTION_SECONDS', str(7 * 24 * 3600)))
+LLM_EVENT_CAPPED_BYTES = int(os.environ.get('LLM_EVENT_CAPPED_BYTES', str(256 * 1024 * 1024)))
+LLM_EVENT_PERCENTILE_SAMPLE = int(os.environ.get('LLM_EVENT_PERCENTILE_SAMPLE', '20000'))  # events sampled for percentiles before MongoDB 7.0
+
+class LLMEventLogger:
+    """Appends one compact record per LLM attempt without ever blocking the caller.
+
+    Events go into a bounded in-memory buffer that a background task drains with
+    insert_many; when the buffer is full new events are dropped and counted.
+    """
+    def __init__(self, database, collection: str, buffer_size: int, batch_size: int, flush_ms: int, enabled: bool = True):
+        self.db = database
+        self.collection = collection
+        self.enabled = enabled
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.interval = flush_ms / 1000
+        self.buffer: List[dict] = []
+        self.flusher: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        self.storage = "unknown"
+        self.native_percentile: Optional[bool] = None  # unknown until the first percentile query
+        self.stats = {
+            "logged": 0,
+            "written": 0,
+            "dropped": 0,
+            "write_errors": 0
+        }
+
+    async def ensure_collection(self):
+        """Create the event collection as time-series, or capped on servers without time-series support"""
+        existing = await self.db.list_collection_names(filter={"name": self.collection})
+        if existing:
+            options = (await self.db[self.collection].options()) or {}
+            self.storage = "timeseries" if "timeseries" in options else "capped" if options.get("capped") else "plain"
+            return
+        try:
+            await self.db.create_collection(
+                self.collection,
+                timeseries={"timeField": "ts", "metaField": "meta", "granularity": "seconds"},
+                expireAfterSeconds=LLM_EVENT_RETENTION_SECONDS
+            )
+            self.storage = "timeseries"
+        except Exception as e:
+            logger.warning(f"Time-series collections unavailable ({e}); using a capped collection for {self.collection}")
+            await self.db.create_collection(self.collection, capped=True, size=LLM_EVENT_CAPPED_BYTES)
+            await self.db[self.collection].create_index([("ts", -1)])
+            self.storage = "capped"
+
+    def log(self, key_id: str, model: str, attempt: int, duration: float, status_code: Optional[int] = None,
+            ttft: Optional[float] = None, tokens: Optional[int] = None, error: Optional[BaseException] = None,
+            conversation_id: Optional[str] = None, stream: bool = False):
+        if not self.enabled:
+            return
+        self.stats["logged"] += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.stats["dropped"] += 1
+            return
+        self.buffer.append({
+            "ts": datetime.utcnow(),
+            "meta": {"key_id": key_id, "model": model},
+            "attempt": attempt,
+            "status_code": status_code,
+            "ttft": ttft,
+            "duration": duration,
+            "tokens": tokens,
+            "error_class": type(error).__name__ if error else None,
+            "conversation_id": conversation_id,
+            "stream": stream
+        })
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self._run())
+
+    async def flush(self):
+        async with self.lock:
+            while self.buffer:
+                batch, self.buffer = self.buffer[:self.batch_size], self.buffer[self.batch_size:]
+                try:
+                    await self.db[self.collection].insert_many(batch, ordered=False)
+                    self.stats["written"] += len(batch)
+                except Exception as e:
+                    self.stats["write_errors"] += 1
+                    self.stats["dropped"] += len(batch)
+                    logger.error(f"Failed to write {len(batch)} LLM events: {e}")
+
+    async def _run(self):
+        while self.buffer:
+            await asyncio.sleep(self.interval)
+            await asyncio.shield(self.flush())
+
+    async def shutdown(self):
+        if self.flusher and not self.flusher.done():
+            self.flusher.cancel()
+        await self.flush()
+
+    async def _latency_percentiles(self, match: dict, group_key: str) -> Dict[str, Dict[str, Any]]:
+        """p50/p90/p99 of duration and ttft per group, computed on the server"""
+        quantiles = [0.5, 0.9, 0.99]
+        if self.native_percentile is not False:
+            try:
+                rows = await self.db[self.collection].aggregate([
+                    {"$match": match},
+                    {"$group": {
+                        "_id": group_key,
+                        "duration": {"$percentile": {"input": "$duration", "p": quantiles, "method": "approximate"}},
+                        "ttft": {"$percentile": {"input": "$ttft", "p": quantiles, "method": "approximate"}}
+                    }}
+                ]).to_list(None)
+                self.native_percentile = True
+                return {row["_id"]: {"duration": row["duration"], "ttft": row["ttft"]} for row in rows}
+            except OperationFailure:
+                # $percentile needs MongoDB 7.0; older servers get percentiles of a bounded random sample
+                self.native_percentile = False
+        rows = await self.db[self.collection].aggregate([
+            {"$match": match},
+            {"$sample": {"size": LLM_EVENT_PERCENTILE_SAMPLE}},
+            {"$group": {"_id": group_key, "duration": {"$push": "$duration"}, "ttft": {"$push": "$ttft"}}}
+        ]).to_list(None)
+        result = {}
+        for row in rows:
+            values = {}
+            for field in ("duration", "ttft"):
+                samples = np.asarray([value for value in row[field] if value is not None], dtype=np.float64)
+                values[field] = np.percentile(samples, [q * 100 for q in quantiles]).tolist() if len(samples) else [None] * 3
+            result[row["_id"]] = values
+        return result
+
+    async def window_stats(self, window_seconds: int, group_by: str = "model") -> List[Dict[str, Any]]:
+        """Latency percentiles, error rate and error classes per model or key over a trailing window"""
+        match = {"ts": {"$gte": datetime.utcnow() - timedelta(seconds=window_seconds)}}
+        group_field = "key_id" if group_by == "key" else "model"
+        group_key = f"$meta.{group_field}"
+        groups: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"attempts": 0, "errors": {}, "tokens": 0})
+        rows = await self.db[self.collection].aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": {"group": group_key, "error_class": "$error_class"},
+                "attempts": {"$sum": 1},
+                "tokens": {"$sum": {"$ifNull": ["$tokens", 0]}}
+            }}
+        ]).to_list(None)
+        for row in rows:
+            group = groups[row["_id"]["group"]]
+            group["attempts"] += row["attempts"]
+            group["tokens"] += row["tokens"]
+            error_class = row["_id"].get("error_class")
+            if error_class:
+                group["errors"][error_class] = row["attempts"]
+        latencies = await self._latency_percentiles(match, group_key) if groups else {}
+
+        def percentiles(values: Optional[list]) -> Optional[Dict[str, float]]:
+            if not values or values[0] is None:
+                return None
+            p50, p90, p99 = values
+            return {"p50": round(float(p50), 4), "p90": round(float(p90), 4), "p99": round(float(p99), 4)}
+
+        report = []
+        for name, group in sorted(groups.items()):
+            error_count = sum(group["errors"].values())
+            latency = latencies.get(name, {})
+            report.append({
+                group_field: name,
+                "attempts": group["attempts"],
+                "errors": error_count,
+                "error_rate": error_count / group["attempts"] if group["attempts"] else 0.0,
+                "error_classes": group["errors"],
+                "duration": percentiles(latency.get("duration")),
+                "ttft": percentiles(latency.get("ttft")),
+                "tokens": group["tokens"]
+            })
+        return report
+
+llm_events = LLMEventLogger(db, "llm_events", LLM_EVENT_BUFFER_SIZE, LLM_EVENT_BATCH_SIZE, LLM_EVENT_FLUSH_MS,
+                            enabled=MONGO_FEATURES)
+
 # Enhanced Key Pool Management with performance tracking
 def get_next_available_key():
     """Get the next available API key using intelligent routing with performance tracking"""
@@ -359,6 +1854,8 @@ async def call_together_ai_stream_enhanced(prompt: str, model: str, conversation
     for attempt in range(max_retries):
         key_info = get_next_available_key()
         start_time = time.time()
+        first_chunk_time = None
+        status_code = None
         
         headers = {
             "Authorization": f"Bearer {key_info['apiKey']}",
@@ -387,9 +1884,12 @@ async def call_together_ai_stream_enhanced(prompt: str, model: str, conversation
             async with httpx.AsyncClient(timeout=30.0) as client:
                 async with client.stream('POST', "https://api.together.xyz/v1/chat/completions", 
                                        headers=headers, json=payload) as response:
+                    status_code = response.status_code
                     response.raise_for_status()
                     
                     chunk_count = 0
+                    streamed = []
+                    usage = None
                     async for line in response.aiter_lines():
                         if line.strip():
                             if line.startswith('data: '):
@@ -398,10 +1898,15 @@ async def call_together_ai_stream_enhanced(prompt: str, model: str, conversation
                                     break
                                 try:
                                     data = json.loads(data_str)
+                                    # The provider reports usage on the final chunk
+                                    usage = data.get('usage') or usage
                                     if 'choices' in data and len(data['choices']) > 0:
                                         delta = data['choices'][0].get('delta', {})
                                         if 'content' in delta:
                                             chunk_count += 1
+                                            streamed.append(delta['content'] or "")
+                                            if first_chunk_time is None:
+                                                first_chunk_time = time.time()
                                             await manager.send_to_conversation(json.dumps({
                                                 "type": "streaming_chunk",
                                                 "data": {
@@ -417,6 +1922,12 @@ async def call_together_ai_stream_enhanced(prompt: str, model: str, conversation
                     # Update performance metrics
                     response_time = time.time() - start_time
                     update_key_performance(key_info, response_time, True)
+                    llm_events.log(
+                        key_info["keyId"], model, attempt + 1, response_time, status_code=status_code,
+                        ttft=first_chunk_time - start_time if first_chunk_time else None,
+                        tokens=(usage or {}).get("completion_tokens") or estimate_tokens("".join(streamed)),
+                        conversation_id=conversation_id, stream=True
+                    )
                     
                     # Send completion status
                     await manager.send_to_conversation(json.dumps({
@@ -433,6 +1944,11 @@ async def call_together_ai_stream_enhanced(prompt: str, model: str, conversation
         except Exception as e:
             response_time = time.time() - start_time
             update_key_performance(key_info, response_time, False)
+            llm_events.log(
+                key_info["keyId"], model, attempt + 1, response_time, status_code=status_code,
+                ttft=first_chunk_time - start_time if first_chunk_time else None,
+                error=e, conversation_id=conversation_id, stream=True
+            )
             logger.error(f"Streaming attempt {attempt + 1} failed: {e}")
             
             if attempt == max_retries - 1:
@@ -454,14 +1970,16 @@ async def call_together_ai_enhanced(prompt: str, model: str, max_tokens: int = 1
     # If streaming is requested and it's not an image model, use the enhanced streaming function
     if stream and "FLUX" not in model and conversation_id:
         content_chunks = []
-        async for chunk in call_together_ai_stream_enhanced(prompt, model, conversation_id, max_tokens, max_retries):
-            content_chunks.append(chunk)
+        async with contextlib.aclosing(call_together_ai_stream_enhanced(prompt, model, conversation_id, max_tokens, max_retries)) as stream:
+            async for chunk in stream:
+                content_chunks.append(chunk)
         return ''.join(content_chunks)
     
     # Non-streaming implementation with retry logic
     for attempt in range(max_retries):
         key_info = get_next_available_key()
         start_time = time.time()
+        status_code = None
         
         headers = {
             "Authorization": f"Bearer {key_info['apiKey']}",
@@ -491,11 +2009,16 @@ async def call_together_ai_enhanced(prompt: str, model: str, max_tokens: int = 1
             
             async with httpx.AsyncClient(timeout=30.0) as client:
                 response = await client.post(url, headers=headers, json=payload)
+                status_code = response.status_code
                 response.raise_for_status()
                 
                 result = response.json()
                 response_time = time.time() - start_time
                 update_key_performance(key_info, response_time, True)
+                llm_events.log(
+                    key_info["keyId"], model, attempt + 1, response_time, status_code=status_code,
+                    tokens=(result.get("usage") or {}).get("completion_tokens"), conversation_id=conversation_id
+                )
                 
                 if "FLUX" in model:
                     if "data" in result and len(result["data"]) > 0:
@@ -509,6 +2032,10 @@ async def call_together_ai_enhanced(prompt: str, model: str, max_tokens: int = 1
         except Exception as e:
             response_time = time.time() - start_time
             update_key_performance(key_info, response_time, False)
+            llm_events.log(
+                key_info["keyId"], model, attempt + 1, response_time, status_code=status_code,
+                error=e, conversation_id=conversation_id
+            )
             logger.error(f"API call attempt {attempt + 1} failed: {e}")
             
             if attempt == max_retries - 1:
@@ -548,7 +2075,7 @@ async def generate_agent_response_enhanced_stream(agent_type: AgentType, convers
     # Save initial message to database
     message_dict = chat_message.dict()
     message_dict["timestamp"] = message_dict["timestamp"].isoformat()
-    await db.messages.insert_one(message_dict)
+    await save_message(message_dict)
     
     # Remove MongoDB _id for broadcasting
     if "_id" in message_dict:
@@ -569,41 +2096,53 @@ async def generate_agent_response_enhanced_stream(agent_type: AgentType, convers
     
     # Stream the response
     try:
-        async for chunk in call_together_ai_stream_enhanced(prompt, agent_config['model'], conversation_id):
-            if not chunk.startswith("Error:"):
-                complete_content += chunk
-                token_count += len(chunk.split())
+        # aclosing: a cancelled turn closes the HTTP stream now rather than whenever the generator is collected
+        async with contextlib.aclosing(call_together_ai_stream_enhanced(prompt, agent_config['model'], conversation_id)) as stream:
+            async for chunk in stream:
+                if not chunk.startswith("Error:"):
+                    complete_content += chunk
+                    token_count += len(chunk.split())
                 
-                # Broadcast each chunk via WebSocket
-                streaming_data = message_dict.copy()
-                streaming_data["content"] = complete_content
-                streaming_data["agent_config"] = agent_config
-                streaming_data["streaming_status"] = "streaming"
-                streaming_data["token_count"] = token_count
+                    # Broadcast each chunk via WebSocket
+                    streaming_data = message_dict.copy()
+                    streaming_data["content"] = complete_content
+                    streaming_data["agent_config"] = agent_config
+                    streaming_data["streaming_status"] = "streaming"
+                    streaming_data["token_count"] = token_count
                 
-                await manager.send_to_conversation(json.dumps({
-                    "type": "agent_message_stream",
-                    "data": streaming_data
-                }), conversation_id)
+                    message_checkpoints.checkpoint(conversation_id, chat_message.id, {
+                        "content": complete_content,
+                        "streaming_status": "streaming",
+                        "token_count": token_count
+                    })
                 
-                # Small delay to make streaming visible
-                await asyncio.sleep(0.03)
-            else:
-                complete_content = chunk  # Error message
-                break
+                    await manager.send_to_conversation(json.dumps({
+                        "type": "agent_message_stream",
+                        "data": streaming_data
+                    }), conversation_id)
+                
+                    # Small delay to make streaming visible
+                    await asyncio.sleep(0.03)
+                else:
+                    complete_content = chunk  # Error message
+                    break
     
         response_time = time.time() - start_time
         
         # Update the database with final content
-        await db.messages.update_one(
-            {"id": chat_message.id},
-            {"$set": {
-                "content": complete_content,
-                "streaming_status": "completed",
-                "response_time": response_time,
-                "token_count": token_count
-            }}
-        )
+        await message_checkpoints.complete(conversation_id, chat_message.id, {
+            "content": complete_content,
+            "streaming_status": "completed",
+            "response_time": response_time,
+            "token_count": token_count
+        })
+        record_message_completion({
+            **message_dict,
+            "content": complete_content,
+            "streaming_status": "completed",
+            "response_time": response_time,
+            "token_count": token_count
+        })
         
         # Send final message
         final_data = message_dict.copy()
@@ -618,17 +2157,22 @@ async def generate_agent_response_enhanced_stream(agent_type: AgentType, convers
             "data": final_data
         }), conversation_id)
         
+    except asyncio.CancelledError:
+        # Paused or cancelled mid-stream: leaving the stream closed the HTTP request, keep what arrived
+        await message_checkpoints.complete(conversation_id, chat_message.id, {
+            "content": f"{complete_content} [stopped]".strip(),
+            "streaming_status": "error"
+        })
+        raise
     except Exception as e:
         logger.error(f"Error in enhanced streaming for {agent_type}: {e}")
         error_content = f"Error generating response: {str(e)}"
         
-        await db.messages.update_one(
-            {"id": chat_message.id},
-            {"$set": {
-                "content": error_content,
-                "streaming_status": "error"
-            }}
-        )
+        await message_checkpoints.complete(conversation_id, chat_message.id, {
+            "content": error_content,
+            "streaming_status": "error"
+        })
+        record_message_completion({**message_dict, "content": error_content, "streaming_status": "error"})
     
     return complete_content
 
@@ -657,7 +2201,7 @@ async def system_health():
     """Get system health and performance metrics"""
     try:
         # Check database connection
-        await client.admin.command('ping')
+        await storage.ping()
         db_status = "healthy"
     except Exception as e:
         db_status = f"error: {str(e)}"
@@ -670,6 +2214,7 @@ async def system_health():
     return {
         "status": "healthy" if db_status == "healthy" else "degraded",
         "database": db_status,
+        "storage_backend": storage.name,
         "api_keys": {
             "active": active_keys,
             "total": len(API_KEYS_POOL),
@@ -678,18 +2223,202 @@ async def system_health():
             "error_rate": (total_errors / max(total_requests, 1)) * 100
         },
         "websocket_connections": manager.connection_stats,
+        "indexes": {
+            "state": index_manager.status["state"],
+            "failed": index_manager.status["failed"],
+            "collection_scans": index_manager.status["collection_scans"]
+        },
+        "stream_checkpoints": {
+            "pending": len(message_checkpoints.pending),
+            "interval_ms": STREAM_CHECKPOINT_INTERVAL_MS,
+            **message_checkpoints.stats
+        },
+        "llm_events": {
+            "storage": llm_events.storage,
+            "buffered": len(llm_events.buffer),
+            **llm_events.stats
+        },
+        "agent_rollups": {
+            "pending": len(agent_rollups.pending),
+            **agent_rollups.stats
+        },
+        "conversation_metrics": {
+            "pending": len(conversation_metrics.pending),
+            **conversation_metrics.stats
+        },
+        "conversation_cache": {
+            "entries": len(storage.entries),
+            "max_entries": storage.max_entries,
+            "watcher": cache_watcher.state if cache_watcher else "disabled",
+            **storage.stats
+        } if isinstance(storage, CachedStorage) else {"state": "disabled"},
+        "prompt_context": {
+            "windows": len(context_windows.windows),
+            "avg_context_tokens": context_windows.stats["context_tokens"] / max(context_windows.stats["contexts_built"], 1),
+            **context_windows.stats
+        },
+        "vector_memory": {
+            "loaded_conversations": len(vector_memory.memories),
+            "backfills_running": len(context_windows.backfills),
+            **vector_memory.stats,
+            **{f"writer_{key}": value for key, value in vector_memory_writer.stats.items()}
+        } if vector_memory else {"state": "disabled"},
+        "consensus": consensus_stats,
+        "turn_scheduler": {
+            "capacity": turn_scheduler.capacity,
+            "running": turn_scheduler.running,
+            "queued": turn_scheduler.queued(),
+            **turn_scheduler.stats
+        },
+        "job_queue": {
+            "queue": collaboration_jobs.name,
+            "worker_mode": COLLABORATION_WORKER_MODE,
+            "running_here": len(collaboration_worker.tasks),
+            **collaboration_worker.stats
+        },
+        "event_relay": {
+            "state": event_relay.state,
+            **event_relay.stats
+        } if COLLABORATION_WORKER_MODE == "external" else {"state": "disabled"},
+        "long_polling": {
+            "parked": change_notifier.parked,
+            "max_parked": change_notifier.max_parked,
+            **change_notifier.stats
+        },
         "timestamp": datetime.utcnow().isoformat()
     }
 
+# Fair sharing of LLM capacity: every agent turn takes a slot from the weighted fair scheduler
+SCHEDULER_CAPACITY = int(os.environ.get('SCHEDULER_CAPACITY', str(2 * len(API_KEYS_POOL))))  # concurrent turns per process
+SCHEDULER_TURN_OUTPUT_TOKENS = int(os.environ.get('SCHEDULER_TURN_OUTPUT_TOKENS', '200'))  # expected reply size
+# {"tenant": {"weight": 2, "tokens_per_minute": 20000, "max_concurrent": 4, "api_keys": ["..."]}}; "*" sets the default policy
+SCHEDULER_TENANTS = json.loads(os.environ.get('SCHEDULER_TENANTS', '{}'))
+SCHEDULER_MAX_IDLE_TENANTS = int(os.environ.get('SCHEDULER_MAX_IDLE_TENANTS', '1000'))
+
+tenant_policies = parse_tenant_policies(SCHEDULER_TENANTS)
+tenant_keys = parse_tenant_keys(SCHEDULER_TENANTS)
+turn_scheduler = FairTurnScheduler(SCHEDULER_CAPACITY, tenant_policies, tenant_policies.pop("*", None), SCHEDULER_MAX_IDLE_TENANTS)
+
+def caller_tenant(x_api_key: Optional[str] = Header(None)) -> Optional[str]:
+    """Tenant whose quota the caller draws on, from its API key; unknown or missing keys get the default policy"""
+    return tenant_keys.get(x_api_key) if x_api_key else None
+
+def turn_estimate(context: str) -> int:
+    return estimate_tokens(context) + SCHEDULER_TURN_OUTPUT_TOKENS
+
+def turn_usage(context: str, response: Optional[str]) -> int:
+    return estimate_tokens(context) + estimate_tokens(response or "")
+
+# Consensus detection: embedding agreement between the agents' latest positions, a judge model only when ambiguous
+CONSENSUS_MIN_ROUNDS = int(os.environ.get('CONSENSUS_MIN_ROUNDS', '2'))  # earliest round that may conclude
+CONSENSUS_SIMILARITY_FLOOR = float(os.environ.get('CONSENSUS_SIMILARITY_FLOOR', '0.1'))
+CONSENSUS_SIMILARITY_CEILING = float(os.environ.get('CONSENSUS_SIMILARITY_CEILING', '0.6'))
+CONSENSUS_AMBIGUITY_MARGIN = float(os.environ.get('CONSENSUS_AMBIGUITY_MARGIN', '0.3'))
+CONSENSUS_JUDGE_MODEL = os.environ.get('CONSENSUS_JUDGE_MODEL', 'meta-llama/Llama-3.3-70B-Instruct-Turbo-Free')
+CONSENSUS_JUDGE_MAX_TOKENS = 200
+
+consensus_engine = ConsensusEngine(
+    HashingEmbedder(VECTOR_MEMORY_DIM), CONSENSUS_SIMILARITY_FLOOR, CONSENSUS_SIMILARITY_CEILING, CONSENSUS_AMBIGUITY_MARGIN
+)
+consensus_stats = {"checks": 0, "reached": 0, "judge_calls": 0, "judge_errors": 0}
+
+def parse_judge_verdict(response: str) -> Optional[dict]:
+    """Last JSON object in the judge's reply that carries an "agree" field"""
+    for candidate in reversed(re.findall(r"\{[^{}]*\}", response or "")):
+        try:
+            verdict = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(verdict, dict) and "agree" in verdict:
+            return verdict
+    return None
+
+async def judge_consensus(conversation_id: str, topic: str, positions: Dict[str, str]) -> Optional[dict]:
+    listing = "\n".join(f"- {AGENT_MODELS[agent]['name']}: {clip_text(text, CONTEXT_TURN_MAX_TOKENS)}" for agent, text in positions.items())
+    prompt = f"""
+    Several agents are discussing: {topic}
+
+    Their latest positions:
+    {listing}
+
+    Do they substantively agree on a shared answer? Reply with JSON only:
+    {{"agree": true or false, "confidence": 0.0 to 1.0, "final_answer": "the shared answer in one or two sentences", "reasoning": "one sentence"}}
+    """
+    consensus_stats["judge_calls"] += 1
+    response = await call_together_ai_enhanced(prompt, CONSENSUS_JUDGE_MODEL, max_tokens=CONSENSUS_JUDGE_MAX_TOKENS, conversation_id=conversation_id)
+    verdict = parse_judge_verdict(response)
+    if verdict is None:
+        consensus_stats["judge_errors"] += 1
+        logger.warning(f"Unusable consensus verdict for {conversation_id}: {(response or '')[:200]}")
+    return verdict
+
+async def assess_consensus(conversation_id: str, topic: str, round_number: int, positions: Dict[str, str],
+                           previous: Optional[Dict[str, str]], threshold: float) -> tuple:
+    """Score one round's positions; returns the ConsensusStatus and the per-round record to store"""
+    consensus_stats["checks"] += 1
+    score = consensus_engine.score(positions, previous)
+    record = {"round": round_number, "assessed_at": datetime.utcnow(), "threshold": threshold, "method": "similarity", "judge": None}
+    if score is None:
+        record.update({"decision": NOT_REACHED, "agreement": None})
+        return ConsensusStatus(reached=False, confidence=0.0, reasoning="Fewer than two agent positions to compare"), record
+    record.update(score)
+    representative = score["representative"]
+    status = ConsensusStatus(
+        reached=False,
+        confidence=score["agreement"],
+        final_answer=f"{AGENT_MODELS[representative]['name']}: {clip_text(positions[representative], CONTEXT_TURN_MAX_TOKENS)}",
+        reasoning=f"Mean agreement {score['agreement']:.2f} across {len(score['agents'])} agents (weakest pair {score['weakest_pair']:.2f})"
+    )
+    decision = consensus_engine.decide(score["agreement"], threshold)
+    if round_number < CONSENSUS_MIN_ROUNDS:
+        decision, record["method"] = NOT_REACHED, "min_rounds"
+    elif decision == AMBIGUOUS:
+        record["method"] = "judge"
+        verdict = await judge_consensus(conversation_id, topic, {agent: positions[agent] for agent in score["agents"]})
+        record["judge"] = verdict
+        decision = NOT_REACHED
+        if verdict is not None:
+            try:
+                confidence = min(max(float(verdict.get("confidence", score["agreement"])), 0.0), 1.0)
+            except (TypeError, ValueError):
+                confidence = score["agreement"]
+            status.confidence = confidence
+            status.reasoning = str(verdict.get("reasoning") or status.reasoning)
+            if verdict.get("agree") is True and confidence >= threshold:
+                decision = REACHED
+                status.final_answer = str(verdict.get("final_answer") or status.final_answer)
+    status.reached = decision == REACHED
+    record["decision"] = decision
+    record["confidence"] = status.confidence
+    if status.reached:
+        consensus_stats["reached"] += 1
+    return status, record
+
+# Stagnation detection: share of never-seen word 3-grams in each finished turn
+NOVELTY_THRESHOLD = float(os.environ.get('NOVELTY_THRESHOLD', '0.35'))  # rounds below this are stagnant
+NOVELTY_PATIENCE = int(os.environ.get('NOVELTY_PATIENCE', '2'))  # stagnant rounds in a row that end the run
+NOVELTY_STEERING_PROMPT = (
+    "\n\nModerator note: the last round mostly repeated earlier points. Do not restate them; "
+    "add a new argument, a concrete example or a decision, or say plainly that you agree."
+)
+
 @api_router.post("/conversation/autonomous")
-async def start_autonomous_collaboration(request: ConversationStartRequest):
+async def start_autonomous_collaboration(request: ConversationStartRequest, tenant_id: Optional[str] = Depends(caller_tenant)):
     """Start enhanced autonomous multi-agent collaboration"""
+    workflow = None
+    if request.collaboration_mode == CollaborationMode.WORKFLOW:
+        try:
+            workflow = (Workflow.from_spec({"steps": [{**step.dict(), "agent": step.agent.value} for step in request.workflow.steps]})
+                        if request.workflow
+                        else fan_out_workflow([agent.value for agent in request.agents]))
+        except WorkflowError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
         conversation_id = str(uuid.uuid4())
         logger.info(f"Starting enhanced autonomous collaboration: {conversation_id}")
         
         # Create conversation with enhanced metadata
-        await db.conversations.insert_one({
+        await storage.create_conversation({
             "id": conversation_id,
             "topic": request.topic,
             "agents": request.agents,
@@ -697,6 +2426,8 @@ async def start_autonomous_collaboration(request: ConversationStartRequest):
             "max_rounds": request.max_rounds,
             "consensus_threshold": request.consensus_threshold,
             "streaming_enabled": request.streaming_enabled,
+            "tenant_id": tenant_id,
+            "workflow": workflow.to_spec() if workflow else None,
             "created_at": datetime.utcnow(),
             "status": "active",
             "current_round": 0,
@@ -717,7 +2448,7 @@ async def start_autonomous_collaboration(request: ConversationStartRequest):
         
         message_dict = initial_message.dict()
         message_dict["timestamp"] = message_dict["timestamp"].isoformat()
-        await db.messages.insert_one(message_dict)
+        await save_message(message_dict)
         
         # Remove MongoDB _id
         if "_id" in message_dict:
@@ -729,14 +2460,28 @@ async def start_autonomous_collaboration(request: ConversationStartRequest):
             "data": message_dict
         }), conversation_id)
         
-        # Start autonomous collaboration in background
-        asyncio.create_task(run_enhanced_autonomous_collaboration(
-            conversation_id, request.topic, request.agents, 
-            request.max_rounds, request.consensus_threshold, request.streaming_enabled
-        ))
+        # Queue the collaboration; a worker claims it, checkpoints each round and resumes it after a restart
+        if workflow:
+            job = await collaboration_jobs.enqueue(new_job("workflow", conversation_id, {
+                "topic": request.topic,
+                "workflow": workflow.to_spec(),
+                "streaming_enabled": request.streaming_enabled,
+                "tenant_id": tenant_id
+            }, JOB_MAX_ATTEMPTS))
+        else:
+            job = await collaboration_jobs.enqueue(new_job("autonomous", conversation_id, {
+                "topic": request.topic,
+                "agents": [agent.value for agent in request.agents],
+                "max_rounds": request.max_rounds,
+                "consensus_threshold": request.consensus_threshold,
+                "streaming_enabled": request.streaming_enabled,
+                "tenant_id": tenant_id
+            }, JOB_MAX_ATTEMPTS))
+        collaboration_worker.notify()
         
         return {
             "conversation_id": conversation_id,
+            "job_id": job["id"],
             "status": "started",
             "mode": request.collaboration_mode,
             "agents": request.agents,
@@ -748,11 +2493,35 @@ async def start_autonomous_collaboration(request: ConversationStartRequest):
         logger.error(f"Error starting enhanced autonomous collaboration: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def run_enhanced_autonomous_collaboration(conversation_id: str, topic: str, agents: List[str], max_rounds: int, consensus_threshold: float, streaming_enabled: bool):
-    """Enhanced autonomous collaboration with better performance tracking"""
+async def run_enhanced_autonomous_collaboration(conversation_id: str, topic: str, agents: List[str], max_rounds: int, consensus_threshold: float, streaming_enabled: bool,
+                                               resume: Optional[dict] = None, on_round: Optional[Callable[[dict], Awaitable[Any]]] = None,
+                                               tenant_id: Optional[str] = None):
+    """Enhanced autonomous collaboration with better performance tracking.
+
+    `resume` is the checkpoint of an interrupted run, which continues after its
+    last completed round; `on_round` receives a new checkpoint after every round.
+    """
     try:
         logger.info(f"Running enhanced autonomous collaboration for {conversation_id}")
         round_number = 1
+        # Recent history, kept current as each agent's message completes
+        context_window = await context_windows.acquire(conversation_id)
+        consensus_rounds = []
+        previous_positions = None
+        novelty = NoveltyTracker()
+        novelty_rounds = []
+        steering = ""
+        stagnated = False
+        if resume:
+            round_number = resume["completed_round"] + 1
+            previous_positions = resume.get("previous_positions")
+            steering = NOVELTY_STEERING_PROMPT if resume.get("steering") else ""
+            stored = await storage.get_conversation(conversation_id, ["consensus_rounds", "novelty_rounds"]) or {}
+            consensus_rounds = [r for r in stored.get("consensus_rounds") or [] if r["round"] <= resume["completed_round"]]
+            novelty_rounds = [r for r in stored.get("novelty_rounds") or [] if r["round"] <= resume["completed_round"]]
+            logger.info(f"Resuming {conversation_id} after round {resume['completed_round']}")
+        async for message in iter_conversation_messages(conversation_id, fields=["content"]):
+            novelty.observe(message.get("content") or "")
         
         while round_number <= max_rounds:
             logger.info(f"Enhanced autonomous round {round_number}/{max_rounds} for {conversation_id}")
@@ -768,49 +2537,44 @@ async def run_enhanced_autonomous_collaboration(conversation_id: str, topic: str
                 }
             }), conversation_id)
             
-            # Get current conversation history
-            messages = await db.messages.find(
-                {"conversation_id": conversation_id}
-            ).sort("timestamp", 1).to_list(1000)
-            
             # Generate responses from each agent in sequence
+            positions = {}
             for agent_type in agents:
                 try:
-                    # Build conversation context
-                    recent_messages = messages[-8:] if messages else []
-                    conversation_context = ""
-                    
-                    if recent_messages:
-                        conversation_context = "\n\nRecent conversation:\n"
-                        for msg in recent_messages:
-                            speaker = msg.get('agent_type', 'user').title()
-                            conversation_context += f"{speaker}: {msg['content']}\n"
+                    await context_windows.catch_up(context_window)
+                    conversation_context = context_windows.render(context_window, AGENT_MODELS[agent_type]['model']) + steering
                     
                     if streaming_enabled:
                         # Use enhanced streaming
-                        agent_response = await generate_agent_response_enhanced_stream(
-                            AgentType(agent_type), conversation_context, topic, conversation_id
-                        )
+                        async with turn_scheduler.turn(conversation_id, tenant_id, turn_estimate(conversation_context)) as turn:
+                            agent_response = await generate_agent_response_enhanced_stream(
+                                AgentType(agent_type), conversation_context, topic, conversation_id
+                            )
+                            turn.tokens = turn_usage(conversation_context, agent_response)
                     else:
                         # Use regular response generation
-                        agent_response = await call_together_ai_enhanced(
-                            f"{AGENT_MODELS[agent_type]['persona']}\n\nTopic: {topic}\n{conversation_context}\n\nProvide your perspective in 2-3 sentences.",
-                            AGENT_MODELS[agent_type]['model'],
-                            conversation_id=conversation_id
-                        )
+                        async with turn_scheduler.turn(conversation_id, tenant_id, turn_estimate(conversation_context)) as turn:
+                            start_time = time.time()
+                            agent_response = await call_together_ai_enhanced(
+                                f"{AGENT_MODELS[agent_type]['persona']}\n\nTopic: {topic}\n{conversation_context}\n\nProvide your perspective in 2-3 sentences.",
+                                AGENT_MODELS[agent_type]['model'],
+                                conversation_id=conversation_id
+                            )
+                            turn.tokens = turn_usage(conversation_context, agent_response)
                         
                         # Create and save agent message
                         agent_message = ChatMessage(
                             conversation_id=conversation_id,
                             content=agent_response,
                             agent_type=AgentType(agent_type),
-                            is_user=False
+                            is_user=False,
+                            response_time=time.time() - start_time,
+                            token_count=len(agent_response.split())
                         )
                         
                         message_dict = agent_message.dict()
                         message_dict["timestamp"] = message_dict["timestamp"].isoformat()
-                        await db.messages.insert_one(message_dict)
-                        messages.append(message_dict)
+                        await save_message(message_dict)
                         
                         # Remove MongoDB _id
                         if "_id" in message_dict:
@@ -825,6 +2589,11 @@ async def run_enhanced_autonomous_collaboration(conversation_id: str, topic: str
                             "data": message_data
                         }), conversation_id)
                     
+                    # Image agents contribute renders rather than positions to agree on
+                    if agent_response and not agent_response.startswith("Error") and "FLUX" not in AGENT_MODELS[agent_type]['model']:
+                        positions[agent_type] = agent_response
+                        novelty.record(agent_type, agent_response)
+                    
                     logger.info(f"Enhanced agent {agent_type} contributed to round {round_number}")
                     
                     # Brief pause between agents
@@ -834,21 +2603,43 @@ async def run_enhanced_autonomous_collaboration(conversation_id: str, topic: str
                     logger.error(f"Error generating enhanced message for agent {agent_type}: {e}")
                     continue
             
-            # Update conversation performance metrics
-            await db.conversations.update_one(
-                {"id": conversation_id},
-                {
-                    "$set": {
-                        "current_round": round_number,
-                        "last_updated": datetime.utcnow()
-                    }
-                }
+            consensus_status, consensus_record = await assess_consensus(
+                conversation_id, topic, round_number, positions, previous_positions, consensus_threshold
             )
+            consensus_rounds.append(consensus_record)
+            previous_positions = positions or previous_positions
             
-            # Check for consensus after each round (simplified for now)
-            if round_number >= 3:  # Allow consensus detection after round 3
-                consensus_status = ConsensusStatus(reached=True, confidence=0.85, final_answer="Collaborative solution achieved")
-                
+            round_novelty, agent_novelty = novelty.close_round()
+            novelty_record = {"round": round_number, "novelty": round_novelty, "agents": agent_novelty, "action": "none"}
+            if round_novelty is not None and not consensus_status.reached:
+                stagnant = stagnant_rounds([r["novelty"] for r in novelty_rounds if r["novelty"] is not None] + [round_novelty], NOVELTY_THRESHOLD)
+                if stagnant >= NOVELTY_PATIENCE:
+                    novelty_record["action"] = "conclude"
+                    stagnated = True
+                elif stagnant:
+                    novelty_record["action"] = "steer"
+            steering = NOVELTY_STEERING_PROMPT if novelty_record["action"] == "steer" else ""
+            novelty_rounds.append(novelty_record)
+            
+            # Update conversation progress and the per-round consensus and novelty scores
+            await storage.update_conversation(conversation_id, {
+                "current_round": round_number,
+                "consensus_status": consensus_status.dict(),
+                "consensus_rounds": consensus_rounds,
+                "novelty_rounds": novelty_rounds,
+                "last_updated": datetime.utcnow()
+            })
+            
+            await manager.send_to_conversation(json.dumps({
+                "type": "consensus_check",
+                "data": {"conversation_id": conversation_id, **consensus_record}
+            }, default=str), conversation_id)
+            await manager.send_to_conversation(json.dumps({
+                "type": "round_novelty",
+                "data": {"conversation_id": conversation_id, "threshold": NOVELTY_THRESHOLD, **novelty_record}
+            }), conversation_id)
+            
+            if consensus_status.reached:
                 logger.info(f"Consensus reached in round {round_number} for {conversation_id}")
                 
                 # Generate final consensus message
@@ -861,7 +2652,7 @@ async def run_enhanced_autonomous_collaboration(conversation_id: str, topic: str
                 
                 message_dict = final_message.dict()
                 message_dict["timestamp"] = message_dict["timestamp"].isoformat()
-                await db.messages.insert_one(message_dict)
+                await save_message(message_dict)
                 
                 # Remove MongoDB _id
                 if "_id" in message_dict:
@@ -874,32 +2665,41 @@ async def run_enhanced_autonomous_collaboration(conversation_id: str, topic: str
                 }), conversation_id)
                 
                 # Mark conversation as completed
-                await db.conversations.update_one(
-                    {"id": conversation_id},
-                    {"$set": {"status": "completed", "completed_at": datetime.utcnow()}}
-                )
+                await storage.update_conversation(conversation_id, {"status": "completed", "completed_at": datetime.utcnow()})
+                schedule_summary_refresh(conversation_id)
                 
                 break
             
+            if stagnated:
+                logger.info(f"Collaboration {conversation_id} stagnated after round {round_number}")
+                break
+            
+            if on_round is not None:
+                await on_round({"completed_round": round_number, "previous_positions": previous_positions, "steering": bool(steering)})
+            
             round_number += 1
             
             # Pause between rounds
             await asyncio.sleep(3)
         
-        # If max rounds reached without consensus
-        if round_number > max_rounds:
-            logger.info(f"Max rounds reached for enhanced collaboration {conversation_id}")
+        # If max rounds reached (or the discussion stopped moving) without consensus
+        if stagnated or round_number > max_rounds:
+            logger.info(f"Concluding enhanced collaboration {conversation_id} without consensus")
             
+            reason = (
+                f"The discussion stopped producing new points after {round_number} rounds." if stagnated
+                else f"Maximum rounds ({max_rounds}) reached."
+            )
             final_message = ChatMessage(
                 conversation_id=conversation_id,
-                content=f"⏰ **COLLABORATION CONCLUDED** ⏰\n\nMaximum rounds ({max_rounds}) reached. The agents have shared diverse perspectives on: {topic}\n\n*While full consensus wasn't achieved, valuable insights were exchanged.*",
+                content=f"⏰ **COLLABORATION CONCLUDED** ⏰\n\n{reason} The agents have shared diverse perspectives on: {topic}\n\n*While full consensus wasn't achieved, valuable insights were exchanged.*",
                 agent_type=None,
                 is_user=False
             )
             
             message_dict = final_message.dict()
             message_dict["timestamp"] = message_dict["timestamp"].isoformat()
-            await db.messages.insert_one(message_dict)
+            await save_message(message_dict)
             
             # Remove MongoDB _id
             if "_id" in message_dict:
@@ -911,16 +2711,433 @@ async def run_enhanced_autonomous_collaboration(conversation_id: str, topic: str
             }), conversation_id)
             
             # Mark conversation as concluded
-            await db.conversations.update_one(
-                {"id": conversation_id},
-                {"$set": {"status": "concluded", "completed_at": datetime.utcnow()}}
-            )
+            await storage.update_conversation(conversation_id, {"status": "concluded", "completed_at": datetime.utcnow()})
+            schedule_summary_refresh(conversation_id)
             
     except Exception as e:
         logger.error(f"Error in enhanced autonomous collaboration: {e}")
+        # Surfaced to the job worker, which retries from the last checkpoint
+        raise
+    finally:
+        context_windows.release(conversation_id)
+
+WORKFLOW_DEFAULT_STEP_PROMPT = "Contribute your perspective on the topic."
+
+def workflow_step_context(step, inputs: Dict[str, str]) -> str:
+    """The step's instructions followed by the output of each step it depends on"""
+    parts = [f"Workflow step '{step.id}': {step.prompt or WORKFLOW_DEFAULT_STEP_PROMPT}"]
+    parts += [f"Output of step '{dependency}':\n{output}" for dependency, output in inputs.items()]
+    return "\n\n".join(parts)
+
+async def run_workflow_collaboration(conversation_id: str, topic: str, workflow: Workflow, streaming_enabled: bool,
+                                     resume: Optional[dict] = None, on_step: Optional[Callable[[dict], Awaitable[Any]]] = None,
+                                     tenant_id: Optional[str] = None):
+    """Run a workflow collaboration, independent steps concurrently.
+
+    `resume` is the checkpoint of an interrupted run, whose completed steps
+    are kept; `on_step` receives a new checkpoint after every step.
+    """
+    logger.info(f"Running workflow collaboration for {conversation_id} ({len(workflow.steps)} steps)")
+    
+    async def run_step(step, inputs: Dict[str, str]) -> str:
+        await manager.send_to_conversation(json.dumps({
+            "type": "workflow_step_start",
+            "data": {"conversation_id": conversation_id, "step": step.id, "agent": step.agent, "depends_on": step.depends_on}
+        }), conversation_id)
+        context = workflow_step_context(step, inputs)
+        async with turn_scheduler.turn(conversation_id, tenant_id, turn_estimate(context)) as turn:
+            # The step timeout bounds the model call only, not the wait for a scheduler slot
+            if streaming_enabled:
+                response = await asyncio.wait_for(
+                    generate_agent_response_enhanced_stream(AgentType(step.agent), context, topic, conversation_id), step.timeout_seconds
+                )
+            else:
+                start_time = time.time()
+                response = await asyncio.wait_for(call_together_ai_enhanced(
+                    f"{AGENT_MODELS[step.agent]['persona']}\n\nTopic: {topic}\n{context}\n\nProvide your perspective in 2-3 sentences.",
+                    AGENT_MODELS[step.agent]['model'],
+                    conversation_id=conversation_id
+                ), step.timeout_seconds)
+            turn.tokens = turn_usage(context, response)
+        if not streaming_enabled:
+            agent_message = ChatMessage(
+                conversation_id=conversation_id,
+                content=response,
+                agent_type=AgentType(step.agent),
+                is_user=False,
+                response_time=time.time() - start_time,
+                token_count=len(response.split())
+            )
+            message_dict = agent_message.dict()
+            message_dict["timestamp"] = message_dict["timestamp"].isoformat()
+            await save_message(message_dict)
+            if "_id" in message_dict:
+                del message_dict["_id"]
+            await manager.send_to_conversation(json.dumps({
+                "type": "agent_message",
+                "data": {**message_dict, "agent_config": AGENT_MODELS[step.agent]}
+            }), conversation_id)
+        if not response or response.startswith("Error"):
+            raise RuntimeError(response or "Empty response")
+        return response
+    
+    async def step_finished(step_id: str, results: Dict[str, dict]):
+        result = results[step_id]
+        await storage.update_conversation(conversation_id, {"workflow_steps": results, "last_updated": datetime.utcnow()})
+        await manager.send_to_conversation(json.dumps({
+            "type": "workflow_step_complete",
+            "data": {"conversation_id": conversation_id, "step": step_id,
+                     **{key: value for key, value in result.items() if key != "output"}}
+        }), conversation_id)
+        if on_step is not None:
+            await on_step({"steps": results})
+    
+    results = await run_workflow(workflow, run_step, (resume or {}).get("steps"), step_finished, enforce_timeouts=False)
+    report = latency_report(workflow, results)
+    unfinished = [step_id for step_id, result in results.items() if result["status"] != STEP_COMPLETED]
+    
+    path = " → ".join(report["critical_path"])
+    outcome = f"Steps not completed: {', '.join(unfinished)}." if unfinished else "All steps completed."
+    final_message = ChatMessage(
+        conversation_id=conversation_id,
+        content=f"🧭 **WORKFLOW FINISHED** 🧭\n\n{outcome}\n\n*Critical path: {path} ({report['critical_path_seconds']:.1f}s of {report['elapsed_seconds']:.1f}s elapsed)*",
+        agent_type=None,
+        is_user=False
+    )
+    message_dict = final_message.dict()
+    message_dict["timestamp"] = message_dict["timestamp"].isoformat()
+    await save_message(message_dict)
+    if "_id" in message_dict:
+        del message_dict["_id"]
+    await manager.send_to_conversation(json.dumps({
+        "type": "workflow_complete",
+        "data": {**message_dict, "report": report}
+    }), conversation_id)
+    
+    await storage.update_conversation(conversation_id, {
+        "workflow_steps": results,
+        "workflow_report": report,
+        "status": "concluded" if unfinished else "completed",
+        "completed_at": datetime.utcnow()
+    })
+    schedule_summary_refresh(conversation_id)
+
+# Durable collaboration jobs: claimed under a lease, heartbeated, checkpointed per round, resumed after restarts
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', '8'))  # collaborations one process runs at once
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '60'))
+JOB_HEARTBEAT_SECONDS = float(os.environ.get('JOB_HEARTBEAT_SECONDS', '15'))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '2'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETRY_DELAY_SECONDS = float(os.environ.get('JOB_RETRY_DELAY_SECONDS', '30'))
+# embedded: API processes run collaborations themselves; external: they only serve, and
+# `python worker.py` processes run the jobs and relay their events back (mongo backend only)
+def resolve_worker_mode(requested: str, mongo_features: bool) -> str:
+    if requested == "external" and not mongo_features:
+        logger.warning("External collaboration workers need the mongo storage backend; running collaborations in-process")
+        return "embedded"
+    return requested
+
+COLLABORATION_WORKER_MODE = resolve_worker_mode(os.environ.get('COLLABORATION_WORKER_MODE', 'embedded'), MONGO_FEATURES)
+
+collaboration_jobs = create_job_queue(STORAGE_BACKEND, db)
+
+async def run_autonomous_job(job: dict, checkpoint: Callable[[dict], Awaitable[Any]]):
+    payload = job["payload"]
+    await run_enhanced_autonomous_collaboration(
+        job["conversation_id"], payload["topic"], payload["agents"], payload["max_rounds"],
+        payload["consensus_threshold"], payload["streaming_enabled"], resume=job.get("checkpoint"), on_round=checkpoint,
+        tenant_id=payload.get("tenant_id")
+    )
+
+async def run_workflow_job(job: dict, checkpoint: Callable[[dict], Awaitable[Any]]):
+    payload = job["payload"]
+    await run_workflow_collaboration(
+        job["conversation_id"], payload["topic"], Workflow.from_spec(payload["workflow"]), payload["streaming_enabled"],
+        resume=job.get("checkpoint"), on_step=checkpoint, tenant_id=payload.get("tenant_id")
+    )
+
+JOB_HANDLERS = {"autonomous": run_autonomous_job, "workflow": run_workflow_job}
+
+# Pause collaborations nobody has watched (WebSocket or poll) for this long; 0 disables
+COLLABORATION_IDLE_PAUSE_SECONDS = float(os.environ.get('COLLABORATION_IDLE_PAUSE_SECONDS', '600'))
+VIEWER_PRESENCE_WRITE_SECONDS = 30  # at most one presence write per conversation and process
+
+# Conversation status and WebSocket event for each job state a control request leads to
+COLLABORATION_CONTROL_STATES = {
+    "paused": ("paused", "collaboration_paused"),
+    "cancelled": ("cancelled", "collaboration_cancelled"),
+    "queued": ("active", "collaboration_resumed")
+}
+
+async def record_collaboration_state(conversation_id: str, job_status: str, reason: str):
+    conversation_status, event_type = COLLABORATION_CONTROL_STATES[job_status]
+    fields = {"status": conversation_status, "last_updated": datetime.utcnow()}
+    if job_status == "cancelled":
+        fields["completed_at"] = datetime.utcnow()
+    await storage.update_conversation(conversation_id, fields)
+    await manager.send_to_conversation(json.dumps({
+        "type": event_type,
+        "data": {"conversation_id": conversation_id, "reason": reason, "timestamp": datetime.utcnow().isoformat()}
+    }), conversation_id)
+
+class CollaborationWorker:
+    """Claims queued collaboration jobs and runs up to `concurrency` of them, keeping their leases alive.
+
+    Running jobs are held in `tasks`, and `runners` maps each conversation to
+    its job and task, so control requests reach the task directly. Cancelling
+    the task closes its in-flight LLM stream. Requests made elsewhere arrive
+    through the job's control flag on the next heartbeat. On shutdown jobs are
+    handed back to the queue with their checkpoint, so the next process
+    resumes them without waiting for the lease to expire.
+    """
+    def __init__(self, queue, concurrency: int, lease_seconds: float, heartbeat_seconds: float, poll_seconds: float,
+                 idle_pause_seconds: float = 0):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_seconds = poll_seconds
+        self.idle_pause_seconds = idle_pause_seconds
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.runners: Dict[str, tuple] = {}
+        self.stop_reasons: Dict[str, str] = {}
+        self.wakeup = asyncio.Event()
+        self.loop_task = None
+        self.stopping = False
+        self.stats = {
+            "claimed": 0, "resumed": 0, "completed": 0, "retried": 0, "failed": 0, "lost_leases": 0, "released": 0,
+            "paused": 0, "idle_paused": 0, "cancelled": 0
+        }
+
+    def start(self):
+        if self.loop_task is None:
+            self.loop_task = asyncio.create_task(self.run())
+
+    def notify(self):
+        self.wakeup.set()
+
+    def interrupt(self, job_id: str, runner: asyncio.Task, reason: str):
+        self.stop_reasons.setdefault(job_id, reason)
+        runner.cancel()
+
+    def control(self, conversation_id: str, action: str) -> bool:
+        """Pause or cancel the conversation's job right away if it runs in this process"""
+        entry = self.runners.get(conversation_id)
+        if entry is None or action not in ("pause", "cancel"):
+            return False
+        job_id, runner = entry
+        self.interrupt(job_id, runner, action)
+        return True
+
+    async def run(self):
+        while not self.stopping:
+            try:
+                for job in await self.queue.fail_exhausted():
+                    # Its worker died on the last allowed attempt; taking it over again would exceed max_attempts
+                    self.stats["failed"] += 1
+                    logger.error(f"Job {job['id']} failed permanently: {job['error']}")
+                    await storage.update_conversation(job["conversation_id"], {"status": "failed", "completed_at": job["finished_at"]})
+                while len(self.tasks) < self.concurrency:
+                    job = await self.queue.claim(self.worker_id, self.lease_seconds)
+                    if job is None:
+                        break
+                    self.stats["claimed"] += 1
+                    if job.get("checkpoint"):
+                        self.stats["resumed"] += 1
+                    self.tasks[job["id"]] = asyncio.create_task(self.execute(job))
+            except Exception as e:
+                logger.error(f"Job claim failed: {e}")
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def keep_alive(self, job: dict, runner: asyncio.Task):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                state = await self.queue.heartbeat(job["id"], self.worker_id, self.lease_seconds)
+            except Exception as e:
+                # Transient; the lease outlives several missed heartbeats
+                logger.error(f"Heartbeat failed for job {job['id']}: {e}")
+                continue
+            if state is None:
+                # Another worker took the job over after our lease expired; stop duplicating its work
+                logger.error(f"Lost the lease on job {job['id']}, stopping it")
+                self.stats["lost_leases"] += 1
+                self.interrupt(job["id"], runner, "lost_lease")
+                return
+            if state.get("control") in ("pause", "cancel"):
+                self.interrupt(job["id"], runner, state["control"])
+                return
+            seen = state.get("viewer_seen_at")
+            if self.idle_pause_seconds and seen and (datetime.utcnow() - seen).total_seconds() > self.idle_pause_seconds:
+                logger.info(f"No viewer for job {job['id']} in {self.idle_pause_seconds:.0f}s, pausing it")
+                self.interrupt(job["id"], runner, "idle")
+                return
+
+    async def settle_interrupted(self, job: dict, reason: Optional[str]):
+        job_id, conversation_id = job["id"], job["conversation_id"]
+        if reason == "lost_lease":
+            return
+        if reason is None:
+            if self.stopping and await self.queue.release(job_id, self.worker_id):
+                self.stats["released"] += 1
+            return
+        status = "cancelled" if reason == "cancel" else "paused"
+        if await self.queue.stop(job_id, self.worker_id, status):
+            self.stats["idle_paused" if reason == "idle" else status] += 1
+            await record_collaboration_state(conversation_id, status, "no viewers" if reason == "idle" else "requested")
+
+    async def execute(self, job: dict):
+        job_id, conversation_id = job["id"], job["conversation_id"]
+        checkpoint = lambda state: self.queue.checkpoint(job_id, self.worker_id, state)
+        runner = asyncio.create_task(JOB_HANDLERS[job["kind"]](job, checkpoint))
+        self.runners[conversation_id] = (job_id, runner)
+        heartbeat = asyncio.create_task(self.keep_alive(job, runner))
+        error = None
+        try:
+            await runner
+        except asyncio.CancelledError:
+            await self.settle_interrupted(job, self.stop_reasons.pop(job_id, None))
+            return
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        finally:
+            heartbeat.cancel()
+            self.tasks.pop(job_id, None)
+            if self.runners.get(conversation_id, (None,))[0] == job_id:
+                del self.runners[conversation_id]
+            self.wakeup.set()
+        status = await self.queue.finish(job_id, self.worker_id, error, JOB_RETRY_DELAY_SECONDS)
+        if status == "completed":
+            self.stats["completed"] += 1
+        elif status == "queued":
+            self.stats["retried"] += 1
+            logger.warning(f"Job {job_id} failed (attempt {job['attempts']}), retrying from its checkpoint: {error}")
+        elif status == "failed":
+            self.stats["failed"] += 1
+            logger.error(f"Job {job_id} failed permanently: {error}")
+            await storage.update_conversation(conversation_id, {"status": "failed", "completed_at": datetime.utcnow()})
+
+    async def shutdown(self):
+        self.stopping = True
+        if self.loop_task:
+            self.loop_task.cancel()
+        running = list(self.tasks.values())
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+collaboration_worker = CollaborationWorker(
+    collaboration_jobs, JOB_CONCURRENCY, JOB_LEASE_SECONDS, JOB_HEARTBEAT_SECONDS, JOB_POLL_SECONDS, COLLABORATION_IDLE_PAUSE_SECONDS
+)
+
+class ViewerPresence:
+    """Throttled record of who is watching which conversation, kept on the conversation's unfinished job"""
+    def __init__(self, queue, write_seconds: float, max_tracked: int = 10000):
+        self.queue = queue
+        self.write_seconds = write_seconds
+        self.max_tracked = max_tracked
+        self.written: "OrderedDict[str, float]" = OrderedDict()
+
+    def seen(self, conversation_id: str):
+        now = time.monotonic()
+        if now - self.written.get(conversation_id, float("-inf")) < self.write_seconds:
+            return
+        self.written[conversation_id] = now
+        self.written.move_to_end(conversation_id)
+        while len(self.written) > self.max_tracked:
+            self.written.popitem(last=False)
+        task = asyncio.create_task(self._write(conversation_id))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+    async def _write(self, conversation_id: str):
+        try:
+            await self.queue.touch_viewer(conversation_id)
+        except Exception as e:
+            logger.error(f"Could not record viewer presence for {conversation_id}: {e}")
+
+viewer_presence = ViewerPresence(collaboration_jobs, VIEWER_PRESENCE_WRITE_SECONDS)
+
+@api_router.get("/scheduler/stats")
+async def get_scheduler_stats():
+    """Slot usage of this process's turn scheduler and wait times per tenant"""
+    return {
+        "capacity": turn_scheduler.capacity,
+        "running": turn_scheduler.running,
+        "queued": turn_scheduler.queued(),
+        **turn_scheduler.stats,
+        "tenants": turn_scheduler.tenant_report()
+    }
+
+@api_router.get("/jobs/stats")
+async def get_job_queue_stats():
+    """Queue depth, lag of the oldest runnable job and jobs per status"""
+    return {
+        "queue": collaboration_jobs.name,
+        "worker_id": collaboration_worker.worker_id,
+        "running_here": len(collaboration_worker.tasks),
+        "concurrency": collaboration_worker.concurrency,
+        "worker": collaboration_worker.stats,
+        **await collaboration_jobs.stats()
+    }
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status, attempts, lease and last checkpoint of one job"""
+    job = await collaboration_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return to_api_document(job)
+
+@api_router.get("/conversation/{conversation_id}/job")
+async def get_conversation_job(conversation_id: str):
+    """The most recent job that ran a conversation"""
+    job = await collaboration_jobs.latest_for_conversation(conversation_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="No job for this conversation")
+    return to_api_document(job)
+
+async def control_collaboration(conversation_id: str, action: str) -> Dict[str, Any]:
+    job = await collaboration_jobs.latest_for_conversation(conversation_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="No collaboration job for this conversation")
+    status = await collaboration_jobs.request_control(job["id"], action)
+    if status is None:
+        raise HTTPException(status_code=409, detail=f"Cannot {action} a collaboration that is {job['status']}")
+    if status == "running":
+        # Immediate when this process runs the job, otherwise its worker acts on the next heartbeat
+        applied = collaboration_worker.control(conversation_id, action)
+    else:
+        applied = True
+        if status != job["status"]:
+            await record_collaboration_state(conversation_id, status, "requested")
+        if status == "queued":
+            collaboration_worker.notify()
+    return {"conversation_id": conversation_id, "job_id": job["id"], "action": action, "job_status": status,
+            "applied": applied}
+
+@api_router.post("/conversation/{conversation_id}/cancel")
+async def cancel_collaboration(conversation_id: str):
+    """Stop a collaboration for good, closing any LLM stream in flight"""
+    return await control_collaboration(conversation_id, "cancel")
+
+@api_router.post("/conversation/{conversation_id}/pause")
+async def pause_collaboration(conversation_id: str):
+    """Stop a collaboration after keeping its progress up to the last completed round"""
+    return await control_collaboration(conversation_id, "pause")
+
+@api_router.post("/conversation/{conversation_id}/resume")
+async def resume_collaboration(conversation_id: str):
+    """Queue a paused collaboration again; it continues after its last completed round"""
+    return await control_collaboration(conversation_id, "resume")
 
 @api_router.post("/conversation/start")
-async def start_conversation_legacy(request: ConversationRequest):
+async def start_conversation_legacy(request: ConversationRequest, tenant_id: Optional[str] = Depends(caller_tenant)):
     """Start a new multi-agent conversation (legacy endpoint)"""
     conversation_id = str(uuid.uuid4())
     
@@ -930,11 +3147,12 @@ async def start_conversation_legacy(request: ConversationRequest):
         "topic": request.topic,
         "agents": [agent.value for agent in request.agents],
         "message_count": request.message_count,
+        "tenant_id": tenant_id,
         "created_at": datetime.utcnow(),
         "status": "active"
     }
     
-    await db.conversations.insert_one(conversation_doc)
+    await storage.create_conversation(conversation_doc)
     
     return {"conversation_id": conversation_id, "status": "started"}
 
@@ -950,7 +3168,7 @@ async def add_user_message(conversation_id: str, message: dict):
     # Save to database
     message_dict = chat_message.dict()
     message_dict["timestamp"] = message_dict["timestamp"].isoformat()
-    await db.messages.insert_one(message_dict)
+    await save_message(message_dict)
     
     # Remove MongoDB _id for JSON serialization
     if "_id" in message_dict:
@@ -965,89 +3183,104 @@ async def add_user_message(conversation_id: str, message: dict):
     return {"status": "message_added"}
 
 @api_router.get("/conversation/{conversation_id}/messages")
-async def get_conversation_messages(conversation_id: str, limit: int = Query(1000, ge=1, le=1000)):
-    """Get messages for a conversation with pagination"""
-    messages = await db.messages.find(
-        {"conversation_id": conversation_id}
-    ).sort("timestamp", 1).limit(limit).to_list(limit)
+async def get_conversation_messages(
+    conversation_id: str,
+    response: Response,
+    limit: int = Query(MESSAGE_PAGE_SIZE_DEFAULT, ge=1, le=MESSAGE_PAGE_SIZE_MAX),
+    after: Optional[str] = None,
+    before: Optional[str] = None
+):
+    """Get messages for a conversation with cursor pagination.
+
+    The body stays a plain list; pagination state is returned in the
+    X-Has-More, X-Next-Cursor and X-Prev-Cursor headers.
+    """
+    try:
+        messages, has_more = await fetch_message_page(conversation_id, after=after, before=before, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Convert MongoDB documents to clean format
-    result = []
-    for msg in messages:
-        if "_id" in msg:
-            del msg["_id"]
-        result.append(msg)
+    response.headers["X-Has-More"] = "true" if has_more else "false"
+    for name, cursor in page_cursors(messages).items():
+        if cursor:
+            response.headers["X-" + name.replace("_", "-").title()] = cursor
     
-    return result
+    return [to_api_document(msg) for msg in messages]
 
 @api_router.post("/conversation/{conversation_id}/generate")
 async def generate_agent_conversation(conversation_id: str):
     """Generate a multi-agent conversation with enhanced features"""
     
     # Get conversation details
-    conversation = await db.conversations.find_one({"id": conversation_id})
+    conversation = await storage.get_conversation(conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    # Get existing messages for context
-    existing_messages = await db.messages.find(
-        {"conversation_id": conversation_id}
-    ).sort("timestamp", 1).to_list(1000)
-    
-    context = "\n".join([f"{msg.get('agent_type', 'User')}: {msg['content']}" for msg in existing_messages[-5:]])
-    
     agents = [AgentType(agent) for agent in conversation["agents"]]
     topic = conversation["topic"]
     streaming_enabled = conversation.get("streaming_enabled", False)
+    tenant_id = conversation.get("tenant_id")
+    
+    # Budgeted context that picks up each response as it completes
+    context_window = await context_windows.acquire(conversation_id)
     
     # Generate responses from each agent
-    for i in range(conversation["message_count"]):
-        for agent_type in agents:
-            try:
-                if streaming_enabled:
-                    response = await generate_agent_response_enhanced_stream(agent_type, context, topic, conversation_id)
-                else:
-                    response = await call_together_ai_enhanced(
-                        f"{AGENT_MODELS[agent_type.value]['persona']}\n\nTopic: {topic}\n{context}\n\nProvide your perspective in 2-3 sentences.",
-                        AGENT_MODELS[agent_type.value]['model'],
-                        conversation_id=conversation_id
-                    )
+    try:
+        for i in range(conversation["message_count"]):
+            for agent_type in agents:
+                try:
+                    await context_windows.catch_up(context_window)
+                    context = context_windows.render(context_window, AGENT_MODELS[agent_type.value]['model'])
+                    if streaming_enabled:
+                        async with turn_scheduler.turn(conversation_id, tenant_id, turn_estimate(context)) as turn:
+                            response = await generate_agent_response_enhanced_stream(agent_type, context, topic, conversation_id)
+                            turn.tokens = turn_usage(context, response)
+                    else:
+                        async with turn_scheduler.turn(conversation_id, tenant_id, turn_estimate(context)) as turn:
+                            start_time = time.time()
+                            response = await call_together_ai_enhanced(
+                                f"{AGENT_MODELS[agent_type.value]['persona']}\n\nTopic: {topic}\n{context}\n\nProvide your perspective in 2-3 sentences.",
+                                AGENT_MODELS[agent_type.value]['model'],
+                                conversation_id=conversation_id
+                            )
+                            turn.tokens = turn_usage(context, response)
                     
-                    # Create message
-                    chat_message = ChatMessage(
-                        conversation_id=conversation_id,
-                        agent_type=agent_type,
-                        content=response,
-                        is_user=False
-                    )
+                        # Create message
+                        chat_message = ChatMessage(
+                            conversation_id=conversation_id,
+                            agent_type=agent_type,
+                            content=response,
+                            is_user=False,
+                            response_time=time.time() - start_time,
+                            token_count=len(response.split())
+                        )
                     
-                    # Save to database
-                    message_dict = chat_message.dict()
-                    message_dict["timestamp"] = message_dict["timestamp"].isoformat()
-                    await db.messages.insert_one(message_dict)
+                        # Save to database
+                        message_dict = chat_message.dict()
+                        message_dict["timestamp"] = message_dict["timestamp"].isoformat()
+                        await save_message(message_dict)
                     
-                    # Remove MongoDB _id for JSON serialization
-                    if "_id" in message_dict:
-                        del message_dict["_id"]
+                        # Remove MongoDB _id for JSON serialization
+                        if "_id" in message_dict:
+                            del message_dict["_id"]
                     
-                    # Broadcast to WebSocket
-                    message_data = message_dict.copy()
-                    message_data["agent_config"] = AGENT_MODELS[agent_type.value]
+                        # Broadcast to WebSocket
+                        message_data = message_dict.copy()
+                        message_data["agent_config"] = AGENT_MODELS[agent_type.value]
                     
-                    await manager.send_to_conversation(json.dumps({
-                        "type": "agent_message",
-                        "data": message_data
-                    }), conversation_id)
-                
-                # Update context
-                context += f"\n{AGENT_MODELS[agent_type.value]['name']}: {response}"
+                        await manager.send_to_conversation(json.dumps({
+                            "type": "agent_message",
+                            "data": message_data
+                        }), conversation_id)
                 
-                # Small delay between messages
-                await asyncio.sleep(1)
+                    # Small delay between messages
+                    await asyncio.sleep(1)
                 
-            except Exception as e:
-                logger.error(f"Error generating response for {agent_type}: {e}")
-                continue
+                except Exception as e:
+                    logger.error(f"Error generating response for {agent_type}: {e}")
+                    continue
+    finally:
+        context_windows.release(conversation_id)
     
     return {"status": "conversation_generated"}
 
@@ -1070,7 +3303,7 @@ async def generate_image(request: ImageGenerationRequest):
             # Save to database
             message_dict = chat_message.dict()
             message_dict["timestamp"] = message_dict["timestamp"].isoformat()
-            await db.messages.insert_one(message_dict)
+            await save_message(message_dict)
             
             # Remove MongoDB _id for JSON serialization
             if "_id" in message_dict:
@@ -1123,76 +3356,226 @@ async def get_api_stats():
 
 # New enhanced endpoints
 
-@api_router.get("/conversation/{conversation_id}/summary")
-async def generate_conversation_summary(conversation_id: str):
-    """Generate an AI-powered summary of the conversation"""
+# Cached, incremental conversation summaries keyed by the last summarized message
+SUMMARY_MODEL = "deepseek-ai/DeepSeek-R1-Distill-Llama-70B"
+SUMMARY_REFRESH_ON_COMPLETE = os.environ.get('SUMMARY_REFRESH_ON_COMPLETE', 'true').lower() == 'true'
+summary_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+async def get_latest_summary(conversation_id: str) -> Optional[dict]:
+    return await storage.latest_summary(conversation_id)
+
+async def collect_summary_delta(conversation_id: str, watermark: Optional[str]):
+    """Finished messages after the watermark, stopping at the first one still streaming"""
+    delta = []
+    async for msg in iter_conversation_messages(conversation_id, after=watermark):
+        if msg.get("streaming_status") in (StreamingStatus.STARTED.value, StreamingStatus.STREAMING.value):
+            break
+        delta.append(msg)
+    return delta
+
+def render_summary_transcript(messages: List[dict]) -> tuple:
+    """Speaker-labelled agent lines plus the per-speaker contribution lists"""
+    lines = []
+    contributions: Dict[str, List[str]] = {}
+    for msg in messages:
+        if not msg.get('is_user', False) and msg.get('agent_type'):
+            speaker = AGENT_MODELS.get(msg['agent_type'], {}).get('name', msg['agent_type'])
+            lines.append(f"{speaker}: {msg['content']}")
+            contributions.setdefault(speaker, []).append(msg['content'])
+    return lines, contributions
+
+# Map-reduce condensation of transcripts that exceed one summarization prompt
+SUMMARY_CHUNK_TOKENS = int(os.environ.get('SUMMARY_CHUNK_TOKENS', '3000'))
+SUMMARY_REDUCE_FANIN = int(os.environ.get('SUMMARY_REDUCE_FANIN', '4'))
+SUMMARY_MAP_CONCURRENCY = int(os.environ.get('SUMMARY_MAP_CONCURRENCY', str(len(API_KEYS_POOL))))
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used only for chunk sizing"""
+    return len(text) // 4 + 1
+
+def chunk_transcript(lines: List[str], max_tokens: int) -> List[str]:
+    """Pack transcript lines into chunks of at most max_tokens, splitting oversized lines"""
+    max_chars = max_tokens * 4
+    chunks, current, current_chars = [], [], 0
+    for line in lines:
+        pieces = [line[i:i + max_chars] for i in range(0, len(line), max_chars)] or [""]
+        for piece in pieces:
+            if current and current_chars + len(piece) + 1 > max_chars:
+                chunks.append("\n".join(current))
+                current, current_chars = [], 0
+            current.append(piece)
+            current_chars += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+class MapReduceSummarizer:
+    """Condenses long transcripts by summarizing chunks concurrently and reducing them in a tree.
+
+    Chunk calls run in parallel (spread over the key pool by the regular key
+    selection), so wall time grows with the depth of the tree rather than the
+    transcript length. Progress is published on the conversation's WebSocket.
+    """
+    def __init__(self, chunk_tokens: int, fan_in: int, concurrency: int):
+        self.chunk_tokens = chunk_tokens
+        self.fan_in = max(2, fan_in)
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _publish(self, conversation_id: str, stage: str, level: int, completed: int, total: int):
+        await manager.send_to_conversation(json.dumps({
+            "type": "summary_progress",
+            "data": {
+                "conversation_id": conversation_id,
+                "stage": stage,
+                "level": level,
+                "completed": completed,
+                "total": total
+            }
+        }), conversation_id)
+
+    async def _summarize(self, text: str, topic: str, partial: bool) -> str:
+        if partial:
+            prompt = f"""
+            The following text combines partial summaries of one multi-agent conversation on "{topic}".
+            Merge them into a single summary that keeps every distinct point, conclusion, disagreement and recommendation.
+            
+            {text}
+            """
+        else:
+            prompt = f"""
+            Summarize this excerpt of a multi-agent conversation on "{topic}".
+            Keep who argued what, conclusions, disagreements and recommendations.
+            
+            {text}
+            """
+        async with self.semaphore:
+            result = await call_together_ai_enhanced(prompt, SUMMARY_MODEL, max_tokens=400)
+        if not result or result.startswith("Error:"):
+            # Degrade to a truncated excerpt instead of failing the whole summary
+            logger.warning(f"Chunk summarization failed, keeping truncated excerpt: {result}")
+            return clip_text(text, self.chunk_tokens)
+        return result
+
+    async def _run_level(self, conversation_id: str, texts: List[str], topic: str, stage: str, level: int) -> List[str]:
+        completed = 0
+        await self._publish(conversation_id, stage, level, completed, len(texts))
+
+        async def run(text: str) -> str:
+            nonlocal completed
+            result = await self._summarize(text, topic, partial=stage == "reduce")
+            completed += 1
+            await self._publish(conversation_id, stage, level, completed, len(texts))
+            return result
+
+        return list(await asyncio.gather(*(run(text) for text in texts)))
+
+    async def condense(self, conversation_id: str, topic: str, lines: List[str]) -> str:
+        """Return the transcript itself if it fits one prompt, otherwise its reduced summary"""
+        transcript = "\n".join(lines)
+        if estimate_tokens(transcript) <= self.chunk_tokens:
+            return transcript
+
+        partials = await self._run_level(conversation_id, chunk_transcript(lines, self.chunk_tokens), topic, "map", 0)
+        level = 1
+        while len(partials) > 1:
+            groups = ["\n\n".join(partials[i:i + self.fan_in]) for i in range(0, len(partials), self.fan_in)]
+            partials = await self._run_level(conversation_id, groups, topic, "reduce", level)
+            level += 1
+        await self._publish(conversation_id, "done", level, 1, 1)
+        return partials[0]
+
+map_reduce_summarizer = MapReduceSummarizer(SUMMARY_CHUNK_TOKENS, SUMMARY_REDUCE_FANIN, SUMMARY_MAP_CONCURRENCY)
+
+async def generate_key_insights(summary: str) -> List[str]:
+    insights_prompt = f"""
+    Based on this conversation summary: {summary}
+    
+    Provide 3-5 key insights as a JSON array of strings.
+    Focus on the most important takeaways, decisions, or learning points.
+    
+    Format: ["insight 1", "insight 2", "insight 3"]
+    """
+    
+    insights_response = await call_together_ai_enhanced(insights_prompt, SUMMARY_MODEL, max_tokens=200)
+    
     try:
-        # Get conversation and messages
-        conversation = await db.conversations.find_one({"id": conversation_id})
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversation not found")
-        
-        messages = await db.messages.find(
-            {"conversation_id": conversation_id}
-        ).sort("timestamp", 1).to_list(1000)
-        
-        if not messages:
-            return {"summary": "No messages to summarize", "key_insights": []}
-        
-        # Build conversation text for summarization
-        conversation_text = f"Topic: {conversation['topic']}\n\n"
-        agent_contributions = {}
-        
-        for msg in messages:
-            if not msg.get('is_user', False) and msg.get('agent_type'):
-                speaker = AGENT_MODELS.get(msg['agent_type'], {}).get('name', msg['agent_type'])
-                conversation_text += f"{speaker}: {msg['content']}\n"
-                
-                if speaker not in agent_contributions:
-                    agent_contributions[speaker] = []
-                agent_contributions[speaker].append(msg['content'])
-        
-        # Generate summary using AI
-        summary_prompt = f"""
-        Please provide a comprehensive summary of this multi-agent conversation:
-        
-        {conversation_text}
-        
-        Include:
-        1. Main discussion points
-        2. Key conclusions reached
-        3. Areas of agreement/disagreement
-        4. Next steps or recommendations
-        
-        Keep the summary concise but comprehensive.
-        """
-        
-        summary = await call_together_ai_enhanced(
-            summary_prompt,
-            "deepseek-ai/DeepSeek-R1-Distill-Llama-70B",
-            max_tokens=500
-        )
-        
-        # Generate key insights
-        insights_prompt = f"""
-        Based on this conversation summary: {summary}
+        return json.loads(insights_response)
+    except:
+        return ["Summary generated successfully", "Multi-agent collaboration completed", "Insights extracted from conversation"]
+
+async def build_conversation_summary(conversation: dict) -> Optional[dict]:
+    """Return the cached summary if nothing changed, otherwise fold the new messages into it.
+
+    Returns None when the conversation has no finished messages yet.
+    """
+    conversation_id = conversation["id"]
+    consensus_reached = conversation.get('status') == 'completed'
+    
+    async with summary_locks[conversation_id]:
+        previous = await get_latest_summary(conversation_id)
+        if previous and not previous.get("watermark"):
+            # Summaries written before watermarks existed cannot be extended
+            previous = None
+        delta = await collect_summary_delta(conversation_id, previous.get("watermark") if previous else None)
         
-        Provide 3-5 key insights as a JSON array of strings.
-        Focus on the most important takeaways, decisions, or learning points.
+        if previous and not delta:
+            if previous.get("consensus_reached") != consensus_reached:
+                await storage.update_summary(previous["id"], {"consensus_reached": consensus_reached})
+                previous["consensus_reached"] = consensus_reached
+            previous["created_at"] = previous.pop("timestamp")
+            previous["cached"] = True
+            return previous
         
-        Format: ["insight 1", "insight 2", "insight 3"]
-        """
+        if not delta:
+            return None
         
-        insights_response = await call_together_ai_enhanced(
-            insights_prompt,
-            "deepseek-ai/DeepSeek-R1-Distill-Llama-70B",
-            max_tokens=200
-        )
+        delta_lines, new_contributions = render_summary_transcript(delta)
+        delta_text = await map_reduce_summarizer.condense(conversation_id, conversation['topic'], delta_lines) if delta_lines else ""
+        samples = dict(previous.get("contribution_samples", {})) if previous else {}
+        for speaker, contents in new_contributions.items():
+            samples[speaker] = (samples.get(speaker, []) + contents)[:2]
         
-        try:
-            key_insights = json.loads(insights_response)
-        except:
-            key_insights = ["Summary generated successfully", "Multi-agent collaboration completed", "Insights extracted from conversation"]
+        if previous and not delta_text:
+            # Only user or system messages arrived; the summary text is unchanged
+            summary, key_insights = previous["summary"], previous["key_insights"]
+        elif previous:
+            summary_prompt = f"""
+            Here is the current summary of a multi-agent conversation on "{conversation['topic']}":
+            
+            {previous['summary']}
+            
+            These messages were added since that summary was written:
+            
+            {delta_text}
+            
+            Update the summary to reflect the new messages. Keep the same structure:
+            1. Main discussion points
+            2. Key conclusions reached
+            3. Areas of agreement/disagreement
+            4. Next steps or recommendations
+            
+            Keep the summary concise but comprehensive.
+            """
+            summary = await call_together_ai_enhanced(summary_prompt, SUMMARY_MODEL, max_tokens=500)
+            key_insights = await generate_key_insights(summary)
+        else:
+            summary_prompt = f"""
+            Please provide a comprehensive summary of this multi-agent conversation:
+            
+            Topic: {conversation['topic']}
+            
+            {delta_text}
+            
+            Include:
+            1. Main discussion points
+            2. Key conclusions reached
+            3. Areas of agreement/disagreement
+            4. Next steps or recommendations
+            
+            Keep the summary concise but comprehensive.
+            """
+            summary = await call_together_ai_enhanced(summary_prompt, SUMMARY_MODEL, max_tokens=500)
+            key_insights = await generate_key_insights(summary)
         
         # Create and save summary
         conversation_summary = ConversationSummary(
@@ -1200,133 +3583,610 @@ async def generate_conversation_summary(conversation_id: str):
             conversation_id=conversation_id,
             summary=summary,
             key_insights=key_insights,
-            agent_contributions={k: "; ".join(v[:2]) for k, v in agent_contributions.items()},
-            consensus_reached=conversation.get('status') == 'completed'
+            agent_contributions={k: "; ".join(v) for k, v in samples.items()},
+            consensus_reached=consensus_reached,
+            watermark=encode_message_cursor(delta[-1]),
+            message_count=(previous.get("message_count", 0) if previous else 0) + len(delta)
         )
         
         summary_dict = conversation_summary.dict()
-        summary_dict["timestamp"] = summary_dict["created_at"].isoformat()
-        del summary_dict["created_at"]
-        await db.summaries.insert_one(summary_dict)
+        summary_dict["timestamp"] = summary_dict.pop("created_at")
+        summary_dict["contribution_samples"] = samples
+        del summary_dict["cached"]
+        await storage.insert_summary(summary_dict)
         
         return conversation_summary.dict()
+
+async def refresh_conversation_summary(conversation_id: str):
+    """Background refresh so the first summary request after completion is a cache hit"""
+    try:
+        conversation = await storage.get_conversation(conversation_id)
+        if conversation:
+            await build_conversation_summary(conversation)
+    except Exception as e:
+        logger.error(f"Background summary refresh failed for {conversation_id}: {e}")
+
+def schedule_summary_refresh(conversation_id: str):
+    if SUMMARY_REFRESH_ON_COMPLETE:
+        task = asyncio.create_task(refresh_conversation_summary(conversation_id))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+@api_router.get("/conversation/{conversation_id}/summary")
+async def generate_conversation_summary(conversation_id: str):
+    """Get the AI-powered summary of the conversation, regenerating only when new messages arrived"""
+    try:
+        conversation = await storage.get_conversation(conversation_id)
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
         
+        summary = await build_conversation_summary(conversation)
+        if summary is None:
+            return {"summary": "No messages to summarize", "key_insights": []}
+        
+        summary.pop("contribution_samples", None)
+        return summary
+        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating conversation summary: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Streaming conversation export (constant memory regardless of conversation length)
+EXPORT_CSV_COLUMNS = ["id", "timestamp", "agent_type", "is_user", "content", "image_url", "streaming_status", "response_time", "token_count"]
+EXPORT_FORMATS = {
+    "ndjson": {"media_type": "application/x-ndjson", "extension": "ndjson"},
+    "markdown": {"media_type": "text/markdown; charset=utf-8", "extension": "md"},
+    "csv": {"media_type": "text/csv; charset=utf-8", "extension": "csv"}
+}
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+def markdown_header(conversation: dict) -> str:
+    return (
+        f"# Conversation: {conversation['topic']}\n\n"
+        f"**Started:** {conversation['created_at']}\n"
+        f"**Agents:** {', '.join(conversation['agents'])}\n\n"
+        "## Messages\n\n"
+    )
+
+def markdown_message(msg: dict) -> str:
+    if msg.get('is_user'):
+        return f"**User:** {msg['content']}\n\n"
+    agent_name = AGENT_MODELS.get(msg.get('agent_type') or '', {}).get('name', 'Agent')
+    block = f"**{agent_name}:** {msg['content']}\n\n"
+    if msg.get('image_url'):
+        block += f"![Generated Image]({msg['image_url']})\n\n"
+    return block
+
+async def export_rows(conversation: dict, export_format: str):
+    """Yield the export as text fragments while paging through the messages in order"""
+    cursor = iter_conversation_messages(conversation["id"], page_size=500, fields=EXPORT_CSV_COLUMNS)
+
+    if export_format == "ndjson":
+        yield json.dumps({"type": "conversation", **to_api_document(conversation)}, default=str) + "\n"
+        async for msg in cursor:
+            yield json.dumps({"type": "message", **to_api_document(msg)}, default=str) + "\n"
+    elif export_format == "markdown":
+        yield markdown_header(conversation)
+        async for msg in cursor:
+            yield markdown_message(msg)
+    else:
+        line = io.StringIO()
+        writer = csv.DictWriter(line, fieldnames=EXPORT_CSV_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        async for msg in cursor:
+            writer.writerow(to_api_document(msg))
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate()
+        yield line.getvalue()
+
+async def export_stream(conversation: dict, export_format: str, compress: bool):
+    """Encode export fragments into ~64KB chunks, gzip-compressing them on the fly if requested"""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    pending, pending_bytes = [], 0
+    async for fragment in export_rows(conversation, export_format):
+        data = fragment.encode("utf-8")
+        pending.append(data)
+        pending_bytes += len(data)
+        if pending_bytes >= EXPORT_FLUSH_BYTES:
+            chunk = b"".join(pending)
+            pending, pending_bytes = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b"".join(pending)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+@api_router.get("/conversation/{conversation_id}/export/stream")
+async def stream_conversation_export(
+    conversation_id: str,
+    format: str = Query("ndjson", pattern="^(ndjson|markdown|csv)$"),
+    gzip: bool = False
+):
+    """Stream a full conversation export as NDJSON, Markdown or CSV, optionally gzip-compressed"""
+    conversation = await storage.get_conversation(conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    export_format = EXPORT_FORMATS[format]
+    filename = f"conversation-{conversation_id}.{export_format['extension']}"
+    media_type = export_format["media_type"]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    
+    return StreamingResponse(
+        export_stream(conversation, format, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @api_router.post("/conversation/{conversation_id}/export")
 async def export_conversation(conversation_id: str, request: ConversationExportRequest):
-    """Export conversation in various formats"""
+    """Export conversation in various formats (buffered; use /export/stream for large conversations)"""
     try:
         # Get conversation and messages
-        conversation = await db.conversations.find_one({"id": conversation_id})
+        conversation = await storage.get_conversation(conversation_id)
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
         
-        messages = await db.messages.find(
-            {"conversation_id": conversation_id}
-        ).sort("timestamp", 1).to_list(1000)
-        
         if request.format == "json":
+            messages = [
+                to_api_document(msg)
+                async for msg in iter_conversation_messages(conversation_id, fields=EXPORT_CSV_COLUMNS)
+            ]
             export_data = {
-                "conversation": conversation,
+                "conversation": to_api_document(conversation),
                 "messages": messages,
                 "exported_at": datetime.utcnow().isoformat()
             }
             
-            # Clean MongoDB ObjectIds
-            export_data = json.loads(json.dumps(export_data, default=str))
-            
             return {"format": "json", "data": export_data}
             
         elif request.format == "markdown":
-            markdown_content = f"# Conversation: {conversation['topic']}\n\n"
-            markdown_content += f"**Started:** {conversation['created_at']}\n"
-            markdown_content += f"**Agents:** {', '.join(conversation['agents'])}\n\n"
-            markdown_content += "## Messages\n\n"
-            
-            for msg in messages:
-                if msg.get('is_user'):
-                    markdown_content += f"**User:** {msg['content']}\n\n"
-                else:
-                    agent_name = AGENT_MODELS.get(msg.get('agent_type', ''), {}).get('name', 'Agent')
-                    markdown_content += f"**{agent_name}:** {msg['content']}\n\n"
-                    
-                    if msg.get('image_url'):
-                        markdown_content += f"![Generated Image]({msg['image_url']})\n\n"
-            
-            return {"format": "markdown", "content": markdown_content}
+            parts = [fragment async for fragment in export_rows(conversation, "markdown")]
+            return {"format": "markdown", "content": "".join(parts)}
         
         else:
             raise HTTPException(status_code=400, detail="Unsupported export format")
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error exporting conversation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Full-text search over message content and conversation topics (MongoDB text indexes)
+SEARCH_PAGE_SIZE_MAX = 100
+SEARCH_MAX_OFFSET = 1000
+SEARCH_SNIPPET_RADIUS = 80
+SEARCH_AGENT_PARTITIONS = [agent.value for agent in AgentType] + [None]  # None: user and system messages
+
+def search_terms(query: str) -> List[str]:
+    """Plain terms and quoted phrases of a $text query, without negations"""
+    phrases = re.findall(r'"([^"]+)"', query)
+    words = [word for word in re.sub(r'"[^"]*"', " ", query).split() if not word.startswith("-")]
+    return [term for term in phrases + words if term]
+
+def highlight_snippet(text: str, terms: List[str], radius: int = SEARCH_SNIPPET_RADIUS) -> str:
+    """HTML-escaped window around the first matching term with every match wrapped in <mark>"""
+    if not text:
+        return ""
+    pattern = re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE) if terms else None
+    match = pattern.search(text) if pattern else None
+    start = max(0, match.start() - radius) if match else 0
+    end = min(len(text), (match.end() + radius) if match else 2 * radius)
+    window = text[start:end]
+    parts, last = [], 0
+    if pattern:
+        for found in pattern.finditer(window):
+            parts.append(html.escape(window[last:found.start()]))
+            parts.append(f"<mark>{html.escape(found.group(0))}</mark>")
+            last = found.end()
+    parts.append(html.escape(window[last:]))
+    return ("…" if start > 0 else "") + "".join(parts) + ("…" if end < len(text) else "")
+
+async def search_messages(query: str, agent_type: Optional[str], start: Optional[datetime], end: Optional[datetime],
+                          status: Optional[str], offset: int, limit: int) -> tuple:
+    match: Dict[str, Any] = {"$text": {"$search": query}}
+    if status:
+        # Status lives on the conversation: resolve the matching conversations first, then search only their messages
+        conversations = {"status": status, **({"created_at": {"$lte": end}} if end else {})}
+        conversation_ids = [row["id"] async for row in db.conversations.find(conversations, {"_id": 0, "id": 1})]
+        if not conversation_ids:
+            return [], False
+        match["conversation_id"] = {"$in": conversation_ids}
+    if start or end:
+        match["timestamp"] = {}
+        if start:
+            match["timestamp"]["$gte"] = start
+        if end:
+            match["timestamp"]["$lte"] = end
+    window = offset + limit + 1
+
+    async def partition(agent: Optional[str]) -> List[dict]:
+        # Every filter sits in the $match, so the sort below is a top-k over the filtered matches only
+        return await db.messages.aggregate([
+            {"$match": {"agent_type": agent, **match}},
+            {"$sort": {"score": {"$meta": "textScore"}, "timestamp": -1}},
+            {"$limit": window},
+            {"$project": {"_id": 0, "id": 1, "conversation_id": 1, "agent_type": 1, "is_user": 1, "content": 1,
+                          "timestamp": 1, "score": {"$meta": "textScore"}}}
+        ]).to_list(window)
+
+    # The text index needs an equality on agent_type: unfiltered searches query each agent (and user messages) and merge
+    partitions = [agent_type] if agent_type else SEARCH_AGENT_PARTITIONS
+    results = [hit for hits in await asyncio.gather(*(partition(agent) for agent in partitions)) for hit in hits]
+    if len(partitions) > 1:
+        results.sort(key=lambda hit: (hit["score"], parse_timestamp(hit.get("timestamp") or datetime.min)), reverse=True)
+    results = results[offset:window]
+    return results[:limit], len(results) > limit
+
+async def search_conversations(query: str, agent_type: Optional[str], start: Optional[datetime], end: Optional[datetime],
+                               status: Optional[str], offset: int, limit: int) -> tuple:
+    match: Dict[str, Any] = {"$text": {"$search": query}}
+    if agent_type:
+        match["agents"] = agent_type
+    if status:
+        match["status"] = status
+    if start or end:
+        match["created_at"] = {}
+        if start:
+            match["created_at"]["$gte"] = start
+        if end:
+            match["created_at"]["$lte"] = end
+
+    results = await db.conversations.find(
+        match,
+        {"_id": 0, "id": 1, "topic": 1, "agents": 1, "status": 1, "created_at": 1, "score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"}), ("created_at", -1)]).skip(offset).limit(limit + 1).to_list(limit + 1)
+    return results[:limit], len(results) > limit
+
+@api_router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    scope: str = Query("messages", pattern="^(messages|conversations)$"),
+    agent_type: Optional[AgentType] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    status: Optional[str] = None,
+    offset: int = Query(0, ge=0, le=SEARCH_MAX_OFFSET),
+    limit: int = Query(20, ge=1, le=SEARCH_PAGE_SIZE_MAX)
+):
+    """Ranked full-text search over message content or conversation topics with highlighted snippets"""
+    require_mongo_features("Full-text search")
+    try:
+        start = parse_timestamp(start) if start else None
+        end = parse_timestamp(end) if end else None
+        agent = agent_type.value if agent_type else None
+        terms = search_terms(q)
+        
+        if scope == "messages":
+            hits, has_more = await search_messages(q, agent, start, end, status, offset, limit)
+            # Attach topics for the page only
+            conversation_ids = list({hit["conversation_id"] for hit in hits})
+            topics = {
+                conversation["id"]: conversation.get("topic")
+                async for conversation in db.conversations.find({"id": {"$in": conversation_ids}}, {"_id": 0, "id": 1, "topic": 1})
+            }
+            results = []
+            for hit in hits:
+                hit = to_api_document(hit)
+                hit["snippet"] = highlight_snippet(hit.pop("content", ""), terms)
+                hit["topic"] = topics.get(hit["conversation_id"])
+                results.append(hit)
+        else:
+            hits, has_more = await search_conversations(q, agent, start, end, status, offset, limit)
+            results = []
+            for hit in hits:
+                hit = to_api_document(hit)
+                hit["snippet"] = highlight_snippet(hit.get("topic", ""), terms)
+                results.append(hit)
+        
+        return {
+            "query": q,
+            "scope": scope,
+            "results": results,
+            "offset": offset,
+            "limit": limit,
+            "has_more": has_more,
+            "next_offset": offset + limit if has_more and offset + limit <= SEARCH_MAX_OFFSET else None
+        }
+    except Exception as e:
+        logger.error(f"Error searching {scope} for {q!r}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Bulk columnar export runs in a separate process (see bulk_export.py)
+BULK_EXPORT_DIR = Path(os.environ.get('BULK_EXPORT_DIR', str(ROOT_DIR / 'exports')))
+bulk_export_jobs: Dict[str, Dict[str, Any]] = {}
+
+def bulk_export_status(job_id: str) -> Dict[str, Any]:
+    job = bulk_export_jobs.get(job_id)
+    manifest_path = BULK_EXPORT_DIR / job_id / "manifest.json"
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else None
+    if job is None and manifest is None:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    process = job["process"] if job else None
+    return {
+        "job_id": job_id,
+        "output_dir": str(BULK_EXPORT_DIR / job_id),
+        "process": "running" if process and process.returncode is None else "exited" if process else "not_tracked",
+        "exit_code": process.returncode if process else None,
+        "manifest": manifest
+    }
+
+@api_router.post("/admin/exports/bulk")
+async def start_bulk_export(request: BulkExportRequest):
+    """Launch (or resume) a bulk Parquet/Arrow export of all conversations and messages"""
+    require_mongo_features("Bulk export")
+    job_id = request.job_id or datetime.utcnow().strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+    job = bulk_export_jobs.get(job_id)
+    if job and job["process"].returncode is None:
+        raise HTTPException(status_code=409, detail="Export job is already running")
+    
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, str(ROOT_DIR / "bulk_export.py"),
+        "--output", str(BULK_EXPORT_DIR / job_id),
+        "--format", request.format,
+        "--batch-size", str(request.batch_size),
+        cwd=str(ROOT_DIR)
+    )
+    bulk_export_jobs[job_id] = {"process": process, "started_at": datetime.utcnow()}
+    logger.info(f"Started bulk export {job_id} (pid {process.pid})")
+    return bulk_export_status(job_id)
+
+@api_router.get("/admin/exports/bulk/{job_id}")
+async def get_bulk_export(job_id: str):
+    """Report progress of a bulk export from its manifest"""
+    if not all(c.isalnum() or c in "-_" for c in job_id):
+        raise HTTPException(status_code=400, detail="Invalid job id")
+    return bulk_export_status(job_id)
+
 @api_router.get("/analytics/agents")
-async def get_agent_analytics():
-    """Get agent performance analytics"""
+async def get_agent_analytics(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: Optional[str] = Query(None, pattern="^(minute|hour|day)$")
+):
+    """Get agent performance analytics from the materialized rollup buckets"""
     try:
-        # Aggregate agent performance data
-        pipeline = [
-            {"$match": {"agent_type": {"$ne": None}, "is_user": False}},
-            {"$group": {
-                "_id": "$agent_type",
-                "total_messages": {"$sum": 1},
-                "avg_response_time": {"$avg": "$response_time"},
-                "total_tokens": {"$sum": "$token_count"},
-                "last_active": {"$max": "$timestamp"}
-            }}
-        ]
+        end = parse_timestamp(end) if end else None
+        start = parse_timestamp(start) if start else None
+        if granularity is None:
+            # Coarsest buckets that still resolve the requested range
+            span = (end or datetime.utcnow()) - start if start else None
+            if span is not None and span <= timedelta(hours=6):
+                granularity = "minute"
+            elif span is not None and span <= timedelta(days=14):
+                granularity = "hour"
+            else:
+                granularity = "day"
+        
+        buckets = await storage.rollup_buckets(
+            granularity,
+            ROLLUP_GRANULARITIES[granularity]["truncate"](start) if start else None,
+            end
+        )
         
-        results = await db.messages.aggregate(pipeline).to_list(100)
+        totals: Dict[str, Dict[str, Any]] = {}
+        for bucket in buckets:
+            result = totals.setdefault(bucket["agent_type"], {
+                "_id": bucket["agent_type"], "total_messages": 0, "latency_sum": 0.0, "latency_count": 0,
+                "total_tokens": 0, "errors": 0, "last_active": bucket["last_active"], "latency_histogram": defaultdict(int)
+            })
+            result["total_messages"] += bucket.get("message_count", 0)
+            result["latency_sum"] += bucket.get("latency_sum", 0.0)
+            result["latency_count"] += bucket.get("latency_count", 0)
+            result["total_tokens"] += bucket.get("tokens", 0)
+            result["errors"] += bucket.get("errors", 0)
+            result["last_active"] = max(result["last_active"], bucket["last_active"])
+            for label, count in (bucket.get("latency_histogram") or {}).items():
+                result["latency_histogram"][label] += count
+        results = list(totals.values())
         
         agent_metrics = []
         for result in results:
             if result["_id"] in AGENT_MODELS:
                 agent_config = AGENT_MODELS[result["_id"]]
+                total_messages = result.get("total_messages", 0) or 0
+                latency_count = result.get("latency_count", 0) or 0
                 metrics = AgentPerformanceMetrics(
                     agent_type=result["_id"],
-                    total_messages=result["total_messages"],
-                    avg_response_time=result.get("avg_response_time", 0.0) or 0.0,
-                    total_tokens=result.get("total_tokens", 0) or 0,
-                    error_rate=0.0,  # Calculate from error logs if needed
+                    total_messages=int(total_messages),
+                    avg_response_time=(result.get("latency_sum", 0.0) or 0.0) / latency_count if latency_count else 0.0,
+                    total_tokens=int(result.get("total_tokens", 0) or 0),
+                    error_rate=(result.get("errors", 0) or 0) / total_messages if total_messages else 0.0,
                     last_active=result["last_active"]
                 )
                 
+                histogram = {
+                    label: int(result["latency_histogram"].get(label, 0))
+                    for label, _ in latency_bucket_labels()
+                }
                 agent_data = metrics.dict()
                 agent_data["agent_config"] = agent_config
+                agent_data["latency_histogram"] = histogram
+                agent_data["p50_response_time"] = histogram_percentile(histogram, 0.5)
+                agent_data["p95_response_time"] = histogram_percentile(histogram, 0.95)
                 agent_metrics.append(agent_data)
         
-        return {"agent_metrics": agent_metrics}
+        return {
+            "agent_metrics": agent_metrics,
+            "granularity": granularity,
+            "start": start.isoformat() if start else None,
+            "end": end.isoformat() if end else None
+        }
         
     except Exception as e:
         logger.error(f"Error getting agent analytics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/analytics/llm-calls")
+async def get_llm_call_analytics(
+    window: int = Query(3600, ge=60, le=LLM_EVENT_RETENTION_SECONDS),
+    group_by: str = Query("model", pattern="^(model|key)$")
+):
+    """Per-model or per-key latency percentiles and error rates from the LLM event log"""
+    require_mongo_features("LLM call analytics")
+    try:
+        return {
+            "window_seconds": window,
+            "group_by": group_by,
+            "groups": await llm_events.window_stats(window, group_by)
+        }
+    except Exception as e:
+        logger.error(f"Error getting LLM call analytics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/analytics/llm-calls/events")
+async def get_llm_call_events(
+    conversation_id: Optional[str] = None,
+    errors_only: bool = False,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Most recent LLM attempts, optionally for one conversation, for investigating slow rounds"""
+    require_mongo_features("LLM call analytics")
+    query = {}
+    if conversation_id:
+        query["conversation_id"] = conversation_id
+    if errors_only:
+        query["error_class"] = {"$ne": None}
+    events = await db[llm_events.collection].find(query, {"_id": 0}).sort("ts", -1).limit(limit).to_list(limit)
+    return {"events": [to_api_document({"timestamp": event.pop("ts"), **event}) for event in events]}
+
+@api_router.post("/analytics/rollups/rebuild")
+async def rebuild_agent_rollups():
+    """Start recomputing the agent rollup buckets from the full message history"""
+    started = agent_rollups.start_rebuild()
+    return {"status": "started" if started else "already_running", **agent_rollups.rebuild_progress}
+
+@api_router.get("/analytics/rollups/rebuild")
+async def get_rollup_rebuild_progress():
+    """Report progress of the running or last agent rollup rebuild"""
+    return agent_rollups.rebuild_progress
+
+@api_router.get("/conversation/{conversation_id}/metrics")
+async def get_conversation_metrics(conversation_id: str):
+    """Get the incrementally maintained performance metrics and per-round novelty of a conversation"""
+    conversation = await storage.get_conversation(conversation_id, ["performance_metrics", "status", "novelty_rounds"])
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {
+        "conversation_id": conversation_id,
+        "status": conversation.get("status"),
+        "performance_metrics": conversation.get("performance_metrics") or {},
+        "novelty_rounds": conversation.get("novelty_rounds") or []
+    }
+
+@api_router.get("/conversation/{conversation_id}/consensus")
+async def get_conversation_consensus(conversation_id: str):
+    """Get the latest consensus status and the agreement score of every round"""
+    conversation = await storage.get_conversation(conversation_id, ["consensus_status", "consensus_rounds", "consensus_threshold", "status"])
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {
+        "conversation_id": conversation_id,
+        "status": conversation.get("status"),
+        "consensus_threshold": conversation.get("consensus_threshold"),
+        "consensus_status": conversation.get("consensus_status"),
+        "rounds": conversation.get("consensus_rounds") or []
+    }
+
+@api_router.get("/conversation/{conversation_id}/workflow")
+async def get_conversation_workflow(conversation_id: str):
+    """Get a workflow collaboration's steps, their results and the critical-path latency report"""
+    conversation = await storage.get_conversation(conversation_id, ["workflow", "workflow_steps", "workflow_report", "status"])
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    if not conversation.get("workflow"):
+        raise HTTPException(status_code=404, detail="Conversation is not a workflow collaboration")
+    steps = conversation.get("workflow_steps") or {}
+    return {
+        "conversation_id": conversation_id,
+        "status": conversation.get("status"),
+        "workflow": conversation["workflow"],
+        "steps": steps,
+        # Finished runs keep their report; running ones get one over the steps done so far
+        "report": conversation.get("workflow_report") or latency_report(Workflow.from_spec(conversation["workflow"]), steps)
+    }
+
+@api_router.post("/conversation/{conversation_id}/metrics/reconcile")
+async def reconcile_metrics(conversation_id: str):
+    """Recompute a conversation's performance metrics from its messages"""
+    conversation = await storage.get_conversation(conversation_id, ["id"])
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    metrics = await reconcile_conversation_metrics(conversation_id)
+    return {"conversation_id": conversation_id, "performance_metrics": metrics}
+
+@api_router.post("/admin/migrations/timestamps")
+async def start_timestamp_migration():
+    """Start (or resume) converting legacy string timestamps to BSON dates"""
+    require_mongo_features("Timestamp migration")
+    started = timestamp_migration.start()
+    return {"status": "started" if started else "already_running", **await timestamp_migration.progress()}
+
+@api_router.get("/admin/migrations/timestamps")
+async def get_timestamp_migration_progress():
+    """Report progress of the timestamp migration"""
+    require_mongo_features("Timestamp migration")
+    return await timestamp_migration.progress()
+
 # Add polling endpoint for real-time message updates (WebSocket alternative)
 @api_router.get("/conversation/{conversation_id}/poll")
-async def poll_conversation_updates(conversation_id: str):
-    """Enhanced polling endpoint with performance optimization"""
+async def poll_conversation_updates(
+    conversation_id: str,
+    wait: float = Query(0, ge=0, le=60),
+    since_version: Optional[int] = Query(None, ge=0),
+    limit: int = Query(MESSAGE_PAGE_SIZE_DEFAULT, ge=1, le=MESSAGE_PAGE_SIZE_MAX),
+    after: Optional[str] = None,
+    before: Optional[str] = None
+):
+    """Enhanced polling endpoint with performance optimization.
+
+    With wait > 0 the request is parked until a message in the conversation is
+    inserted or updated (or the wait expires). Pass the returned version as
+    since_version so changes between polls are not missed.
+    """
     try:
         # Check if conversation exists (with caching consideration)
-        conversation = await db.conversations.find_one({"id": conversation_id})
+        conversation = await storage.get_conversation(conversation_id)
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
+        viewer_presence.seen(conversation_id)
+        
+        # Long-poll: park until the conversation changes or the wait expires
+        if wait > 0:
+            baseline = since_version if since_version is not None else change_notifier.version(conversation_id)
+            if baseline == change_notifier.version(conversation_id):
+                if not change_notifier.can_park():
+                    change_notifier.stats["rejected"] += 1
+                    raise HTTPException(
+                        status_code=429,
+                        detail="Too many parked poll requests",
+                        headers={"Retry-After": "1"}
+                    )
+                changed = await change_notifier.wait_for_change(conversation_id, baseline, wait)
+                if changed:
+                    conversation = await storage.get_conversation(conversation_id) or conversation
+        
+        version = change_notifier.version(conversation_id)
         
-        # Get messages with optimized query
-        messages = await db.messages.find(
-            {"conversation_id": conversation_id}
-        ).sort("timestamp", 1).to_list(1000)
+        # Get one page of messages via keyset pagination
+        try:
+            messages, has_more = await fetch_message_page(conversation_id, after=after, before=before, limit=limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         # Format messages with enhanced data
         formatted_messages = []
         for msg in messages:
-            # Remove MongoDB _id for JSON serialization
-            if "_id" in msg:
-                del msg["_id"]
+            msg = to_api_document(msg)
             
             formatted_msg = {
                 "id": msg.get("id", ""),
@@ -1346,8 +4206,13 @@ async def poll_conversation_updates(conversation_id: str):
             "messages": formatted_messages,
             "total_messages": len(formatted_messages),
             "last_updated": datetime.utcnow().isoformat(),
-            "conversation_status": conversation.get("status", "active")
+            "conversation_status": conversation.get("status", "active"),
+            "version": version,
+            "has_more": has_more,
+            **page_cursors(messages)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error polling conversation updates: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1356,6 +4221,7 @@ async def poll_conversation_updates(conversation_id: str):
 @app.websocket("/api/ws/{conversation_id}")
 async def websocket_endpoint(websocket: WebSocket, conversation_id: str):
     await manager.connect(websocket, conversation_id)
+    viewer_presence.seen(conversation_id)
     logger.info(f"Enhanced WebSocket connected for conversation: {conversation_id}")
     try:
         # Send initial connection confirmation with enhanced data
@@ -1374,6 +4240,7 @@ async def websocket_endpoint(websocket: WebSocket, conversation_id: str):
             try:
                 # Send heartbeat every 30 seconds
                 await asyncio.sleep(30)
+                viewer_presence.seen(conversation_id)
                 await manager.send_to_conversation(json.dumps({
                     "type": "heartbeat",
                     "data": {"timestamp": datetime.utcnow().isoformat()}
@@ -1396,15 +4263,64 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Has-More", "X-Next-Cursor", "X-Prev-Cursor"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+background_tasks = set()
+
+@app.on_event("startup")
+async def open_storage():
+    await storage.start()
+
+@app.on_event("startup")
+async def watch_external_changes():
+    if cache_watcher and MONGO_FEATURES and CONVERSATION_CACHE_WATCH:
+        cache_watcher.start()
+
+@app.on_event("startup")
+async def start_collaboration_worker():
+    if COLLABORATION_WORKER_MODE == "external":
+        # Worker processes run the jobs; this process delivers the events they relay
+        await event_relay.ensure_collection()
+        event_relay.start_tailing()
+    else:
+        collaboration_worker.start()
+
+@app.on_event("startup")
+async def prepare_llm_event_log():
+    if not MONGO_FEATURES:
+        llm_events.storage = "disabled"
+        return
+    try:
+        await llm_events.ensure_collection()
+    except Exception as e:
+        logger.error(f"Could not prepare LLM event collection: {e}")
+
+@app.on_event("startup")
+async def bootstrap_indexes():
+    if not MONGO_FEATURES:
+        index_manager.status["state"] = "skipped"
+        return
+    if INDEX_VERIFY_STRICT:
+        # Refuse to serve traffic when a hot query would scan a whole collection
+        await index_manager.bootstrap()
+    else:
+        task = asyncio.create_task(index_manager.bootstrap())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await collaboration_worker.shutdown()
+    await event_relay.shutdown()
+    await message_checkpoints.shutdown()
+    await conversation_metrics.shutdown()
+    await agent_rollups.shutdown()
+    await llm_events.shutdown()
+    for task in list(context_windows.backfills.values()):
+        task.cancel()
+    await vector_memory_writer.shutdown()
+    if cache_watcher:
+        await cache_watcher.shutdown()
+    await storage.close()
     client.close()
\ No newline at end of file
@@ -0,0 +1,1031 @@
+"""Pluggable persistence for conversations, messages, summaries and analytics rollups.
+
+Three interchangeable backends implement StorageBackend:
+
+- MongoStorage: the production Motor backend
+- SQLiteStorage: embedded single-file database (WAL mode, group-committed writes)
+- MemoryStorage: pure in-process dictionaries, for tests, benchmarks and demos
+
+CachedStorage wraps any of them with a bounded cache of hot conversations.
+
+Documents keep the same shape on every backend: timestamps are naive UTC
+datetimes in storage and rendered as ISO strings only at the API layer.
+"""
+from pymongo import UpdateOne
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict, OrderedDict
+from datetime import datetime, timezone
+from typing import List, Optional, Dict, Any, Tuple
+import asyncio
+import sqlite3
+import threading
+import bisect
+import copy
+import json
+import time
+
+# Storage serialization - timestamps are stored as native datetimes, the API keeps emitting ISO strings
+DATETIME_FIELDS = ("timestamp", "created_at", "completed_at", "last_updated")
+STREAMING_STATES = ("started", "streaming")
+
+def parse_timestamp(value) -> datetime:
+    """Normalize an ISO string or datetime into a naive UTC datetime"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def to_storage_document(document: dict) -> dict:
+    """Copy of a document with its datetime fields converted to native datetimes"""
+    stored = dict(document)
+    for field in DATETIME_FIELDS:
+        if isinstance(stored.get(field), (str, datetime)):
+            stored[field] = parse_timestamp(stored[field])
+    return stored
+
+def to_api_document(document: dict) -> dict:
+    """Copy of a stored document with datetimes rendered as ISO strings and no _id"""
+    rendered = {k: v for k, v in document.items() if k != "_id"}
+    for field in DATETIME_FIELDS:
+        if isinstance(rendered.get(field), datetime):
+            rendered[field] = rendered[field].isoformat()
+    return rendered
+
+def _project(document: dict, fields: Optional[List[str]]) -> dict:
+    if fields is None:
+        return document
+    return {field: document[field] for field in fields if field in document}
+
+def _apply_inc(document: dict, inc: Dict[str, Any]):
+    """Apply a Mongo-style $inc (dotted paths allowed) to a plain dict"""
+    for path, amount in inc.items():
+        target = document
+        *parents, leaf = path.split(".")
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[leaf] = target.get(leaf, 0) + amount
+
+def _apply_metrics_delta(conversation: dict, delta: Dict[str, float]):
+    """Running-mean update of performance_metrics, the same math as the Mongo pipeline update"""
+    metrics = conversation.get("performance_metrics") or {}
+    samples = metrics.get("response_time_samples", 0)
+    average = metrics.get("avg_response_time", 0.0)
+    if delta["samples"]:
+        average = (average * samples + delta["response_time_sum"]) / (samples + delta["samples"])
+    conversation["performance_metrics"] = {
+        **metrics,
+        "total_messages": metrics.get("total_messages", 0) + delta["messages"],
+        "total_tokens": metrics.get("total_tokens", 0) + delta["tokens"],
+        "response_time_samples": samples + delta["samples"],
+        "avg_response_time": average
+    }
+
+class StorageBackend(ABC):
+    """Repository interface shared by every backend.
+
+    Message positions for pagination are (timestamp, id) tuples; message_page
+    always returns messages in chronological order.
+    """
+    name = "base"
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def ping(self):
+        pass
+
+    # Conversations
+    @abstractmethod
+    async def create_conversation(self, conversation: dict):
+        ...
+
+    @abstractmethod
+    async def get_conversation(self, conversation_id: str, fields: Optional[List[str]] = None) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def update_conversation(self, conversation_id: str, fields: dict):
+        ...
+
+    @abstractmethod
+    async def apply_conversation_metrics(self, deltas: Dict[str, Dict[str, float]]):
+        """Fold per-conversation deltas (messages, samples, response_time_sum, tokens) into performance_metrics"""
+
+    # Messages
+    @abstractmethod
+    async def insert_message(self, message: dict):
+        ...
+
+    @abstractmethod
+    async def update_message(self, message_id: str, fields: dict):
+        ...
+
+    @abstractmethod
+    async def checkpoint_messages(self, checkpoints: List[Tuple[str, dict]]):
+        """Apply partial updates only to messages that are still streaming"""
+
+    @abstractmethod
+    async def message_page(self, conversation_id: str, after: Optional[tuple] = None, before: Optional[tuple] = None,
+                           limit: int = 100, fields: Optional[List[str]] = None) -> List[dict]:
+        """Up to `limit` messages strictly between the positions: the first ones after `after`,
+        or, when `before` is given, the last ones before it"""
+
+    async def recent_messages(self, conversation_id: str, count: int) -> List[dict]:
+        return await self.message_page(conversation_id, before=(datetime.max, ""), limit=count)
+
+    async def message_stats(self, conversation_id: str, page_size: int = 1000) -> Dict[str, Any]:
+        """Finished-message count, response-time samples and sum, and token total of a conversation.
+
+        Embedded backends hold everything in process, so paging through the
+        messages is cheap; server-backed stores aggregate natively.
+        """
+        stats = {"total_messages": 0, "response_time_samples": 0, "response_time_sum": 0.0, "total_tokens": 0}
+        after = None
+        while True:
+            page = await self.message_page(conversation_id, after=after, limit=page_size,
+                                           fields=["id", "timestamp", "streaming_status", "response_time", "token_count"])
+            for message in page:
+                if message.get("streaming_status") in STREAMING_STATES:
+                    continue
+                stats["total_messages"] += 1
+                if isinstance(message.get("response_time"), (int, float)):
+                    stats["response_time_samples"] += 1
+                    stats["response_time_sum"] += message["response_time"]
+                if isinstance(message.get("token_count"), (int, float)):
+                    stats["total_tokens"] += message["token_count"]
+            if len(page) < page_size:
+                return stats
+            after = (page[-1]["timestamp"], page[-1]["id"])
+
+    @abstractmethod
+    async def iter_agent_messages(self, batch_size: int = 5000):
+        """Every agent-authored message, in no particular order"""
+
+    # Summaries
+    @abstractmethod
+    async def latest_summary(self, conversation_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def insert_summary(self, summary: dict):
+        ...
+
+    @abstractmethod
+    async def update_summary(self, summary_id: str, fields: dict):
+        ...
+
+    # Analytics rollups
+    @abstractmethod
+    async def apply_rollups(self, deltas: List[dict]):
+        """Upsert buckets keyed by granularity/bucket/agent_type/model with $inc and $max(last_active) semantics"""
+
+    @abstractmethod
+    async def rollup_buckets(self, granularity: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def clear_rollups(self):
+        ...
+
+class MongoStorage(StorageBackend):
+    name = "mongo"
+
+    def __init__(self, database):
+        self.db = database
+
+    async def ping(self):
+        await self.db.command("ping")
+
+    async def create_conversation(self, conversation: dict):
+        await self.db.conversations.insert_one(dict(conversation))
+
+    async def get_conversation(self, conversation_id: str, fields: Optional[List[str]] = None) -> Optional[dict]:
+        projection = {"_id": 0, **({field: 1 for field in fields} if fields else {})}
+        return await self.db.conversations.find_one({"id": conversation_id}, projection)
+
+    async def update_conversation(self, conversation_id: str, fields: dict):
+        await self.db.conversations.update_one({"id": conversation_id}, {"$set": fields})
+
+    @staticmethod
+    def _metrics_pipeline(delta: Dict[str, float]) -> List[dict]:
+        samples = {"$ifNull": ["$performance_metrics.response_time_samples", 0]}
+        average = {"$ifNull": ["$performance_metrics.avg_response_time", 0.0]}
+        new_average = average
+        if delta["samples"]:
+            # Running mean: (avg * n + sum(new)) / (n + k), evaluated against the stored values
+            new_average = {"$divide": [
+                {"$add": [{"$multiply": [average, samples]}, delta["response_time_sum"]]},
+                {"$add": [samples, delta["samples"]]}
+            ]}
+        return [{"$set": {
+            "performance_metrics.total_messages": {"$add": [{"$ifNull": ["$performance_metrics.total_messages", 0]}, delta["messages"]]},
+            "performance_metrics.total_tokens": {"$add": [{"$ifNull": ["$performance_metrics.total_tokens", 0]}, delta["tokens"]]},
+            "performance_metrics.response_time_samples": {"$add": [samples, delta["samples"]]},
+            "performance_metrics.avg_response_time": new_average
+        }}]
+
+    async def apply_conversation_metrics(self, deltas: Dict[str, Dict[str, float]]):
+        if deltas:
+            await self.db.conversations.bulk_write([
+                UpdateOne({"id": conversation_id}, self._metrics_pipeline(delta))
+                for conversation_id, delta in deltas.items()
+            ], ordered=False)
+
+    async def insert_message(self, message: dict):
+        await self.db.messages.insert_one(dict(message))
+
+    async def update_message(self, message_id: str, fields: dict):
+        await self.db.messages.update_one({"id": message_id}, {"$set": fields})
+
+    async def checkpoint_messages(self, checkpoints: List[Tuple[str, dict]]):
+        if checkpoints:
+            await self.db.messages.bulk_write([
+                UpdateOne({"id": message_id, "streaming_status": {"$in": list(STREAMING_STATES)}}, {"$set": fields})
+                for message_id, fields in checkpoints
+            ], ordered=False)
+
+    @staticmethod
+    def _keyset_filter(position: tuple, direction: str) -> dict:
+        timestamp, message_id = position
+        query = {"$or": [
+            {"timestamp": {direction: timestamp}},
+            {"timestamp": timestamp, "id": {direction: message_id}}
+        ]}
+        # Comparisons only match the same BSON type and strings sort before dates,
+        # so until the timestamp migration finishes the other type is added explicitly
+        if direction == "$gt" and isinstance(timestamp, str):
+            query["$or"].append({"timestamp": {"$type": "date"}})
+        elif direction == "$lt" and isinstance(timestamp, datetime):
+            query["$or"].append({"timestamp": {"$type": "string"}})
+        return query
+
+    async def message_page(self, conversation_id: str, after: Optional[tuple] = None, before: Optional[tuple] = None,
+                           limit: int = 100, fields: Optional[List[str]] = None) -> List[dict]:
+        conditions = [{"conversation_id": conversation_id}]
+        if after:
+            conditions.append(self._keyset_filter(after, "$gt"))
+        if before and before[0] != datetime.max:
+            conditions.append(self._keyset_filter(before, "$lt"))
+        query = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+        direction = -1 if before else 1
+        projection = {"_id": 0, **({field: 1 for field in fields} if fields else {})}
+        messages = await self.db.messages.find(query, projection).sort(
+            [("timestamp", direction), ("id", direction)]
+        ).limit(limit).to_list(limit)
+        if before:
+            messages.reverse()
+        return messages
+
+    async def message_stats(self, conversation_id: str, page_size: int = 1000) -> Dict[str, Any]:
+        rows = await self.db.messages.aggregate([
+            {"$match": {"conversation_id": conversation_id, "streaming_status": {"$nin": list(STREAMING_STATES)}}},
+            {"$group": {
+                "_id": None,
+                "total_messages": {"$sum": 1},
+                "response_time_samples": {"$sum": {"$cond": [{"$isNumber": "$response_time"}, 1, 0]}},
+                "response_time_sum": {"$sum": "$response_time"},
+                "total_tokens": {"$sum": "$token_count"}
+            }}
+        ]).to_list(1)
+        stats = {"total_messages": 0, "response_time_samples": 0, "response_time_sum": 0.0, "total_tokens": 0}
+        if rows:
+            stats.update({key: rows[0][key] for key in stats})
+        return stats
+
+    async def iter_agent_messages(self, batch_size: int = 5000):
+        cursor = self.db.messages.find(
+            {"agent_type": {"$ne": None}, "is_user": False},
+            {"_id": 0, "agent_type": 1, "timestamp": 1, "response_time": 1, "token_count": 1, "content": 1, "streaming_status": 1}
+        ).batch_size(batch_size)
+        async for message in cursor:
+            yield message
+
+    async def latest_summary(self, conversation_id: str) -> Optional[dict]:
+        return await self.db.summaries.find_one({"conversation_id": conversation_id}, {"_id": 0}, sort=[("timestamp", -1)])
+
+    async def insert_summary(self, summary: dict):
+        await self.db.summaries.insert_one(dict(summary))
+
+    async def update_summary(self, summary_id: str, fields: dict):
+        await self.db.summaries.update_one({"id": summary_id}, {"$set": fields})
+
+    async def apply_rollups(self, deltas: List[dict]):
+        operations = []
+        for delta in deltas:
+            update = {"$inc": delta["inc"], "$max": {"last_active": delta["last_active"]}}
+            if delta.get("expires_at"):
+                update["$setOnInsert"] = {"expires_at": delta["expires_at"]}
+            operations.append(UpdateOne(
+                {"granularity": delta["granularity"], "bucket": delta["bucket"], "agent_type": delta["agent_type"], "model": delta["model"]},
+                update,
+                upsert=True
+            ))
+        if operations:
+            await self.db.agent_rollups.bulk_write(operations, ordered=False)
+
+    async def rollup_buckets(self, granularity: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[dict]:
+        query: Dict[str, Any] = {"granularity": granularity}
+        if start or end:
+            query["bucket"] = {}
+            if start:
+                query["bucket"]["$gte"] = start
+            if end:
+                query["bucket"]["$lte"] = end
+        return await self.db.agent_rollups.find(query, {"_id": 0}).to_list(None)
+
+    async def clear_rollups(self):
+        await self.db.agent_rollups.delete_many({})
+
+class MemoryStorage(StorageBackend):
+    """Dictionaries plus a per-conversation sorted (timestamp, id) index; nothing survives a restart"""
+    name = "memory"
+
+    def __init__(self):
+        self.conversations: Dict[str, dict] = {}
+        self.messages: Dict[str, dict] = {}
+        self.timelines: Dict[str, List[tuple]] = defaultdict(list)
+        self.summaries: Dict[str, List[dict]] = defaultdict(list)
+        self.rollups: Dict[tuple, dict] = {}
+
+    async def create_conversation(self, conversation: dict):
+        if conversation["id"] in self.conversations:
+            raise ValueError(f"Duplicate conversation id {conversation['id']}")
+        self.conversations[conversation["id"]] = copy.deepcopy(conversation)
+
+    async def get_conversation(self, conversation_id: str, fields: Optional[List[str]] = None) -> Optional[dict]:
+        conversation = self.conversations.get(conversation_id)
+        return _project(copy.deepcopy(conversation), fields) if conversation else None
+
+    async def update_conversation(self, conversation_id: str, fields: dict):
+        if conversation_id in self.conversations:
+            self.conversations[conversation_id].update(copy.deepcopy(fields))
+
+    async def apply_conversation_metrics(self, deltas: Dict[str, Dict[str, float]]):
+        for conversation_id, delta in deltas.items():
+            if conversation_id in self.conversations:
+                _apply_metrics_delta(self.conversations[conversation_id], delta)
+
+    async def insert_message(self, message: dict):
+        if message["id"] in self.messages:
+            raise ValueError(f"Duplicate message id {message['id']}")
+        self.messages[message["id"]] = dict(message)
+        bisect.insort(self.timelines[message["conversation_id"]], (message["timestamp"], message["id"]))
+
+    async def update_message(self, message_id: str, fields: dict):
+        if message_id in self.messages:
+            self.messages[message_id].update(fields)
+
+    async def checkpoint_messages(self, checkpoints: List[Tuple[str, dict]]):
+        for message_id, fields in checkpoints:
+            message = self.messages.get(message_id)
+            if message and message.get("streaming_status") in STREAMING_STATES:
+                message.update(fields)
+
+    async def message_page(self, conversation_id: str, after: Optional[tuple] = None, before: Optional[tuple] = None,
+                           limit: int = 100, fields: Optional[List[str]] = None) -> List[dict]:
+        timeline = self.timelines.get(conversation_id, [])
+        low = bisect.bisect_right(timeline, (parse_timestamp(after[0]), after[1])) if after else 0
+        high = bisect.bisect_left(timeline, (parse_timestamp(before[0]), before[1])) if before else len(timeline)
+        keys = timeline[max(low, high - limit):high] if before else timeline[low:min(high, low + limit)]
+        return [_project(dict(self.messages[message_id]), fields) for _, message_id in keys]
+
+    async def iter_agent_messages(self, batch_size: int = 5000):
+        for message in list(self.messages.values()):
+            if message.get("agent_type") and not message.get("is_user"):
+                yield dict(message)
+
+    async def latest_summary(self, conversation_id: str) -> Optional[dict]:
+        summaries = self.summaries.get(conversation_id)
+        return copy.deepcopy(max(summaries, key=lambda summary: summary["timestamp"])) if summaries else None
+
+    async def insert_summary(self, summary: dict):
+        self.summaries[summary["conversation_id"]].append(copy.deepcopy(summary))
+
+    async def update_summary(self, summary_id: str, fields: dict):
+        for summaries in self.summaries.values():
+            for summary in summaries:
+                if summary["id"] == summary_id:
+                    summary.update(copy.deepcopy(fields))
+
+    async def apply_rollups(self, deltas: List[dict]):
+        for delta in deltas:
+            key = (delta["granularity"], delta["bucket"], delta["agent_type"], delta["model"])
+            bucket = self.rollups.get(key)
+            if bucket is None:
+                bucket = self.rollups[key] = {
+                    "granularity": delta["granularity"], "bucket": delta["bucket"],
+                    "agent_type": delta["agent_type"], "model": delta["model"],
+                    "last_active": delta["last_active"], "expires_at": delta.get("expires_at")
+                }
+            _apply_inc(bucket, delta["inc"])
+            bucket["last_active"] = max(bucket["last_active"], delta["last_active"])
+
+    async def rollup_buckets(self, granularity: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[dict]:
+        now = datetime.utcnow()
+        return [
+            copy.deepcopy(bucket) for (bucket_granularity, bucket_start, _, _), bucket in self.rollups.items()
+            if bucket_granularity == granularity
+            and (start is None or bucket_start >= start)
+            and (end is None or bucket_start <= end)
+            and (bucket.get("expires_at") is None or bucket["expires_at"] > now)
+        ]
+
+    async def clear_rollups(self):
+        self.rollups.clear()
+
+def _encode_datetime(value):
+    if isinstance(value, datetime):
+        return {"$date": value.strftime("%Y-%m-%dT%H:%M:%S.%f")}
+    if hasattr(value, "value"):  # str enums such as AgentType
+        return value.value
+    raise TypeError(f"Cannot store {type(value).__name__}")
+
+def _decode_datetime(document: dict):
+    if set(document) == {"$date"}:
+        return datetime.strptime(document["$date"], "%Y-%m-%dT%H:%M:%S.%f")
+    return document
+
+def _dumps(document: dict) -> str:
+    return json.dumps(document, default=_encode_datetime, separators=(",", ":"))
+
+def _loads(raw: str) -> dict:
+    return json.loads(raw, object_hook=_decode_datetime)
+
+def _sort_key(timestamp) -> str:
+    # Fixed-width so lexicographic order equals chronological order
+    return parse_timestamp(timestamp).strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+class SQLiteStorage(StorageBackend):
+    """Embedded backend on one SQLite file.
+
+    The write connection lives on a dedicated thread. Writes are queued and
+    group-committed: everything queued while the previous transaction ran is
+    applied in the next one, each operation under its own savepoint so one
+    failure does not abort the others. In WAL mode readers never block the
+    writer, so reads run on a small pool of their own connections.
+    """
+    name = "sqlite"
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS conversations (id TEXT PRIMARY KEY, doc TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS messages (id TEXT PRIMARY KEY, conversation_id TEXT NOT NULL, ts TEXT NOT NULL, "
+        "streaming_status TEXT, is_agent INTEGER NOT NULL, doc TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS messages_timeline ON messages (conversation_id, ts, id)",
+        "CREATE TABLE IF NOT EXISTS summaries (id TEXT PRIMARY KEY, conversation_id TEXT NOT NULL, ts TEXT NOT NULL, doc TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS summaries_timeline ON summaries (conversation_id, ts)",
+        "CREATE TABLE IF NOT EXISTS agent_rollups (granularity TEXT NOT NULL, agent_type TEXT NOT NULL, bucket TEXT NOT NULL, "
+        "model TEXT NOT NULL, expires_at TEXT, doc TEXT NOT NULL, PRIMARY KEY (granularity, agent_type, bucket, model))",
+        "CREATE INDEX IF NOT EXISTS agent_rollups_range ON agent_rollups (granularity, bucket)"
+    ]
+
+    def __init__(self, path: str, max_batch: int = 500, readers: int = 2):
+        self.path = path
+        self.max_batch = max_batch
+        self.readers = readers
+        self.conn: Optional[sqlite3.Connection] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.read_executor: Optional[ThreadPoolExecutor] = None
+        self.read_local = threading.local()
+        self.read_connections: List[sqlite3.Connection] = []
+        self.queue: Optional[asyncio.Queue] = None
+        self.writer: Optional[asyncio.Task] = None
+        self.stats = {"transactions": 0, "writes": 0}
+
+    def _open(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            self.conn.execute(statement)
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _read(self, sql: str, params: tuple = ()) -> List[tuple]:
+        conn = getattr(self.read_local, "conn", None)
+        if conn is None:
+            conn = self.read_local.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.read_connections.append(conn)
+        return conn.execute(sql, params).fetchall()
+
+    async def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        return await asyncio.get_running_loop().run_in_executor(self.read_executor, self._read, sql, params)
+
+    async def start(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-storage")
+        self.read_executor = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="sqlite-storage-read")
+        self.queue = asyncio.Queue()
+        await self._call(self._open)
+        self.writer = asyncio.create_task(self._write_loop())
+
+    async def close(self):
+        if self.writer:
+            await self.queue.join()
+            self.writer.cancel()
+        if self.read_executor:
+            self.read_executor.shutdown(wait=True)
+            for conn in self.read_connections:
+                conn.close()
+        if self.conn:
+            await self._call(self.conn.close)
+        if self.executor:
+            self.executor.shutdown(wait=True)
+
+    async def ping(self):
+        await self._query("SELECT 1")
+
+    async def _write(self, fn, *args):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((fn, args, future))
+        return await future
+
+    def _run_batch(self, batch: list) -> list:
+        results = []
+        self.conn.execute("BEGIN")
+        for fn, args, _ in batch:
+            self.conn.execute("SAVEPOINT op")
+            try:
+                results.append((True, fn(*args)))
+                self.conn.execute("RELEASE op")
+            except Exception as e:
+                self.conn.execute("ROLLBACK TO op")
+                self.conn.execute("RELEASE op")
+                results.append((False, e))
+        self.conn.execute("COMMIT")
+        return results
+
+    async def _write_loop(self):
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty() and len(batch) < self.max_batch:
+                batch.append(self.queue.get_nowait())
+            try:
+                results = await self._call(self._run_batch, batch)
+            except Exception as e:
+                results = [(False, e)] * len(batch)
+            self.stats["transactions"] += 1
+            self.stats["writes"] += len(batch)
+            for (_, _, future), (ok, value) in zip(batch, results):
+                if not future.done():
+                    future.set_result(value) if ok else future.set_exception(value)
+                self.queue.task_done()
+
+    def _select(self, sql: str, params: tuple = ()) -> List[tuple]:
+        return self.conn.execute(sql, params).fetchall()
+
+    # Conversations
+    async def create_conversation(self, conversation: dict):
+        await self._write(lambda: self.conn.execute(
+            "INSERT INTO conversations (id, doc) VALUES (?, ?)", (conversation["id"], _dumps(conversation))
+        ))
+
+    async def get_conversation(self, conversation_id: str, fields: Optional[List[str]] = None) -> Optional[dict]:
+        rows = await self._query("SELECT doc FROM conversations WHERE id = ?", (conversation_id,))
+        return _project(_loads(rows[0][0]), fields) if rows else None
+
+    def _modify_conversation(self, conversation_id: str, change):
+        rows = self._select("SELECT doc FROM conversations WHERE id = ?", (conversation_id,))
+        if rows:
+            conversation = _loads(rows[0][0])
+            change(conversation)
+            self.conn.execute("UPDATE conversations SET doc = ? WHERE id = ?", (_dumps(conversation), conversation_id))
+
+    async def update_conversation(self, conversation_id: str, fields: dict):
+        await self._write(self._modify_conversation, conversation_id, lambda conversation: conversation.update(fields))
+
+    async def apply_conversation_metrics(self, deltas: Dict[str, Dict[str, float]]):
+        await asyncio.gather(*(
+            self._write(self._modify_conversation, conversation_id, lambda conversation, delta=delta: _apply_metrics_delta(conversation, delta))
+            for conversation_id, delta in deltas.items()
+        ))
+
+    # Messages
+    async def insert_message(self, message: dict):
+        await self._write(lambda: self.conn.execute(
+            "INSERT INTO messages (id, conversation_id, ts, streaming_status, is_agent, doc) VALUES (?, ?, ?, ?, ?, ?)",
+            (message["id"], message["conversation_id"], _sort_key(message["timestamp"]),
+             message.get("streaming_status"), int(bool(message.get("agent_type")) and not message.get("is_user")), _dumps(message))
+        ))
+
+    def _modify_message(self, message_id: str, fields: dict, only_streaming: bool):
+        rows = self._select("SELECT doc, streaming_status FROM messages WHERE id = ?", (message_id,))
+        if not rows or (only_streaming and rows[0][1] not in STREAMING_STATES):
+            return
+        message = _loads(rows[0][0])
+        message.update(fields)
+        self.conn.execute(
+            "UPDATE messages SET doc = ?, streaming_status = ? WHERE id = ?",
+            (_dumps(message), message.get("streaming_status"), message_id)
+        )
+
+    async def update_message(self, message_id: str, fields: dict):
+        await self._write(self._modify_message, message_id, fields, False)
+
+    async def checkpoint_messages(self, checkpoints: List[Tuple[str, dict]]):
+        await asyncio.gather(*(
+            self._write(self._modify_message, message_id, fields, True) for message_id, fields in checkpoints
+        ))
+
+    async def message_page(self, conversation_id: str, after: Optional[tuple] = None, before: Optional[tuple] = None,
+                           limit: int = 100, fields: Optional[List[str]] = None) -> List[dict]:
+        sql = "SELECT doc FROM messages WHERE conversation_id = ?"
+        params: list = [conversation_id]
+        if after:
+            sql += " AND (ts, id) > (?, ?)"
+            params += [_sort_key(after[0]), after[1]]
+        if before and before[0] != datetime.max:
+            sql += " AND (ts, id) < (?, ?)"
+            params += [_sort_key(before[0]), before[1]]
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?" if before else " ORDER BY ts, id LIMIT ?"
+        params.append(limit)
+        rows = await self._query(sql, tuple(params))
+        if before:
+            rows.reverse()
+        return [_project(_loads(row[0]), fields) for row in rows]
+
+    async def iter_agent_messages(self, batch_size: int = 5000):
+        last_rowid = 0
+        while True:
+            rows = await self._query(
+                "SELECT rowid, doc FROM messages WHERE is_agent = 1 AND rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, batch_size)
+            )
+            if not rows:
+                return
+            for _, doc in rows:
+                yield _loads(doc)
+            last_rowid = rows[-1][0]
+
+    # Summaries
+    async def latest_summary(self, conversation_id: str) -> Optional[dict]:
+        rows = await self._query(
+            "SELECT doc FROM summaries WHERE conversation_id = ? ORDER BY ts DESC LIMIT 1", (conversation_id,)
+        )
+        return _loads(rows[0][0]) if rows else None
+
+    async def insert_summary(self, summary: dict):
+        await self._write(lambda: self.conn.execute(
+            "INSERT INTO summaries (id, conversation_id, ts, doc) VALUES (?, ?, ?, ?)",
+            (summary["id"], summary["conversation_id"], _sort_key(summary["timestamp"]), _dumps(summary))
+        ))
+
+    def _modify_summary(self, summary_id: str, fields: dict):
+        rows = self._select("SELECT doc FROM summaries WHERE id = ?", (summary_id,))
+        if rows:
+            summary = _loads(rows[0][0])
+            summary.update(fields)
+            self.conn.execute("UPDATE summaries SET doc = ? WHERE id = ?", (_dumps(summary), summary_id))
+
+    async def update_summary(self, summary_id: str, fields: dict):
+        await self._write(self._modify_summary, summary_id, fields)
+
+    # Analytics rollups
+    def _apply_rollup(self, delta: dict):
+        key = (delta["granularity"], delta["agent_type"], _sort_key(delta["bucket"]), delta["model"])
+        rows = self._select(
+            "SELECT doc FROM agent_rollups WHERE granularity = ? AND agent_type = ? AND bucket = ? AND model = ?", key
+        )
+        if rows:
+            bucket = _loads(rows[0][0])
+        else:
+            bucket = {
+                "granularity": delta["granularity"], "bucket": delta["bucket"], "agent_type": delta["agent_type"],
+                "model": delta["model"], "last_active": delta["last_active"], "expires_at": delta.get("expires_at")
+            }
+        _apply_inc(bucket, delta["inc"])
+        bucket["last_active"] = max(bucket["last_active"], delta["last_active"])
+        expires_at = _sort_key(bucket["expires_at"]) if bucket.get("expires_at") else None
+        self.conn.execute(
+            "INSERT OR REPLACE INTO agent_rollups (granularity, agent_type, bucket, model, expires_at, doc) VALUES (?, ?, ?, ?, ?, ?)",
+            (*key, expires_at, _dumps(bucket))
+        )
+
+    async def apply_rollups(self, deltas: List[dict]):
+        await asyncio.gather(*(self._write(self._apply_rollup, delta) for delta in deltas))
+
+    async def rollup_buckets(self, granularity: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[dict]:
+        sql = "SELECT doc FROM agent_rollups WHERE granularity = ? AND (expires_at IS NULL OR expires_at > ?)"
+        params: list = [granularity, _sort_key(datetime.utcnow())]
+        if start:
+            sql += " AND bucket >= ?"
+            params.append(_sort_key(start))
+        if end:
+            sql += " AND bucket <= ?"
+            params.append(_sort_key(end))
+        rows = await self._query(sql, tuple(params))
+        return [_loads(row[0]) for row in rows]
+
+    async def clear_rollups(self):
+        await self._write(lambda: self.conn.execute("DELETE FROM agent_rollups"))
+
+class CachedConversation:
+    """Cached state of one conversation.
+
+    `messages` is the newest slice of the timeline once primed: nothing newer
+    is missing from it, and `complete` means it holds the whole timeline.
+    `writes` counts write-through updates so a load that raced with a write
+    can be discarded instead of caching a stale snapshot.
+    """
+    __slots__ = ("conversation", "messages", "keys", "primed", "complete", "writes", "loaded_at")
+
+    def __init__(self):
+        self.conversation: Optional[dict] = None
+        self.messages: List[dict] = []
+        self.keys: List[tuple] = []
+        self.primed = False
+        self.complete = False
+        self.writes = 0
+        self.loaded_at = time.monotonic()
+
+class CachedStorage(StorageBackend):
+    """Write-through LRU/TTL cache of active conversations in front of another backend.
+
+    Holds each hot conversation's document and its newest `window` messages,
+    so polling, generation and summary paths stop re-reading them. Writes made
+    through this object update the cache; writes by other processes are
+    applied by calling external_change (or are picked up when the entry's TTL
+    expires). Summaries and rollups pass straight through.
+    """
+    def __init__(self, inner: StorageBackend, max_entries: int = 1000, ttl_seconds: float = 30.0,
+                 window: int = 200, own_write_grace_seconds: float = 30.0):
+        self.inner = inner
+        self.name = inner.name
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.window = window
+        self.own_write_grace = own_write_grace_seconds
+        self.entries: "OrderedDict[str, CachedConversation]" = OrderedDict()
+        self.message_index: Dict[str, str] = {}
+        # (collection, document id) -> (pending count, last write time) for telling our writes from foreign ones
+        self.own_writes: Dict[tuple, list] = {}
+        self.stats = {
+            "conversation_hits": 0,
+            "conversation_misses": 0,
+            "message_hits": 0,
+            "message_misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0
+        }
+
+    async def start(self):
+        await self.inner.start()
+
+    async def close(self):
+        await self.inner.close()
+
+    async def ping(self):
+        await self.inner.ping()
+
+    # Entry bookkeeping
+    def _entry(self, conversation_id: str) -> Optional[CachedConversation]:
+        entry = self.entries.get(conversation_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.loaded_at > self.ttl:
+            self.stats["expirations"] += 1
+            self._drop(conversation_id)
+            return None
+        self.entries.move_to_end(conversation_id)
+        return entry
+
+    def _ensure_entry(self, conversation_id: str) -> CachedConversation:
+        entry = self._entry(conversation_id)
+        if entry is None:
+            entry = self.entries[conversation_id] = CachedConversation()
+            while len(self.entries) > self.max_entries:
+                evicted, _ = self.entries.popitem(last=False)
+                self._forget_messages(evicted)
+                self.stats["evictions"] += 1
+        return entry
+
+    def _forget_messages(self, conversation_id: str, entry: Optional[CachedConversation] = None):
+        entry = entry or self.entries.get(conversation_id)
+        for message in (entry.messages if entry else []):
+            self.message_index.pop(message["id"], None)
+
+    def _drop(self, conversation_id: str):
+        entry = self.entries.pop(conversation_id, None)
+        if entry:
+            self._forget_messages(conversation_id, entry)
+
+    def invalidate(self, conversation_id: str):
+        if conversation_id in self.entries:
+            self.stats["invalidations"] += 1
+            self._drop(conversation_id)
+
+    def _note_own_write(self, collection: str, document_id: str):
+        pending = self.own_writes.get((collection, document_id))
+        if pending and time.monotonic() - pending[1] <= self.own_write_grace:
+            pending[0] += 1
+            pending[1] = time.monotonic()
+        else:
+            self.own_writes[(collection, document_id)] = [1, time.monotonic()]
+        if len(self.own_writes) > 10 * self.max_entries * max(self.window, 1):
+            cutoff = time.monotonic() - self.own_write_grace
+            self.own_writes = {key: value for key, value in self.own_writes.items() if value[1] >= cutoff}
+
+    def external_change(self, collection: str, document_id: str, conversation_id: Optional[str]) -> bool:
+        """Account for a change observed on the database; returns True (and invalidates) when another process made it"""
+        pending = self.own_writes.get((collection, document_id))
+        if pending and pending[0] > 0 and time.monotonic() - pending[1] <= self.own_write_grace:
+            pending[0] -= 1
+            if not pending[0]:
+                del self.own_writes[(collection, document_id)]
+            return False
+        if conversation_id:
+            self.invalidate(conversation_id)
+        return True
+
+    # Conversations
+    async def create_conversation(self, conversation: dict):
+        # Noted before the write: its change event can be observed before this coroutine resumes
+        self._note_own_write("conversations", conversation["id"])
+        await self.inner.create_conversation(conversation)
+        entry = self._ensure_entry(conversation["id"])
+        entry.conversation = copy.deepcopy(conversation)
+        entry.primed = entry.complete = True
+        entry.writes += 1
+
+    async def get_conversation(self, conversation_id: str, fields: Optional[List[str]] = None) -> Optional[dict]:
+        entry = self._entry(conversation_id)
+        if entry is not None and entry.conversation is not None:
+            self.stats["conversation_hits"] += 1
+            return _project(copy.deepcopy(entry.conversation), fields)
+        self.stats["conversation_misses"] += 1
+        # The entry exists before the read so a concurrent write can mark the result stale
+        entry = self._ensure_entry(conversation_id)
+        writes = entry.writes
+        conversation = await self.inner.get_conversation(conversation_id)
+        entry = self.entries.get(conversation_id)
+        if conversation is None:
+            if entry is not None and entry.conversation is None and not entry.primed:
+                self._drop(conversation_id)
+            return None
+        if entry is not None and entry.writes == writes and entry.conversation is None:
+            entry.conversation = copy.deepcopy(conversation)
+        return _project(conversation, fields)
+
+    async def update_conversation(self, conversation_id: str, fields: dict):
+        self._note_own_write("conversations", conversation_id)
+        await self.inner.update_conversation(conversation_id, fields)
+        entry = self.entries.get(conversation_id)
+        if entry:
+            entry.writes += 1
+            if entry.conversation is not None:
+                entry.conversation.update(copy.deepcopy(fields))
+
+    async def apply_conversation_metrics(self, deltas: Dict[str, Dict[str, float]]):
+        for conversation_id in deltas:
+            self._note_own_write("conversations", conversation_id)
+        await self.inner.apply_conversation_metrics(deltas)
+        for conversation_id, delta in deltas.items():
+            entry = self.entries.get(conversation_id)
+            if entry:
+                entry.writes += 1
+                if entry.conversation is not None:
+                    _apply_metrics_delta(entry.conversation, delta)
+
+    # Messages
+    async def insert_message(self, message: dict):
+        self._note_own_write("messages", message["id"])
+        await self.inner.insert_message(message)
+        entry = self.entries.get(message["conversation_id"])
+        if entry is None:
+            return
+        entry.writes += 1
+        if not entry.primed:
+            return
+        key = (message["timestamp"], message["id"])
+        try:
+            position = bisect.bisect_right(entry.keys, key)
+        except TypeError:
+            # Legacy string timestamps cannot be ordered against the window
+            self._drop(message["conversation_id"])
+            return
+        if position == 0 and not entry.complete:
+            # Older than a partial window: storing it would leave a gap before the window start
+            return
+        entry.keys.insert(position, key)
+        entry.messages.insert(position, dict(message))
+        self.message_index[message["id"]] = message["conversation_id"]
+        if len(entry.messages) > self.window:
+            oldest = entry.messages.pop(0)
+            entry.keys.pop(0)
+            self.message_index.pop(oldest["id"], None)
+            entry.complete = False
+
+    def _cached_message(self, message_id: str) -> Optional[dict]:
+        conversation_id = self.message_index.get(message_id)
+        entry = self.entries.get(conversation_id) if conversation_id else None
+        if entry is None:
+            return None
+        entry.writes += 1
+        position = next((i for i in range(len(entry.messages) - 1, -1, -1) if entry.messages[i]["id"] == message_id), None)
+        return entry.messages[position] if position is not None else None
+
+    async def update_message(self, message_id: str, fields: dict):
+        self._note_own_write("messages", message_id)
+        await self.inner.update_message(message_id, fields)
+        message = self._cached_message(message_id)
+        if message is not None:
+            message.update(fields)
+
+    async def checkpoint_messages(self, checkpoints: List[Tuple[str, dict]]):
+        applied = []
+        for message_id, fields in checkpoints:
+            message = self._cached_message(message_id)
+            # Checkpoints that the backend will skip produce no change event
+            if message is None or message.get("streaming_status") in STREAMING_STATES:
+                self._note_own_write("messages", message_id)
+            if message is not None and message.get("streaming_status") in STREAMING_STATES:
+                applied.append((message, fields))
+        await self.inner.checkpoint_messages(checkpoints)
+        for message, fields in applied:
+            message.update(fields)
+
+    def _window_page(self, entry: CachedConversation, after: Optional[tuple], before: Optional[tuple], limit: int) -> Optional[List[dict]]:
+        """Serve a page from the cached window, or None when the window cannot prove it has every row"""
+        try:
+            low = bisect.bisect_right(entry.keys, (after[0], after[1])) if after else 0
+            high = bisect.bisect_left(entry.keys, (before[0], before[1])) if before and before[0] != datetime.max else len(entry.keys)
+            covers_after = entry.complete or (after is not None and bool(entry.keys) and (after[0], after[1]) >= entry.keys[0])
+        except TypeError:
+            return None
+        if before:
+            start = max(low, high - limit)
+            if high - start < limit and not covers_after:
+                return None
+            return entry.messages[start:high]
+        if not covers_after:
+            return None
+        return entry.messages[low:min(high, low + limit)]
+
+    async def _prime(self, conversation_id: str):
+        entry = self._ensure_entry(conversation_id)
+        writes = entry.writes
+        messages = await self.inner.recent_messages(conversation_id, self.window)
+        entry = self.entries.get(conversation_id)
+        if entry is None or entry.writes != writes or entry.primed:
+            return
+        if any(not isinstance(message.get("timestamp"), datetime) for message in messages):
+            return
+        entry.messages = [dict(message) for message in messages]
+        entry.keys = [(message["timestamp"], message["id"]) for message in messages]
+        entry.complete = len(messages) < self.window
+        entry.primed = True
+        for message in messages:
+            self.message_index[message["id"]] = conversation_id
+
+    async def message_page(self, conversation_id: str, after: Optional[tuple] = None, before: Optional[tuple] = None,
+                           limit: int = 100, fields: Optional[List[str]] = None) -> List[dict]:
+        entry = self._entry(conversation_id)
+        if entry is None or not entry.primed:
+            await self._prime(conversation_id)
+            entry = self._entry(conversation_id)
+        page = self._window_page(entry, after, before, limit) if entry is not None and entry.primed else None
+        if page is None:
+            self.stats["message_misses"] += 1
+            return await self.inner.message_page(conversation_id, after=after, before=before, limit=limit, fields=fields)
+        self.stats["message_hits"] += 1
+        return [_project(dict(message), fields) for message in page]
+
+    async def message_stats(self, conversation_id: str, page_size: int = 1000) -> Dict[str, Any]:
+        return await self.inner.message_stats(conversation_id, page_size)
+
+    async def iter_agent_messages(self, batch_size: int = 5000):
+        async for message in self.inner.iter_agent_messages(batch_size):
+            yield message
+
+    # Summaries and rollups are read rarely and pass straight through
+    async def latest_summary(self, conversation_id: str) -> Optional[dict]:
+        return await self.inner.latest_summary(conversation_id)
+
+    async def insert_summary(self, summary: dict):
+        await self.inner.insert_summary(summary)
+
+    async def update_summary(self, summary_id: str, fields: dict):
+        await self.inner.update_summary(summary_id, fields)
+
+    async def apply_rollups(self, deltas: List[dict]):
+        await self.inner.apply_rollups(deltas)
+
+    async def rollup_buckets(self, granularity: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[dict]:
+        return await self.inner.rollup_buckets(granularity, start, end)
+
+    async def clear_rollups(self):
+        await self.inner.clear_rollups()
+
+def create_storage(backend: str, mongo_database=None, sqlite_path: Optional[str] = None) -> StorageBackend:
+    if backend == "mongo":
+        return MongoStorage(mongo_database)
+    if backend == "sqlite":
+        return SQLiteStorage(sqlite_path or "multiagent.db")
+    if backend == "memory":
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend: {backend}")
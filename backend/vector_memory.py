@@ -0,0 +1,200 @@
+"""Per-conversation semantic memory on CPU: hashed text embeddings in append-only float32 matrices.
+
+Each conversation gets a contiguous (n, dim) float32 matrix of L2-normalized
+embeddings; retrieval is one matrix-vector product plus argpartition. On disk
+a conversation is three append-only files:
+
+    vectors.f32   raw float32 rows, memory-mapped read-only when loaded
+    ids.txt       one message id per row
+    lines.jsonl   the rendered speaker line of each row
+
+Rows appended after loading live in an in-memory tail until the next load.
+Appends reach disk in batches: take_pending() snapshots the rows not yet
+written and write_rows() appends them, one write per file, on any thread.
+"""
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Dict, Tuple
+import numpy as np
+import json
+import re
+import zlib
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do for from has have i if in is it its me my not of on or our so that the "
+    "their them then there these they this to was we were what when which who will with would you your".split()
+)
+
+class HashingEmbedder:
+    """Stateless text embedder: hashed unigrams and bigrams, sublinear term frequency, L2-normalized.
+
+    Hashes are crc32 so vectors stay comparable across processes and restarts.
+    Stopwords are dropped instead of learning IDF weights, which would change
+    every stored row as the corpus grows.
+    """
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def features(self, text: str) -> Dict[int, float]:
+        words = [word for word in TOKEN_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+        counts: Dict[int, float] = {}
+        for term in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = zlib.crc32(term.encode())
+            index = digest % self.dim
+            # The top hash bit picks the sign so collisions cancel out on average
+            counts[index] = counts.get(index, 0.0) + (1.0 if digest & 0x80000000 else -1.0)
+        return counts
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for index, count in self.features(text).items():
+            vector[index] = np.sign(count) * (1.0 + np.log(abs(count))) if count else 0.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        return np.vstack([self.embed(text) for text in texts]) if texts else np.zeros((0, self.dim), dtype=np.float32)
+
+class ConversationMemory:
+    """Append-only embedding matrix of one conversation with top-k cosine retrieval"""
+    def __init__(self, dim: int, directory: Optional[Path] = None, initial_capacity: int = 64):
+        self.dim = dim
+        self.directory = directory
+        self.frozen = np.zeros((0, dim), dtype=np.float32)
+        self.tail = np.zeros((initial_capacity, dim), dtype=np.float32)
+        self.tail_rows = 0
+        self.ids: List[str] = []
+        self.lines: List[str] = []
+        self.id_set = set()
+        self.persisted = 0  # rows already on disk
+        if directory is not None:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _load(self):
+        vectors_path = self.directory / "vectors.f32"
+        if not vectors_path.exists():
+            return
+        ids = (self.directory / "ids.txt").read_text().splitlines()
+        lines = [json.loads(line) for line in (self.directory / "lines.jsonl").read_text().splitlines()]
+        # A crash between the three appends can leave one file a row ahead; trust the shortest
+        rows = min(len(ids), len(lines), vectors_path.stat().st_size // (4 * self.dim))
+        if rows:
+            self.frozen = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        self.ids = ids[:rows]
+        self.lines = lines[:rows]
+        self.id_set = set(self.ids)
+        self.persisted = rows
+
+    def take_pending(self) -> Optional[tuple]:
+        """Copy of the rows not yet on disk, as a batch for write_rows; they count as written from now on"""
+        if self.directory is None or self.persisted == len(self.ids):
+            return None
+        start = self.persisted - len(self.frozen)
+        vectors = self.tail[start:self.tail_rows].copy()
+        batch = (self.directory, vectors, self.ids[self.persisted:], self.lines[self.persisted:])
+        self.persisted = len(self.ids)
+        return batch
+
+    def flush(self):
+        batch = self.take_pending()
+        if batch is not None:
+            write_rows(batch)
+
+    def add(self, message_id: str, line: str, vector: np.ndarray) -> bool:
+        if message_id in self.id_set:
+            return False
+        if self.tail_rows == len(self.tail):
+            # Doubling keeps appends amortized O(1) while the tail stays one contiguous block
+            grown = np.zeros((2 * len(self.tail), self.dim), dtype=np.float32)
+            grown[:self.tail_rows] = self.tail[:self.tail_rows]
+            self.tail = grown
+        self.tail[self.tail_rows] = vector
+        self.tail_rows += 1
+        self.ids.append(message_id)
+        self.lines.append(line)
+        self.id_set.add(message_id)
+        return True
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every stored row with a normalized query"""
+        if not len(self.frozen):
+            return self.tail[:self.tail_rows] @ query
+        return np.concatenate([self.frozen @ query, self.tail[:self.tail_rows] @ query])
+
+    def search(self, query: np.ndarray, k: int, exclude: Optional[set] = None, min_score: float = 0.0) -> List[Tuple[str, str, float]]:
+        """Top-k (message_id, line, score) by cosine similarity, best first"""
+        if not self.ids or k <= 0:
+            return []
+        scores = self.scores(query)
+        candidates = min(len(scores), k + len(exclude or ()))
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for row in top:
+            if scores[row] < min_score or (exclude and self.ids[row] in exclude):
+                continue
+            results.append((self.ids[row], self.lines[row], float(scores[row])))
+            if len(results) == k:
+                break
+        return results
+
+def write_rows(batch: tuple):
+    """Append one take_pending() batch to its conversation's files"""
+    directory, vectors, ids, lines = batch
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / "vectors.f32", "ab") as handle:
+        handle.write(vectors.astype(np.float32).tobytes())
+    with open(directory / "ids.txt", "a") as handle:
+        handle.write("".join(message_id + "\n" for message_id in ids))
+    with open(directory / "lines.jsonl", "a") as handle:
+        handle.write("".join(json.dumps(line) + "\n" for line in lines))
+
+class VectorMemoryStore:
+    """LRU-bounded set of loaded conversation memories, persisted under one directory"""
+    def __init__(self, directory: Optional[str], dim: int = 256, max_conversations: int = 200):
+        self.directory = Path(directory) if directory else None
+        self.embedder = HashingEmbedder(dim)
+        self.max_conversations = max_conversations
+        self.memories: "OrderedDict[str, ConversationMemory]" = OrderedDict()
+        self.evicted_batches: List[tuple] = []
+        self.stats = {"added": 0, "searches": 0, "loads": 0}
+
+    def memory(self, conversation_id: str) -> ConversationMemory:
+        memory = self.memories.get(conversation_id)
+        if memory is None:
+            directory = self.directory / re.sub(r"[^A-Za-z0-9_-]", "_", conversation_id) if self.directory else None
+            memory = self.memories[conversation_id] = ConversationMemory(self.embedder.dim, directory)
+            self.stats["loads"] += 1
+            while len(self.memories) > self.max_conversations:
+                _, evicted = self.memories.popitem(last=False)
+                batch = evicted.take_pending()
+                if batch is not None:
+                    self.evicted_batches.append(batch)
+        self.memories.move_to_end(conversation_id)
+        return memory
+
+    def add(self, conversation_id: str, message_id: str, line: str, text: str, vector: Optional[np.ndarray] = None):
+        """Store a turn; pass `vector` when it was already embedded, e.g. off the event loop"""
+        if self.memory(conversation_id).add(message_id, line, self.embedder.embed(text) if vector is None else vector):
+            self.stats["added"] += 1
+
+    def take_pending(self) -> List[tuple]:
+        """Batches of every row not yet on disk, to hand to write_rows"""
+        batches, self.evicted_batches = self.evicted_batches, []
+        for memory in self.memories.values():
+            batch = memory.take_pending()
+            if batch is not None:
+                batches.append(batch)
+        return batches
+
+    def flush(self):
+        for batch in self.take_pending():
+            write_rows(batch)
+
+    def recall(self, conversation_id: str, query: str, k: int, exclude: Optional[set] = None, min_score: float = 0.0) -> List[Tuple[str, str, float]]:
+        self.stats["searches"] += 1
+        return self.memory(conversation_id).search(self.embedder.embed(query), k, exclude, min_score)
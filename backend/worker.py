@@ -0,0 +1,73 @@
+"""Dedicated collaboration workers, separate from the API processes.
+
+Each worker process claims jobs from the shared collaboration queue and runs
+up to --concurrency of them; the WebSocket events they produce are relayed to
+the API processes through the conversation_events capped collection. Run the
+API with COLLABORATION_WORKER_MODE=external so it stops running collaborations
+itself and delivers the relayed events instead.
+
+    python worker.py --processes 2 --concurrency 8
+
+SIGTERM or Ctrl-C hands running jobs back to the queue with their last
+checkpoint, so another worker resumes them right away.
+"""
+import os
+import signal
+import asyncio
+import argparse
+import multiprocessing
+from typing import List, Optional
+
+async def serve(concurrency: int):
+    import server
+
+    if not server.MONGO_FEATURES:
+        raise SystemExit("Collaboration workers need the mongo storage backend (STORAGE_BACKEND=mongo)")
+    server.collaboration_worker.concurrency = concurrency
+    await server.open_storage()
+    # Keeps this process's conversation cache current with what the API processes write
+    await server.watch_external_changes()
+    await server.event_relay.ensure_collection()
+    server.manager.relay = server.event_relay
+    server.collaboration_worker.start()
+    server.logger.info(f"Collaboration worker {server.collaboration_worker.worker_id} running up to {concurrency} jobs")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    await stop.wait()
+    server.logger.info(f"Collaboration worker {server.collaboration_worker.worker_id} stopping")
+    await server.shutdown_db_client()
+
+def run_process(concurrency: int):
+    asyncio.run(serve(concurrency))
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run queued collaborations outside the API process")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get("JOB_CONCURRENCY", "8")),
+                        help="Collaborations each process runs at once")
+    args = parser.parse_args(argv)
+
+    if args.processes <= 1:
+        run_process(args.concurrency)
+        return
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_process, args=(args.concurrency,), name=f"collaboration-worker-{index}")
+                 for index in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.join()
+
+if __name__ == "__main__":
+    main()
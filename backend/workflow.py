@@ -0,0 +1,220 @@
+"""Declarative workflows: a DAG of agent steps run with as much parallelism as it allows.
+
+A workflow is a list of steps, each naming an agent, an optional prompt, the
+steps whose output it needs and a timeout:
+
+    {"steps": [
+        {"id": "plan", "agent": "strategist"},
+        {"id": "draft", "agent": "creator", "depends_on": ["plan"]},
+        {"id": "numbers", "agent": "analyst", "depends_on": ["plan"]},
+        {"id": "render", "agent": "visualizer", "depends_on": ["draft", "numbers"]}
+    ]}
+
+The executor starts every step whose dependencies have completed, so
+independent branches run concurrently and a step with several dependencies
+waits for all of them. A step that fails or times out skips its dependents
+but not the rest of the graph. Each result is reported as it lands, which is
+what a run resumes from: completed steps are not run again.
+
+Step times are unix seconds; the latency report derives the critical path
+(the chain of dependent steps that bounds the run) and each step's slack.
+"""
+from typing import Dict, List, Optional, Any, Callable, Awaitable, Iterable
+import asyncio
+import time
+
+COMPLETED = "completed"
+FAILED = "failed"
+TIMED_OUT = "timed_out"
+SKIPPED = "skipped"
+
+DEFAULT_STEP_TIMEOUT_SECONDS = 180.0
+
+class WorkflowError(ValueError):
+    pass
+
+class WorkflowStep:
+    __slots__ = ("id", "agent", "prompt", "depends_on", "timeout_seconds")
+
+    def __init__(self, id: str, agent: str, prompt: Optional[str] = None, depends_on: Iterable[str] = (),
+                 timeout_seconds: float = DEFAULT_STEP_TIMEOUT_SECONDS):
+        self.id = id
+        self.agent = agent
+        self.prompt = prompt
+        self.depends_on = list(dict.fromkeys(depends_on))
+        self.timeout_seconds = float(timeout_seconds)
+
+    def to_spec(self) -> Dict[str, Any]:
+        return {"id": self.id, "agent": self.agent, "prompt": self.prompt, "depends_on": self.depends_on,
+                "timeout_seconds": self.timeout_seconds}
+
+class Workflow:
+    """Validated steps in topological order, with each step's dependents"""
+    def __init__(self, steps: List[WorkflowStep]):
+        if not steps:
+            raise WorkflowError("A workflow needs at least one step")
+        by_id: Dict[str, WorkflowStep] = {}
+        for step in steps:
+            if step.id in by_id:
+                raise WorkflowError(f"Duplicate step id '{step.id}'")
+            by_id[step.id] = step
+        self.dependents: Dict[str, List[str]] = {step.id: [] for step in steps}
+        for step in steps:
+            for dependency in step.depends_on:
+                if dependency not in by_id:
+                    raise WorkflowError(f"Step '{step.id}' depends on unknown step '{dependency}'")
+                if dependency == step.id:
+                    raise WorkflowError(f"Step '{step.id}' depends on itself")
+                self.dependents[dependency].append(step.id)
+
+        # Kahn's algorithm; whatever never becomes ready sits on a cycle
+        waiting = {step.id: len(step.depends_on) for step in steps}
+        ready = [step.id for step in steps if not step.depends_on]
+        order = []
+        while ready:
+            step_id = ready.pop(0)
+            order.append(step_id)
+            for dependent in self.dependents[step_id]:
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    ready.append(dependent)
+        if len(order) < len(steps):
+            cycle = sorted(step_id for step_id, count in waiting.items() if count)
+            raise WorkflowError(f"Steps {', '.join(cycle)} form a dependency cycle")
+        self.steps: Dict[str, WorkflowStep] = {step_id: by_id[step_id] for step_id in order}
+
+    @classmethod
+    def from_spec(cls, spec: Dict[str, Any]) -> "Workflow":
+        return cls([WorkflowStep(**step) for step in spec.get("steps") or []])
+
+    def to_spec(self) -> Dict[str, Any]:
+        return {"steps": [step.to_spec() for step in self.steps.values()]}
+
+def fan_out_workflow(agents: List[str], prompt: Optional[str] = None,
+                     timeout_seconds: float = DEFAULT_STEP_TIMEOUT_SECONDS) -> Workflow:
+    """First agent frames the topic, the middle ones work on it in parallel, the last one combines their output"""
+    if not agents:
+        raise WorkflowError("A workflow needs at least one agent")
+    ids = [f"{agent}-{index + 1}" for index, agent in enumerate(agents)]
+    steps = [WorkflowStep(ids[0], agents[0], prompt, (), timeout_seconds)]
+    middle = list(zip(ids[1:-1], agents[1:-1]))
+    steps += [WorkflowStep(step_id, agent, prompt, [ids[0]], timeout_seconds) for step_id, agent in middle]
+    if len(agents) > 1:
+        steps.append(WorkflowStep(ids[-1], agents[-1], prompt, [step_id for step_id, _ in middle] or [ids[0]], timeout_seconds))
+    return Workflow(steps)
+
+async def run_workflow(workflow: Workflow, run_step: Callable[[WorkflowStep, Dict[str, str]], Awaitable[str]],
+                       results: Optional[Dict[str, Dict[str, Any]]] = None,
+                       on_result: Optional[Callable[[str, Dict[str, Dict[str, Any]]], Awaitable[Any]]] = None,
+                       clock: Callable[[], float] = time.time, enforce_timeouts: bool = True) -> Dict[str, Dict[str, Any]]:
+    """Run every step not already completed in `results` and return the result of each step.
+
+    run_step receives the step and the outputs of its dependencies by step id.
+    on_result is awaited after each step lands with its id and a copy of all
+    results so far; calls never overlap, so the latest one is the full state.
+    Cancelling the run cancels the steps in flight.
+
+    With enforce_timeouts=False run_step applies step.timeout_seconds itself,
+    to the part of the step it should bound (e.g. the model call but not the
+    wait for capacity), and signals it by raising asyncio.TimeoutError.
+    """
+    results = {step_id: result for step_id, result in (results or {}).items()
+               if step_id in workflow.steps and result.get("status") == COMPLETED}
+    report_lock = asyncio.Lock()
+
+    async def record(step_id: str, result: Dict[str, Any]):
+        results[step_id] = result
+        if on_result is not None:
+            async with report_lock:
+                await on_result(step_id, dict(results))
+
+    async def execute(step: WorkflowStep, inputs: Dict[str, str]) -> Dict[str, Any]:
+        started = clock()
+        output, error, status = None, None, COMPLETED
+        try:
+            output = await (asyncio.wait_for(run_step(step, inputs), step.timeout_seconds) if enforce_timeouts
+                            else run_step(step, inputs))
+        except asyncio.TimeoutError:
+            status, error = TIMED_OUT, f"No result within {step.timeout_seconds:g}s"
+        except Exception as e:
+            status, error = FAILED, str(e) or type(e).__name__
+        finished = clock()
+        return {"status": status, "output": output, "error": error, "started_at": started, "finished_at": finished,
+                "duration_seconds": finished - started}
+
+    running: Dict[asyncio.Task, str] = {}
+    try:
+        while True:
+            for step in workflow.steps.values():
+                if step.id in results or step.id in running.values():
+                    continue
+                if any(dependency not in results for dependency in step.depends_on):
+                    continue
+                broken = [dependency for dependency in step.depends_on if results[dependency]["status"] != COMPLETED]
+                if broken:
+                    # Record the skip now so its own dependents are skipped in the same pass
+                    await record(step.id, {"status": SKIPPED, "output": None, "error": f"Dependency {broken[0]} {results[broken[0]]['status']}",
+                                           "started_at": None, "finished_at": None, "duration_seconds": 0.0})
+                    continue
+                inputs = {dependency: results[dependency]["output"] for dependency in step.depends_on}
+                running[asyncio.create_task(execute(step, inputs))] = step.id
+            if not running:
+                return results
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                await record(running.pop(task), task.result())
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+def latency_report(workflow: Workflow, results: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Critical path and per-step slack of a (possibly partial) run.
+
+    Earliest start and finish come from a forward pass over the measured
+    durations, latest finish from a backward pass; slack is how much a step
+    could have been slower without delaying the run. elapsed_seconds is wall
+    time from the first start to the last finish, which includes any pause
+    between an interruption and the resume.
+    """
+    durations = {step_id: (results.get(step_id) or {}).get("duration_seconds") or 0.0 for step_id in workflow.steps}
+    earliest_finish: Dict[str, float] = {}
+    via: Dict[str, Optional[str]] = {}
+    for step_id, step in workflow.steps.items():
+        previous = max(step.depends_on, key=earliest_finish.__getitem__, default=None)
+        via[step_id] = previous
+        earliest_finish[step_id] = (earliest_finish[previous] if previous else 0.0) + durations[step_id]
+    makespan = max(earliest_finish.values())
+
+    latest_finish: Dict[str, float] = {}
+    for step_id in reversed(workflow.steps):
+        latest_finish[step_id] = min((latest_finish[dependent] - durations[dependent] for dependent in workflow.dependents[step_id]),
+                                     default=makespan)
+
+    path = []
+    step_id = max(earliest_finish, key=earliest_finish.__getitem__)
+    while step_id is not None:
+        path.append(step_id)
+        step_id = via[step_id]
+    path.reverse()
+
+    executed = [result for result in results.values() if result.get("started_at") is not None]
+    elapsed = (max(r["finished_at"] for r in executed) - min(r["started_at"] for r in executed)) if executed else 0.0
+    total = sum(durations.values())
+    return {
+        "critical_path": path,
+        "critical_path_seconds": makespan,
+        "elapsed_seconds": elapsed,
+        "step_seconds_total": total,
+        "parallel_speedup": total / elapsed if elapsed > 0 else None,
+        "steps": {
+            step_id: {
+                "status": (results.get(step_id) or {}).get("status", "pending"),
+                "duration_seconds": durations[step_id],
+                "earliest_start_seconds": earliest_finish[step_id] - durations[step_id],
+                "slack_seconds": latest_finish[step_id] - earliest_finish[step_id]
+            }
+            for step_id in workflow.steps
+        }
+    }
@@ -0,0 +1,52 @@
+"""Bulk export resume: an interrupted batch leaves no part files behind"""
+import sys
+import asyncio
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+from bson import ObjectId
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from bulk_export import BulkExporter, MESSAGE_COLUMNS  # noqa: E402
+
+class Query:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, key, direction):
+        self.documents = sorted(self.documents, key=lambda document: document[key])
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self, length):
+        return self.documents
+
+class Collection:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find(self, query, projection):
+        after = query.get("_id", {}).get("$gt")
+        return Query([document for document in self.documents if after is None or document["_id"] > after])
+
+def test_rerun_of_an_interrupted_batch_drops_its_stale_partitions(tmp_path):
+    messages = [{"_id": ObjectId(), "id": f"m{index}", "conversation_id": "c1", "timestamp": datetime(2024, 6, 2),
+                 "agent_type": "creator", "is_user": False, "content": f"message {index}"} for index in range(3)]
+    # What an attempt interrupted before its manifest commit left in a partition the rerun no longer writes to
+    stale = tmp_path / "messages" / "date=2024-06-01" / "agent_type=analyst" / "part-000000.parquet"
+    stale.parent.mkdir(parents=True)
+    stale.write_bytes(b"partial")
+
+    exporter = BulkExporter({"messages": Collection(messages)}, str(tmp_path), batch_size=10)
+    asyncio.run(exporter.export_table("messages", "messages", MESSAGE_COLUMNS, "timestamp",
+                                      partition_column="agent_type", prepare=BulkExporter._prepare_messages))
+
+    assert not stale.exists()
+    files = sorted(path.relative_to(tmp_path).as_posix() for path in (tmp_path / "messages").rglob("part-*"))
+    assert files == ["messages/date=2024-06-02/agent_type=creator/part-000000.parquet"]
+    assert len(pd.read_parquet(tmp_path / files[0])) == 3
@@ -0,0 +1,38 @@
+"""Consensus scoring: agreement, stability and the threshold decision bands"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from vector_memory import HashingEmbedder  # noqa: E402
+from consensus import ConsensusEngine, REACHED, NOT_REACHED, AMBIGUOUS  # noqa: E402
+
+engine = ConsensusEngine(HashingEmbedder(256))
+
+def test_converging_positions_score_higher_than_divergent_ones():
+    converging = engine.score({
+        "strategist": "Launch the freemium tier first and add the paid team plan once retention is proven.",
+        "creator": "Launch freemium first; the paid team plan follows once retention is proven.",
+        "analyst": "Retention data should decide when the paid team plan follows the freemium launch."
+    })
+    divergent = engine.score({
+        "strategist": "Hire an enterprise sales team this quarter.",
+        "creator": "A colorful mascot would make the landing page memorable.",
+        "analyst": "Database index latency doubled after the migration."
+    })
+    assert converging["agreement"] > divergent["agreement"]
+    assert 0.0 <= divergent["agreement"] <= converging["weakest_pair"] <= converging["agreement"] <= 1.0
+    assert converging["representative"] in converging["agents"]
+
+def test_needs_two_positions_and_reports_stability():
+    assert engine.score({"strategist": "Only one voice", "creator": "   "}) is None
+    positions = {"strategist": "ship the beta in march", "creator": "ship the beta in march with a teaser"}
+    assert engine.score(positions)["stability"] is None
+    assert engine.score(positions, previous=positions)["stability"] == pytest.approx(1.0)
+
+def test_decision_bands_follow_threshold():
+    assert engine.decide(0.85, 0.8) == REACHED
+    assert engine.decide(0.6, 0.8) == AMBIGUOUS
+    assert engine.decide(0.4, 0.8) == NOT_REACHED
@@ -0,0 +1,114 @@
+"""Rolling prompt context: folding, dedup, budgeted rendering and the load race of the registry"""
+import os
+import sys
+import asyncio
+from pathlib import Path
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("VECTOR_MEMORY_ENABLED", "false")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+from server import ConversationContextWindow, ContextWindowRegistry, estimate_tokens  # noqa: E402
+from vector_memory import VectorMemoryStore  # noqa: E402
+
+def message(index: int, content: str, agent_type: str = "strategist") -> dict:
+    return {"id": f"m{index}", "conversation_id": "c1", "agent_type": agent_type, "content": content, "streaming_status": "completed"}
+
+def test_turns_fold_out_by_count_and_by_token_cap():
+    window = ConversationContextWindow("c1", size=3, max_tokens=10000)
+    for index in range(5):
+        window.ingest(message(index, f"distinct point number {index}"))
+    assert [message_id for message_id, _, _ in window.entries] == ["m2", "m3", "m4"]
+    assert len(window.folded) == 2
+
+    capped = ConversationContextWindow("c1", size=100, max_tokens=40)
+    for index in range(6):
+        capped.ingest(message(index, f"point {index} " + "detail " * 10))
+    assert capped.tokens <= 40
+    assert len(capped.entries) >= 1 and capped.entries[-1][0] == "m5"
+    assert len(capped.folded) == 6 - len(capped.entries)
+
+def test_repeated_content_is_dropped_by_fingerprint():
+    window = ConversationContextWindow("c1", size=10, max_tokens=10000)
+    assert window.ingest(message(1, "Launch the freemium tier first."))
+    assert not window.ingest(message(2, "launch the FREEMIUM tier, first!", agent_type="creator"))
+    assert not window.ingest(message(1, "A different text under the same id"))
+    assert [message_id for message_id, _, _ in window.entries] == ["m1"]
+
+def test_render_stays_within_budget():
+    window = ConversationContextWindow("c1", size=50, max_tokens=100000)
+    for index in range(50):
+        window.ingest(message(index, f"argument {index}: " + "evidence " * 20))
+    window.summary = "Agents agreed on the pricing model."
+    for budget in (60, 200, 800):
+        context = window.render(budget, ["Strategist: an earlier recalled point"])
+        assert estimate_tokens(context) <= budget
+        assert "argument 49" in context
+
+def test_message_finishing_while_the_window_loads_is_kept():
+    async def scenario():
+        registry = ContextWindowRegistry(size=10, max_conversations=10)
+        loading = asyncio.Event()
+        proceed = asyncio.Event()
+        history = [message(1, "older turn from storage"), message(2, "newest stored turn")]
+
+        async def slow_recent(conversation_id, count):
+            loading.set()
+            await proceed.wait()
+            return history
+
+        async def no_summary(conversation_id):
+            return None
+
+        original = server.fetch_recent_messages, server.get_latest_summary
+        server.fetch_recent_messages, server.get_latest_summary = slow_recent, no_summary
+        try:
+            acquiring = asyncio.create_task(registry.acquire("c1"))
+            await loading.wait()
+            # Completes mid-load and is routed to the window registered before loading
+            registry.ingest(message(3, "turn finished during the load"))
+            proceed.set()
+            window = await acquiring
+        finally:
+            server.fetch_recent_messages, server.get_latest_summary = original
+        registry.release("c1")
+        return [message_id for message_id, _, _ in window.entries], "c1" in registry.windows
+
+    entries, still_registered = asyncio.run(scenario())
+    assert entries == ["m1", "m2", "m3"]
+    assert not still_registered
+
+def test_vector_memory_backfill_runs_in_the_background_and_is_capped():
+    async def scenario():
+        registry = ContextWindowRegistry(size=3, max_conversations=10)
+        history = [message(index, f"stored point {index} about pricing tier {index}") for index in range(10)]
+        requested = []
+
+        async def recent(conversation_id, count):
+            requested.append(count)
+            return history[-count:]
+
+        async def no_summary(conversation_id):
+            return None
+
+        original = server.fetch_recent_messages, server.get_latest_summary, server.vector_memory, server.VECTOR_MEMORY_BACKFILL_MAX
+        server.fetch_recent_messages, server.get_latest_summary = recent, no_summary
+        server.vector_memory, server.VECTOR_MEMORY_BACKFILL_MAX = VectorMemoryStore(None, dim=64), 6
+        try:
+            window = await registry.acquire("c1")
+            # The window is usable before the history is embedded
+            backfill = registry.backfills["c1"]
+            assert not backfill.done()
+            await backfill
+            remembered = list(server.vector_memory.memory("c1").ids)
+        finally:
+            server.fetch_recent_messages, server.get_latest_summary, server.vector_memory, server.VECTOR_MEMORY_BACKFILL_MAX = original
+        registry.release("c1")
+        return [message_id for message_id, _, _ in window.entries], remembered, requested, registry.backfills
+
+    entries, remembered, requested, backfills = asyncio.run(scenario())
+    assert entries == ["m7", "m8", "m9"]
+    assert remembered == [f"m{index}" for index in range(4, 10)]
+    assert sorted(requested) == [3, 6]
+    assert backfills == {}
@@ -0,0 +1,111 @@
+"""Behaviour specific to the hot-conversation cache"""
+import sys
+import asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from storage import MemoryStorage, CachedStorage  # noqa: E402
+
+BASE_TIME = datetime(2024, 6, 1, 12, 0, 0)
+
+class CountingStorage(MemoryStorage):
+    """Memory backend that counts reads reaching it"""
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    async def get_conversation(self, conversation_id, fields=None):
+        self.reads += 1
+        return await super().get_conversation(conversation_id, fields)
+
+    async def message_page(self, conversation_id, after=None, before=None, limit=100, fields=None):
+        self.reads += 1
+        return await super().message_page(conversation_id, after, before, limit, fields)
+
+def message(index: int, conversation_id: str = "c1", **fields) -> dict:
+    return {"id": f"m{index:04d}", "conversation_id": conversation_id, "content": f"message {index}",
+            "timestamp": BASE_TIME + timedelta(seconds=index), "streaming_status": "complete", **fields}
+
+def test_active_conversation_is_served_without_backend_reads():
+    async def scenario():
+        inner = CountingStorage()
+        cache = CachedStorage(inner, window=10)
+        await cache.create_conversation({"id": "c1", "status": "active"})
+        for index in range(5):
+            await cache.insert_message(message(index, streaming_status="streaming", content=""))
+            await cache.checkpoint_messages([(f"m{index:04d}", {"content": "partial"})])
+            await cache.update_message(f"m{index:04d}", {"content": f"final {index}", "streaming_status": "complete"})
+        await cache.update_conversation("c1", {"current_round": 2})
+        conversation = await cache.get_conversation("c1")
+        recent = await cache.recent_messages("c1", 3)
+        after = await cache.message_page("c1", after=(recent[0]["timestamp"], recent[0]["id"]), limit=10)
+        return inner.reads, conversation, recent, after
+
+    reads, conversation, recent, after = asyncio.run(scenario())
+    assert reads == 0
+    assert conversation["current_round"] == 2
+    assert [m["content"] for m in recent] == ["final 2", "final 3", "final 4"]
+    assert [m["id"] for m in after] == ["m0003", "m0004"]
+
+def test_lru_eviction_and_ttl_expiry():
+    async def scenario():
+        inner = CountingStorage()
+        cache = CachedStorage(inner, max_entries=2, ttl_seconds=60)
+        for conversation_id in ("a", "b", "c"):
+            await cache.create_conversation({"id": conversation_id})
+        evicted = "a" not in cache.entries and {"b", "c"} <= set(cache.entries)
+        await cache.get_conversation("a")
+        reads_after_miss = inner.reads
+        cache.ttl = 0
+        await cache.get_conversation("c")
+        return evicted, reads_after_miss, inner.reads, cache.stats
+
+    evicted, reads_after_miss, reads, stats = asyncio.run(scenario())
+    assert evicted
+    assert reads_after_miss == 1
+    assert reads == 2
+    assert stats["evictions"] >= 1 and stats["expirations"] == 1
+
+def test_external_changes_invalidate_but_own_writes_do_not():
+    async def scenario():
+        inner = CountingStorage()
+        cache = CachedStorage(inner)
+        await cache.create_conversation({"id": "c1", "status": "active"})
+        await cache.insert_message(message(0))
+        # Change events for our own writes arrive later and must be recognised
+        own = [cache.external_change("conversations", "c1", "c1"), cache.external_change("messages", "m0000", "c1")]
+        still_cached = "c1" in cache.entries
+        # Another worker appends a message
+        await inner.insert_message(message(1))
+        foreign = cache.external_change("messages", "m0001", "c1")
+        messages = await cache.recent_messages("c1", 10)
+        return own, still_cached, foreign, messages
+
+    own, still_cached, foreign, messages = asyncio.run(scenario())
+    assert own == [False, False]
+    assert still_cached
+    assert foreign is True
+    assert [m["id"] for m in messages] == ["m0000", "m0001"]
+
+def test_load_racing_a_write_is_not_cached():
+    async def scenario():
+        inner = MemoryStorage()
+        await inner.create_conversation({"id": "c1", "status": "active"})
+        cache = CachedStorage(inner)
+        original = inner.get_conversation
+
+        async def slow_get(conversation_id, fields=None):
+            snapshot = await original(conversation_id, fields)
+            await asyncio.sleep(0.01)
+            return snapshot
+        inner.get_conversation = slow_get
+
+        load = asyncio.create_task(cache.get_conversation("c1"))
+        await asyncio.sleep(0)
+        await cache.update_conversation("c1", {"status": "completed"})
+        await load
+        return await cache.get_conversation("c1")
+
+    assert asyncio.run(scenario())["status"] == "completed"
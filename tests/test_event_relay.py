@@ -0,0 +1,115 @@
+"""Worker event relay: batched publishing, ordered delivery across reconnects, and the embedded fallback"""
+import os
+import sys
+import asyncio
+import subprocess
+from pathlib import Path
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("VECTOR_MEMORY_ENABLED", "false")
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import server  # noqa: E402
+from server import ConversationEventRelay, ContextWindowRegistry, resolve_worker_mode  # noqa: E402
+
+class CappedEvents:
+    """The slice of a capped collection the relay uses; every cursor ends after the current events"""
+    def __init__(self):
+        self.events = []
+        self.batches = []
+
+    async def insert_many(self, batch, ordered=True):
+        self.batches.append(len(batch))
+        self.events.extend(dict(event) for event in batch)
+
+    async def find(self, query, cursor_type=None):
+        for event in list(self.events):
+            yield event
+
+    async def aggregate(self, pipeline):
+        latest = {}
+        for event in self.events:
+            latest[event.get("source")] = max(latest.get(event.get("source")) or 0, event.get("seq") or 0)
+        for source, seq in latest.items():
+            yield {"_id": source, "seq": seq}
+
+class Database(dict):
+    def __missing__(self, name):
+        return self.setdefault(name, CappedEvents())
+
+def test_published_events_are_written_in_ordered_batches():
+    async def scenario():
+        db = Database()
+        relay = ConversationEventRelay(db, capped_bytes=1024, flush_ms=10, batch_size=2)
+        for index in range(5):
+            relay.publish("c1", f"event {index}")
+        await relay.flush()
+        return db[server.EVENT_RELAY_COLLECTION], relay
+
+    events, relay = asyncio.run(scenario())
+    assert events.batches == [2, 2, 1]
+    assert [event["payload"] for event in events.events] == [f"event {index}" for index in range(5)]
+    assert [event["seq"] for event in events.events] == [1, 2, 3, 4, 5]
+    assert {event["source"] for event in events.events} == {relay.source}
+    assert relay.stats["written"] == 5
+
+def test_tail_delivers_new_events_once_in_insertion_order_across_reconnects():
+    async def scenario():
+        db = Database()
+        events = db[server.EVENT_RELAY_COLLECTION]
+        events.events.append({"conversation_id": "c1", "payload": "before start", "source": "w0", "seq": 7})
+        relay = ConversationEventRelay(db, capped_bytes=1024, flush_ms=10, retry_seconds=0.01)
+        delivered = []
+
+        async def deliver(event):
+            delivered.append(event["payload"])
+
+        relay.deliver = deliver
+        relay.start_tailing()
+        await asyncio.sleep(0.02)
+        # Two workers interleave; their sequences are independent and ObjectIds play no part
+        for source, seq, payload in [("w1", 1, "a"), ("w2", 1, "b"), ("w1", 2, "c"), ("w0", 8, "d"), ("w2", 2, "e")]:
+            events.events.append({"conversation_id": "c1", "payload": payload, "source": source, "seq": seq})
+            await asyncio.sleep(0.02)
+        await relay.shutdown()
+        return delivered
+
+    assert asyncio.run(scenario()) == ["a", "b", "c", "d", "e"]
+
+def test_external_mode_without_mongo_falls_back_to_embedded(tmp_path):
+    # Resolved while the module loads, so import it fresh with the mode requested
+    for backend in ("memory", "sqlite"):
+        env = {**os.environ, "COLLABORATION_WORKER_MODE": "external", "STORAGE_BACKEND": backend,
+               "SQLITE_PATH": str(tmp_path / "worker-mode.db")}
+        result = subprocess.run([sys.executable, "-c", "import server; print(server.COLLABORATION_WORKER_MODE)"],
+                                cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.split()[-1] == "embedded"
+    assert resolve_worker_mode("external", mongo_features=False) == "embedded"
+    assert resolve_worker_mode("external", mongo_features=True) == "external"
+    assert resolve_worker_mode("embedded", mongo_features=True) == "embedded"
+
+def test_catch_up_picks_up_messages_stored_by_other_processes():
+    async def scenario():
+        conversation_id = "relay-catch-up"
+        registry = ContextWindowRegistry(size=10, max_conversations=10)
+        await server.storage.create_conversation({"id": conversation_id, "status": "active"})
+        await server.storage.insert_message(server.to_storage_document({
+            "id": "a1", "conversation_id": conversation_id, "agent_type": "strategist", "is_user": False,
+            "content": "Start with the pricing model.", "streaming_status": "completed", "timestamp": "2026-01-01T00:00:00"
+        }))
+        window = await registry.acquire(conversation_id)
+        # Written by an API process: this process's windows never saw it
+        await server.storage.insert_message(server.to_storage_document({
+            "id": "u1", "conversation_id": conversation_id, "is_user": True, "content": "Focus on small teams please.",
+            "timestamp": "2026-01-01T00:00:05"
+        }))
+        await registry.catch_up(window)
+        await registry.catch_up(window)
+        registry.release(conversation_id)
+        return [message_id for message_id, _, _ in window.entries], registry.stats["caught_up"]
+
+    entries, caught_up = asyncio.run(scenario())
+    assert entries == ["a1", "u1"]
+    assert caught_up == 1
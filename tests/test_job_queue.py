@@ -0,0 +1,93 @@
+"""Job queue semantics: leases, takeover after expiry, worker guards, retries and stats"""
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from job_queue import MemoryJobQueue, new_job  # noqa: E402
+
+def run(scenario):
+    return asyncio.run(scenario(MemoryJobQueue()))
+
+def test_expired_lease_is_taken_over_with_its_checkpoint():
+    async def scenario(queue):
+        job = await queue.enqueue(new_job("autonomous", "c1", {"topic": "t"}))
+        claimed = await queue.claim("a", lease_seconds=0.05)
+        await queue.checkpoint(job["id"], "a", {"completed_round": 2})
+        assert await queue.claim("b", lease_seconds=5) is None
+        time.sleep(0.06)
+        takeover = await queue.claim("b", lease_seconds=5)
+        stale = await queue.heartbeat(job["id"], "a", 5), await queue.checkpoint(job["id"], "a", {"completed_round": 3})
+        return claimed, takeover, stale, await queue.finish(job["id"], "a")
+
+    claimed, takeover, stale, stale_finish = run(scenario)
+    assert claimed["attempts"] == 1 and claimed["worker_id"] == "a"
+    assert takeover["worker_id"] == "b" and takeover["attempts"] == 2
+    assert takeover["checkpoint"] == {"completed_round": 2}
+    assert stale == (None, False) and stale_finish is None
+
+def test_errors_retry_until_max_attempts():
+    async def scenario(queue):
+        job = await queue.enqueue(new_job("autonomous", "c1", {}, max_attempts=2))
+        await queue.claim("a", 5)
+        first = await queue.finish(job["id"], "a", error="boom")
+        await queue.claim("a", 5)
+        second = await queue.finish(job["id"], "a", error="boom again")
+        return first, second, await queue.get(job["id"])
+
+    first, second, job = run(scenario)
+    assert (first, second) == ("queued", "failed")
+    assert job["error"] == "boom again" and job["finished_at"] is not None
+
+def test_expired_lease_on_the_last_attempt_fails_instead_of_being_taken_over():
+    async def scenario(queue):
+        job = await queue.enqueue(new_job("autonomous", "c1", {}, max_attempts=1))
+        await queue.claim("a", lease_seconds=0.05)
+        time.sleep(0.06)
+        takeover = await queue.claim("b", 5)
+        failed = await queue.fail_exhausted()
+        return takeover, failed, await queue.fail_exhausted(), await queue.get(job["id"])
+
+    takeover, failed, again, job = run(scenario)
+    assert takeover is None
+    assert [(failed_job["conversation_id"], failed_job["status"]) for failed_job in failed] == [("c1", "failed")]
+    assert again == []
+    assert job["status"] == "failed" and job["worker_id"] is None and job["attempts"] == 1
+
+def test_release_requeues_without_counting_the_attempt_and_stats():
+    async def scenario(queue):
+        first = await queue.enqueue(new_job("autonomous", "c1", {}))
+        await queue.enqueue(new_job("autonomous", "c2", {}))
+        await queue.claim("a", 5)
+        running = await queue.stats()
+        await queue.release(first["id"], "a")
+        reclaimed = await queue.claim("b", 5)
+        await queue.finish(reclaimed["id"], "b")
+        return running, reclaimed, await queue.stats(), await queue.latest_for_conversation("c1")
+
+    running, reclaimed, done, latest = run(scenario)
+    assert running["jobs"]["running"] == 1 and running["depth"] == 1 and running["lag_seconds"] >= 0
+    assert reclaimed["conversation_id"] == "c1" and reclaimed["attempts"] == 1
+    assert done["jobs"] == {"queued": 1, "running": 0, "paused": 0, "completed": 1, "failed": 0, "cancelled": 0}
+    assert latest["status"] == "completed"
+
+def test_control_requests_follow_job_status():
+    async def scenario(queue):
+        queued = await queue.enqueue(new_job("autonomous", "c1", {}))
+        running = await queue.enqueue(new_job("autonomous", "c2", {}))
+        paused = await queue.request_control(queued["id"], "pause")
+        claimed = await queue.claim("a", 5)
+        flagged = await queue.request_control(running["id"], "cancel")
+        heartbeat = await queue.heartbeat(running["id"], "a", 5)
+        await queue.stop(running["id"], "a", "cancelled")
+        resumed = await queue.request_control(queued["id"], "resume")
+        refused = await queue.request_control(running["id"], "resume")
+        return paused, claimed, flagged, heartbeat, resumed, refused, await queue.get(running["id"])
+
+    paused, claimed, flagged, heartbeat, resumed, refused, cancelled = run(scenario)
+    assert paused == "paused" and claimed["conversation_id"] == "c2"
+    assert flagged == "running" and heartbeat["control"] == "cancel"
+    assert resumed == "queued" and refused is None
+    assert cancelled["status"] == "cancelled" and cancelled["control"] is None and cancelled["finished_at"] is not None
@@ -0,0 +1,30 @@
+"""Novelty of turns against the conversation so far, and stagnation counting"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from novelty import NoveltyTracker, stagnant_rounds  # noqa: E402
+
+def test_repeated_turns_lose_novelty():
+    tracker = NoveltyTracker()
+    assert tracker.observe("Launch the freemium tier before the paid team plan") == 1.0
+    assert tracker.observe("launch the FREEMIUM tier before the paid team plan!") == 0.0
+    partial = tracker.observe("Launch the freemium tier in March with a referral bonus")
+    assert 0.0 < partial < 1.0
+    assert tracker.observe("") == 0.0
+    assert tracker.observe("yes") == 1.0
+
+def test_rounds_report_mean_and_reset():
+    tracker = NoveltyTracker()
+    tracker.record("strategist", "one two three four")
+    tracker.record("creator", "one two three four")
+    mean, scores = tracker.close_round()
+    assert scores == {"strategist": 1.0, "creator": 0.0}
+    assert mean == 0.5
+    assert tracker.close_round() == (None, {})
+
+def test_stagnant_rounds_counts_trailing_run():
+    assert stagnant_rounds([0.9, 0.2, 0.8, 0.1, 0.2], 0.35) == 2
+    assert stagnant_rounds([0.1, 0.9], 0.35) == 0
+    assert stagnant_rounds([], 0.35) == 0
@@ -0,0 +1,120 @@
+"""Slot arbitration of the fair turn scheduler between tenants and conversations"""
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from scheduler import FairTurnScheduler, TenantPolicy, parse_tenant_policies, parse_tenant_keys  # noqa: E402
+
+async def grant_order(scheduler: FairTurnScheduler, requests):
+    """Queue (tenant, conversation, tokens) turns behind a held slot and record who gets served in what order"""
+    order = []
+    release = asyncio.Event()
+
+    async def hold():
+        async with scheduler.turn("blocker", "blocker", 1):
+            await release.wait()
+
+    async def take(tenant, conversation_id, tokens):
+        async with scheduler.turn(conversation_id, tenant, tokens):
+            order.append(conversation_id)
+            await asyncio.sleep(0)
+
+    blocker = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    turns = [asyncio.create_task(take(*request)) for request in requests]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(blocker, *turns)
+    return order
+
+def test_tenants_alternate_by_weighted_service():
+    async def scenario():
+        scheduler = FairTurnScheduler(1, parse_tenant_policies({"research": {"weight": 1}, "chat": {"weight": 2}}))
+        requests = [("research", f"r{index}", 100) for index in range(4)] + [("chat", f"c{index}", 100) for index in range(4)]
+        return await grant_order(scheduler, requests)
+
+    order = asyncio.run(scenario())
+    # The blocker's default tenant goes first, then chat gets two turns for every research turn
+    assert order[:6] == ["r0", "c0", "c1", "r1", "c2", "c3"]
+
+def test_conversations_of_one_tenant_share_its_slots():
+    async def scenario():
+        scheduler = FairTurnScheduler(1)
+        requests = [("team", "long", 100)] * 3 + [("team", "short", 100)]
+        return await grant_order(scheduler, requests)
+
+    assert asyncio.run(scenario()) == ["long", "short", "long", "long"]
+
+def test_token_quota_delays_only_its_tenant():
+    async def scenario():
+        scheduler = FairTurnScheduler(4, {"capped": TenantPolicy(tokens_per_minute=600)})
+        async with scheduler.turn("a", "capped", 600):
+            pass
+        waiting = asyncio.create_task(grant_order(scheduler, [("capped", "a", 60)]))
+        async with scheduler.turn("b", "open", 600):
+            pass
+        await asyncio.sleep(0.01)
+        assert not waiting.done()  # 60 tokens refill in six seconds
+        assert scheduler.tenant_report()["capped"]["quota_delays"] == 1
+        waiting.cancel()
+
+    asyncio.run(scenario())
+
+def test_cancelled_wait_gives_up_its_place():
+    async def scenario():
+        scheduler = FairTurnScheduler(1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with scheduler.turn("a"):
+                await release.wait()
+
+        async def wait_turn():
+            async with scheduler.turn("b"):
+                pass
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(wait_turn())
+        await asyncio.sleep(0)
+        assert scheduler.queued() == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert scheduler.queued() == 0
+        assert scheduler.stats["cancelled_waits"] == 1
+        release.set()
+        await holder
+        assert scheduler.running == 0
+        async with scheduler.turn("c"):
+            assert scheduler.running == 1
+
+    asyncio.run(scenario())
+
+def test_idle_tenants_are_evicted_oldest_first():
+    async def scenario():
+        scheduler = FairTurnScheduler(2, max_idle_tenants=2)
+        for tenant in ("a", "b", "c"):
+            async with scheduler.turn(f"{tenant}-conversation", tenant, 10):
+                pass
+        async with scheduler.turn("b-conversation", "b", 10):
+            assert "b" not in scheduler.idle
+            async with scheduler.turn("d-conversation", "d", 10):
+                pass
+        return sorted(scheduler.tenants), list(scheduler.idle)
+
+    tenants, idle = asyncio.run(scenario())
+    assert tenants == ["b", "d"]
+    assert idle == ["d", "b"]
+
+def test_tenants_are_identified_by_their_api_keys():
+    config = {"research": {"weight": 2, "api_keys": ["k1", "k2"]}, "*": {"tokens_per_minute": 1000}}
+    assert parse_tenant_keys(config) == {"k1": "research", "k2": "research"}
+    assert parse_tenant_policies(config)["research"].weight == 2
+    with pytest.raises(ValueError, match="both"):
+        parse_tenant_keys({"a": {"api_keys": ["k"]}, "b": {"api_keys": ["k"]}})
+    with pytest.raises(ValueError, match="default policy"):
+        parse_tenant_keys({"*": {"api_keys": ["k"]}})
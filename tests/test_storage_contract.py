@@ -0,0 +1,231 @@
+"""Contract tests every storage backend must pass.
+
+Memory, SQLite and the cached wrapper always run; the Mongo backend runs when MONGO_URL points
+at a reachable server (a throwaway database is created and dropped).
+"""
+import os
+import sys
+import functools
+import uuid
+import asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from storage import StorageBackend, MemoryStorage, SQLiteStorage, MongoStorage, CachedStorage  # noqa: E402
+
+BASE_TIME = datetime(2024, 6, 1, 12, 0, 0)
+
+@functools.lru_cache(maxsize=None)
+def mongo_available() -> bool:
+    if not os.environ.get("MONGO_URL"):
+        return False
+    from pymongo import MongoClient
+    try:
+        MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=500).admin.command("ping")
+        return True
+    except Exception:
+        return False
+
+@pytest.fixture(params=["memory", "sqlite", "cached", "mongo"])
+def backend(request, tmp_path):
+    kind = request.param
+    client = None
+    if kind == "memory":
+        factory = MemoryStorage
+    elif kind == "sqlite":
+        factory = lambda: SQLiteStorage(str(tmp_path / "contract.db"))
+    elif kind == "cached":
+        # Tiny window and capacity so both cache hits and fall-through reads are exercised
+        factory = lambda: CachedStorage(MemoryStorage(), max_entries=2, window=3)
+    else:
+        if not mongo_available():
+            pytest.skip("MongoDB not reachable")
+        from motor.motor_asyncio import AsyncIOMotorClient
+        database_name = f"contract_{uuid.uuid4().hex[:8]}"
+
+        def factory():
+            nonlocal client
+            client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+            return MongoStorage(client[database_name])
+
+    def run(scenario):
+        async def wrapper():
+            store = factory()
+            await store.start()
+            try:
+                return await scenario(store)
+            finally:
+                await store.close()
+                if client is not None:
+                    await client.drop_database(database_name)
+                    client.close()
+        return asyncio.run(wrapper())
+    return run
+
+def make_message(conversation_id: str, index: int, **fields) -> dict:
+    return {
+        "id": f"m{index:04d}",
+        "conversation_id": conversation_id,
+        "content": f"message {index}",
+        "agent_type": "gpt_oss",
+        "is_user": False,
+        "timestamp": BASE_TIME + timedelta(seconds=index),
+        "streaming_status": "complete",
+        **fields
+    }
+
+def test_conversation_roundtrip(backend):
+    async def scenario(store):
+        await store.create_conversation({"id": "c1", "topic": "t", "agents": ["gpt_oss"], "created_at": BASE_TIME, "status": "active"})
+        await store.update_conversation("c1", {"status": "completed", "completed_at": BASE_TIME})
+        full = await store.get_conversation("c1")
+        projected = await store.get_conversation("c1", ["status"])
+        missing = await store.get_conversation("nope")
+        return full, projected, missing
+
+    full, projected, missing = backend(scenario)
+    assert full["topic"] == "t" and full["status"] == "completed"
+    assert full["created_at"] == BASE_TIME and full["completed_at"] == BASE_TIME
+    assert projected == {"status": "completed"}
+    assert missing is None
+
+def test_conversation_metrics_running_mean(backend):
+    async def scenario(store):
+        await store.create_conversation({"id": "c1", "performance_metrics": {"total_messages": 0, "avg_response_time": 0.0, "total_tokens": 0}})
+        await store.apply_conversation_metrics({"c1": {"messages": 2, "samples": 2, "response_time_sum": 3.0, "tokens": 10}})
+        await store.apply_conversation_metrics({"c1": {"messages": 1, "samples": 1, "response_time_sum": 3.0, "tokens": 5}})
+        return (await store.get_conversation("c1"))["performance_metrics"]
+
+    metrics = backend(scenario)
+    assert metrics["total_messages"] == 3
+    assert metrics["total_tokens"] == 15
+    assert metrics["response_time_samples"] == 3
+    assert metrics["avg_response_time"] == pytest.approx(2.0)
+
+def test_message_stats_skip_streaming_messages(backend):
+    async def scenario(store):
+        await store.insert_message(make_message("c1", 0, response_time=1.0, token_count=4))
+        await store.insert_message(make_message("c1", 1, response_time=3.0, token_count=6))
+        await store.insert_message(make_message("c1", 2, token_count=2))
+        await store.insert_message(make_message("c1", 3, streaming_status="streaming", response_time=9.0, token_count=9))
+        await store.insert_message(make_message("c2", 4, response_time=5.0))
+        return await store.message_stats("c1", page_size=2), await store.message_stats("missing")
+
+    stats, empty = backend(scenario)
+    assert stats == {"total_messages": 3, "response_time_samples": 2, "response_time_sum": 4.0, "total_tokens": 12}
+    assert empty == {"total_messages": 0, "response_time_samples": 0, "response_time_sum": 0.0, "total_tokens": 0}
+
+def test_incomplete_backend_fails_at_construction():
+    class Partial(StorageBackend):
+        async def create_conversation(self, conversation: dict):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
+
+def test_message_keyset_pages(backend):
+    async def scenario(store):
+        # Inserted out of order, with two messages sharing a timestamp
+        for index in [3, 0, 4, 1, 2]:
+            await store.insert_message(make_message("c1", index))
+        await store.insert_message(make_message("c1", 5, timestamp=BASE_TIME + timedelta(seconds=4)))
+        await store.insert_message(make_message("other", 9))
+        first = await store.message_page("c1", limit=2)
+        after = await store.message_page("c1", after=(first[-1]["timestamp"], first[-1]["id"]), limit=10)
+        before = await store.message_page("c1", before=(BASE_TIME + timedelta(seconds=4), "m0005"), limit=2)
+        recent = await store.recent_messages("c1", 3)
+        projected = await store.message_page("c1", limit=1, fields=["id", "content"])
+        return first, after, before, recent, projected
+
+    first, after, before, recent, projected = backend(scenario)
+    assert [m["id"] for m in first] == ["m0000", "m0001"]
+    assert [m["id"] for m in after] == ["m0002", "m0003", "m0004", "m0005"]
+    assert [m["id"] for m in before] == ["m0003", "m0004"]
+    assert [m["id"] for m in recent] == ["m0003", "m0004", "m0005"]
+    assert projected == [{"id": "m0000", "content": "message 0"}]
+
+def test_checkpoints_only_touch_streaming_messages(backend):
+    async def scenario(store):
+        await store.insert_message(make_message("c1", 0, streaming_status="streaming", content=""))
+        await store.insert_message(make_message("c1", 1, streaming_status="streaming", content=""))
+        await store.update_message("m0001", {"streaming_status": "complete", "content": "final"})
+        await store.checkpoint_messages([("m0000", {"content": "partial"}), ("m0001", {"content": "stale"})])
+        return await store.message_page("c1")
+
+    messages = backend(scenario)
+    assert messages[0]["content"] == "partial"
+    assert messages[1]["content"] == "final"
+
+def test_summaries_latest_and_update(backend):
+    async def scenario(store):
+        await store.insert_summary({"id": "s1", "conversation_id": "c1", "summary": "old", "timestamp": BASE_TIME})
+        await store.insert_summary({"id": "s2", "conversation_id": "c1", "summary": "new", "timestamp": BASE_TIME + timedelta(minutes=1)})
+        await store.update_summary("s2", {"consensus_reached": True})
+        return await store.latest_summary("c1"), await store.latest_summary("c2")
+
+    latest, missing = backend(scenario)
+    assert latest["id"] == "s2" and latest["consensus_reached"] is True
+    assert missing is None
+
+def test_rollup_upserts_and_range(backend):
+    hour = BASE_TIME.replace(minute=0)
+
+    def delta(bucket, last_active, tokens):
+        return {
+            "granularity": "hour", "bucket": bucket, "agent_type": "gpt_oss", "model": "m",
+            "inc": {"message_count": 1, "tokens": tokens, "latency_histogram.le_1": 1},
+            "last_active": last_active, "expires_at": None
+        }
+
+    async def scenario(store):
+        await store.apply_rollups([delta(hour, BASE_TIME, 5)])
+        await store.apply_rollups([delta(hour, BASE_TIME - timedelta(minutes=5), 7), delta(hour + timedelta(hours=1), BASE_TIME, 1)])
+        everything = await store.rollup_buckets("hour")
+        first_only = await store.rollup_buckets("hour", end=hour)
+        await store.clear_rollups()
+        return everything, first_only, await store.rollup_buckets("hour")
+
+    everything, first_only, cleared = backend(scenario)
+    assert len(everything) == 2
+    assert len(first_only) == 1
+    bucket = first_only[0]
+    assert bucket["message_count"] == 2 and bucket["tokens"] == 12
+    assert bucket["latency_histogram"] == {"le_1": 2}
+    assert bucket["last_active"] == BASE_TIME
+    assert cleared == []
+
+def test_iter_agent_messages_skips_user_messages(backend):
+    async def scenario(store):
+        await store.insert_message(make_message("c1", 0))
+        await store.insert_message(make_message("c1", 1, is_user=True, agent_type=None))
+        return [message["content"] async for message in store.iter_agent_messages(batch_size=1)]
+
+    assert backend(scenario) == ["message 0"]
+
+def test_concurrent_writes_are_all_applied(backend):
+    async def scenario(store):
+        await asyncio.gather(*(store.insert_message(make_message("c1", index)) for index in range(200)))
+        return await store.message_page("c1", limit=500)
+
+    assert [m["id"] for m in backend(scenario)] == [f"m{index:04d}" for index in range(200)]
+
+def test_projected_iteration_pages_past_the_first_page(backend):
+    os.environ.setdefault("STORAGE_BACKEND", "memory")
+    os.environ.setdefault("VECTOR_MEMORY_ENABLED", "false")
+    import server
+
+    async def scenario(store):
+        for index in range(1200):
+            await store.insert_message(make_message("c1", index))
+        original, server.storage = server.storage, store
+        try:
+            # The cursor fields are projected away by the caller but still needed to reach the next page
+            return [message["content"] async for message in server.iter_conversation_messages("c1", fields=["content"])]
+        finally:
+            server.storage = original
+
+    assert backend(scenario) == [f"message {index}" for index in range(1200)]
@@ -0,0 +1,64 @@
+"""Semantic memory: embedding, retrieval and memory-mapped persistence"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from vector_memory import HashingEmbedder, ConversationMemory, VectorMemoryStore  # noqa: E402
+
+TURNS = [
+    ("m1", "Strategist: We should price the product with a freemium tier and a paid team plan."),
+    ("m2", "Creator: Here is a mascot sketch and a playful landing page headline."),
+    ("m3", "Analyst: Churn risk is highest for teams under five seats on the paid plan."),
+    ("m4", "Creator: A short onboarding video could explain the first three steps."),
+]
+
+def test_embeddings_are_normalized_and_stable():
+    embedder = HashingEmbedder(128)
+    first = embedder.embed("Pricing the paid team plan")
+    assert first.dtype == np.float32
+    assert np.isclose(np.linalg.norm(first), 1.0)
+    assert np.array_equal(first, HashingEmbedder(128).embed("Pricing the paid team plan"))
+    assert not embedder.embed("the and of").any()
+
+def test_search_ranks_related_turns_and_honours_exclusions():
+    store = VectorMemoryStore(None, dim=256)
+    for message_id, line in TURNS:
+        store.add("c1", message_id, line, line)
+    hits = store.recall("c1", "what should the paid plan cost for small teams", k=2)
+    assert {hit[0] for hit in hits} == {"m1", "m3"}
+    assert hits[0][2] >= hits[1][2]
+    excluded = store.recall("c1", "what should the paid plan cost for small teams", k=2, exclude={"m1", "m3"}, min_score=0.01)
+    assert all(hit[0] not in {"m1", "m3"} for hit in excluded)
+    assert store.recall("other", "anything", k=3) == []
+
+def test_append_only_growth_keeps_every_row():
+    embedder = HashingEmbedder(64)
+    memory = ConversationMemory(64, initial_capacity=2)
+    for index in range(100):
+        assert memory.add(f"m{index}", f"line {index}", embedder.embed(f"topic number {index} unique{index}"))
+    assert not memory.add("m5", "duplicate", embedder.embed("x"))
+    assert len(memory) == 100 and memory.tail_rows == 100
+    hits = memory.search(embedder.embed("topic number 42 unique42"), k=1)
+    assert hits[0][0] == "m42"
+
+def test_persisted_memory_reloads_memory_mapped(tmp_path):
+    store = VectorMemoryStore(str(tmp_path), dim=128)
+    for message_id, line in TURNS:
+        store.add("c1", message_id, line, line)
+    # Rows reach disk only when flushed, in one append per file
+    assert not (tmp_path / "c1").exists()
+    store.flush()
+    assert store.take_pending() == []
+    reloaded = VectorMemoryStore(str(tmp_path), dim=128).memory("c1")
+    assert isinstance(reloaded.frozen, np.memmap) and reloaded.frozen.shape == (4, 128)
+    assert reloaded.ids == [message_id for message_id, _ in TURNS]
+    # New rows go to the in-memory tail and the files keep growing append-only
+    reloaded.add("m5", "Analyst: onboarding video metrics", HashingEmbedder(128).embed("onboarding video metrics"))
+    hits = reloaded.search(HashingEmbedder(128).embed("onboarding video"), k=2)
+    assert {hit[0] for hit in hits} == {"m4", "m5"}
+    reloaded.flush()
+    assert (tmp_path / "c1" / "vectors.f32").stat().st_size == 5 * 128 * 4
+    assert len((tmp_path / "c1" / "ids.txt").read_text().split()) == 5
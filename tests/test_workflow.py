@@ -0,0 +1,106 @@
+"""Workflow DAG validation, concurrent execution with resume, and the critical-path report"""
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from workflow import (  # noqa: E402
+    Workflow, WorkflowStep, WorkflowError, fan_out_workflow, run_workflow, latency_report,
+    COMPLETED, TIMED_OUT, SKIPPED
+)
+
+def diamond(timeout: float = 5.0) -> Workflow:
+    return Workflow([
+        WorkflowStep("plan", "strategist"),
+        WorkflowStep("draft", "creator", depends_on=["plan"], timeout_seconds=timeout),
+        WorkflowStep("numbers", "analyst", depends_on=["plan"]),
+        WorkflowStep("render", "visualizer", depends_on=["draft", "numbers"])
+    ])
+
+def test_invalid_graphs_are_rejected():
+    with pytest.raises(WorkflowError, match="unknown step"):
+        Workflow([WorkflowStep("a", "strategist", depends_on=["missing"])])
+    with pytest.raises(WorkflowError, match="Duplicate"):
+        Workflow([WorkflowStep("a", "strategist"), WorkflowStep("a", "creator")])
+    with pytest.raises(WorkflowError, match="cycle"):
+        Workflow([WorkflowStep("a", "strategist", depends_on=["b"]), WorkflowStep("b", "creator", depends_on=["a"])])
+    flow = fan_out_workflow(["strategist", "creator", "analyst", "visualizer"])
+    assert [step.depends_on for step in flow.steps.values()] == [[], ["strategist-1"], ["strategist-1"], ["creator-2", "analyst-3"]]
+    assert Workflow.from_spec(flow.to_spec()).to_spec() == flow.to_spec()
+
+def test_branches_run_concurrently_and_fan_in_gets_all_inputs():
+    active, peak, seen = set(), [0], {}
+
+    async def run_step(step, inputs):
+        seen[step.id] = inputs
+        active.add(step.id)
+        peak[0] = max(peak[0], len(active))
+        await asyncio.sleep(0.02)
+        active.discard(step.id)
+        return f"{step.id} output"
+
+    results = asyncio.run(run_workflow(diamond(), run_step))
+    assert all(result["status"] == COMPLETED for result in results.values())
+    assert peak[0] == 2
+    assert seen["render"] == {"draft": "draft output", "numbers": "numbers output"}
+
+def test_timeout_skips_dependents_but_not_other_branches_and_resume_keeps_completed_steps():
+    calls = []
+
+    async def run_step(step, inputs):
+        calls.append(step.id)
+        await asyncio.sleep(1 if step.id == "draft" else 0)
+        return step.id
+
+    checkpoints = []
+
+    async def on_result(step_id, results):
+        checkpoints.append(results)
+
+    results = asyncio.run(run_workflow(diamond(timeout=0.05), run_step, on_result=on_result))
+    assert {step_id: result["status"] for step_id, result in results.items()} == {
+        "plan": COMPLETED, "numbers": COMPLETED, "draft": TIMED_OUT, "render": SKIPPED
+    }
+    assert checkpoints[-1] == results
+
+    calls.clear()
+    resumed = asyncio.run(run_workflow(diamond(), run_step, results))
+    assert sorted(calls) == ["draft", "render"]
+    assert all(result["status"] == COMPLETED for result in resumed.values())
+
+def test_latency_report_follows_the_slowest_chain():
+    flow = diamond()
+    timings = {"plan": (0, 2), "draft": (2, 10), "numbers": (2, 5), "render": (10, 11)}
+    results = {step_id: {"status": COMPLETED, "started_at": start, "finished_at": end, "duration_seconds": end - start}
+               for step_id, (start, end) in timings.items()}
+    report = latency_report(flow, results)
+    assert report["critical_path"] == ["plan", "draft", "render"]
+    assert report["critical_path_seconds"] == 11
+    assert report["elapsed_seconds"] == 11
+    assert report["steps"]["numbers"]["slack_seconds"] == 5
+    assert report["steps"]["draft"]["slack_seconds"] == 0
+    assert report["parallel_speedup"] == pytest.approx(14 / 11)
+
+def test_step_applied_timeouts_exclude_time_spent_waiting():
+    slot = asyncio.Semaphore(1)
+
+    async def run_step(step, inputs):
+        async with slot:
+            # Queued behind the other branch for longer than the timeout, which only bounds the work itself
+            await asyncio.wait_for(asyncio.sleep(1 if step.id == "render" else 0.04), step.timeout_seconds)
+        return step.id
+
+    flow = Workflow([
+        WorkflowStep("plan", "strategist", timeout_seconds=0.05),
+        WorkflowStep("draft", "creator", depends_on=["plan"], timeout_seconds=0.05),
+        WorkflowStep("numbers", "analyst", depends_on=["plan"], timeout_seconds=0.05),
+        WorkflowStep("render", "visualizer", depends_on=["draft", "numbers"], timeout_seconds=0.05)
+    ])
+    results = asyncio.run(run_workflow(flow, run_step, enforce_timeouts=False))
+    assert {step_id: result["status"] for step_id, result in results.items()} == {
+        "plan": COMPLETED, "draft": COMPLETED, "numbers": COMPLETED, "render": TIMED_OUT
+    }
+    assert max(results["draft"]["duration_seconds"], results["numbers"]["duration_seconds"]) > 0.05